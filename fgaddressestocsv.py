@@ -24,12 +24,20 @@ from __future__ import division
 from __future__ import print_function
 
 from os import path
-import io
 import sys
 import re
 import csv
 import os
 
+from fgtokenizer import tokenize_lines
+import fgtree
+import fgstore
+import fgcommon
+import fgcache
+import fgstats
+import fgoutput
+import fgselect
+
 # OptionParser imports
 from optparse import OptionParser
 from optparse import OptionGroup
@@ -38,14 +46,19 @@ from optparse import OptionGroup
 parser = OptionParser(usage="%prog [options]")
 
 main_grp = OptionGroup(parser, 'Main parameters')
-main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file. Ex: fgfw.cfg')
-main_grp.add_option('-o', '--output-file', help='Output csv file (default ./addresses-out.csv)', default=path.abspath(path.join(os.getcwd(), './addresses-out.csv')))
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file, possibly gzip, xz or bzip2 compressed, "-" reading the standard input. Ex: fgfw.cfg')
+main_grp.add_option('-o', '--output-file', help='Output csv file, compressed when ending with .gz, .xz or .bz2 (default ./addresses-out.csv)', default=path.abspath(path.join(os.getcwd(), './addresses-out.csv')))
 main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
 main_grp.add_option('-n', '--newline', help='Insert a newline between each group for better readability', action='store_true', default=False)
 main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
 main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
 main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
 parser.option_groups.extend([main_grp])
+fgcommon.add_stream_options(parser)
+fgoutput.add_output_options(parser)
+fgselect.add_select_options(parser)
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
 
 # Python 2 and 3 compatibility
 if (sys.version_info < (3, 0)):
@@ -56,99 +69,137 @@ else:
     fd_write_options = 'w'
 
 # Handful patterns
-# -- Entering address definition block
-p_entering_address_block = re.compile(r'^\s*config firewall address$', re.IGNORECASE)
-
-# -- Exiting address definition block
-p_exiting_address_block = re.compile(r'^end$', re.IGNORECASE)
+# -- Entering address definition block, matched against the name of a "config" line
+p_entering_address_block = re.compile(r'^firewall address6?$', re.IGNORECASE)
+p_entering_block = p_entering_address_block
+# -- IPv6 address definition block
+p_address6_block = re.compile(r'^firewall address6$', re.IGNORECASE)
 
-# -- Commiting the current address definition and going to the next one
-p_address_next = re.compile(r'^next$', re.IGNORECASE)
+# Key identifying an entry, from its "edit" line
+ID_KEY = u'name'
 
-# -- Policy number
-p_address_name = re.compile(r'^\s*edit\s+"(?P<address_name>.*)"$', re.IGNORECASE)
+# Column telling the IPv6 addresses apart, IPv4 and IPv6 objects possibly sharing a name ("all", "none", ...)
+FAMILY_KEY = u'family'
+IPV4 = u'ipv4'
+IPV6 = u'ipv6'
 
-# -- Policy setting
-p_address_set = re.compile(r'^\s*set\s+(?P<address_key>\S+)\s+(?P<address_value>.*)$', re.IGNORECASE)
+# Columns holding integers, typed by the other output formats than csv
+INTEGER_KEYS = []
 
 # Functions
-def parse(options):
+def iter_entry_records(entries, order_keys, selection=None):
     """
-        Parse the data according to several regexes
+        View the entries of the configuration tree as address records
         
-        @param options:  options
-        @rtype: return a list of addresses ( [ {'id' : '1', 'srcintf' : 'internal', ...}, {'id' : '2', 'srcintf' : 'external', ...}, ... ] )  
-                and the list of unique seen keys ['id', 'srcintf', 'dstintf', ...]
+        @param entries:  iterable of (vdom, section name, fgtree.Entry) tuples, see fgtree.iter_entries()
+        @param order_keys:  list of seen keys, extended in place with the new keys found ['id', 'srcintf', 'dstintf', ...]
+        @param selection:  optional fgselect.Selection, yielding the entries it accepts
+        @rtype: yield every address ( {'id' : '1', 'srcintf' : 'internal', ...} )
     """
-    global p_entering_address_block, p_exiting_address_block, p_address_next, p_address_name, p_address_set
-    
-    in_address_block = False
+    return fgcommon.iter_entry_records(tag_family(entries, selection), order_keys, ID_KEY, selection)
+
+
+def tag_family(entries, selection=None):
+    """
+        Add the FAMILY_KEY column to the entries of the "config firewall address6" sections, the IPv4 ones being left as is
+        
+        @param entries:  iterable of (vdom, section name, fgtree.Entry) tuples, see fgtree.iter_entries()
+        @param selection:  optional fgselect.Selection, the column being only added when it is stored
+        @rtype: yield the same tuples
+    """
+    keep_family = selection is None or selection.stored is None or FAMILY_KEY in selection.stored
     
-    address_list = []
-    address_elem = {}
+    for vdom, section, entry in entries:
+        if keep_family and p_address6_block.search(section):
+            entry.settings[FAMILY_KEY] = IPV6
+        yield (vdom, section, entry)
+
+
+def iter_records(tokens, order_keys, selection=None):
+    """
+        Parse the data according to the tokenized lines
+        
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @param order_keys:  list of seen keys, extended in place with the new keys found ['id', 'srcintf', 'dstintf', ...]
+        @param selection:  optional fgselect.Selection, only storing its columns and yielding the entries it accepts
+        @rtype: yield every address as soon as it is complete ( {'id' : '1', 'srcintf' : 'internal', ...} )
+    """
+    global p_entering_address_block
     
-    order_keys = []
+    stored = selection.stored if selection is not None else None
+    entries = fgtree.iter_entries(tokens, [p_entering_address_block], stored)
     
-    with io.open(options.input_file, mode=fd_read_options, encoding=options.input_encoding) as fd_input:
-        for line in fd_input:
-            line = line.strip()
-            
-            # We match a address block
-            if p_entering_address_block.search(line):
-                in_address_block = True
-            
-            # We are in a address block
-            if in_address_block:
-                if p_address_name.search(line):
-                    address_name = p_address_name.search(line).group('address_name')
-                    address_elem['name'] = address_name
-                    if not('name' in order_keys):
-                        order_keys.append('name')
-                
-                # We match a setting
-                if p_address_set.search(line):
-                    address_key = p_address_set.search(line).group('address_key')
-                    if not(address_key in order_keys):
-                        order_keys.append(address_key)
-                    
-                    address_value = p_address_set.search(line).group('address_value').strip()
-                    address_value = re.sub('["]', '', address_value)
-                    
-                    address_elem[address_key] = address_value
-                
-                # We are done with the current address id
-                if p_address_next.search(line):
-                    address_list.append(address_elem)
-                    address_elem = {}
-            
-            # We are exiting the address block
-            if p_exiting_address_block.search(line):
-                in_address_block = False
+    return iter_entry_records(entries, order_keys, selection)
+
+
+def parse_tokens(tokens, selection=None):
+    """
+        Parse the data according to the tokenized lines
+        
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @param selection:  optional fgselect.Selection, see iter_records()
+        @rtype: return a fgstore.RecordStore of addresses ( [ {'id' : '1', 'srcintf' : 'internal', ...}, {'id' : '2', 'srcintf' : 'external', ...}, ... ] )  
+                and the list of unique seen keys ['id', 'srcintf', 'dstintf', ...]
+    """
+    # the selected columns come first, in their given order
+    order_keys = list(selection.columns) if (selection is not None and selection.columns is not None) else []
+    address_list = fgstore.RecordStore(fgstats.counted(iter_records(tokens, order_keys, selection)))
     
     return (address_list, order_keys)
 
 
+def parse_lines(lines, selection=None):
+    """
+        Parse an iterable of configuration lines (file object, list, ...)
+        
+        @param lines:  iterable of configuration lines
+        @param selection:  optional fgselect.Selection, see iter_records()
+        @rtype: see parse_tokens()
+    """
+    return parse_tokens(tokenize_lines(lines), selection)
+
+
+def parse(options):
+    """
+        Parse the input file
+        
+        @param options:  options
+        @rtype: see parse_lines()
+    """
+    return parse_lines(fgcommon.iter_input_lines(options, [p_entering_block]), fgselect.selection(options))
+
+
+def format_row(address, keys):
+    """
+        Return the csv row of a address, following the order of keys
+    """
+    output_line = []
+    
+    for key in keys:
+        if key in address:
+            output_line.append(address[key])
+        else:
+            output_line.append('')
+    
+    return output_line
+
+
 def generate_csv(results, keys, options):
     """
-        Generate a plain csv file
+        Generate a plain csv file, or a file of the --format output format
     """
-    if results and keys:
-        with io.open(options.output_file, mode=fd_write_options, encoding=options.output_encoding) as fd_output:
+    if results and keys and fgoutput.output_format(options) != fgoutput.CSV:
+        fgoutput.write_records(results, keys, options, u'addresses', INTEGER_KEYS)
+    
+    elif results and keys:
+        with fgcommon.open_output(options.output_file, options) as fd_output:
             spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
             
             if not(options.skip_header):
                 spamwriter.writerow(keys)
             
-            for address in results:
-                output_line = []
-                
-                for key in keys:
-                    if key in address.keys():
-                        output_line.append(address[key])
-                    else:
-                        output_line.append('')
-            
-                spamwriter.writerow(output_line)
+            for row in fgstore.iter_rows(results, keys, format_row):
+                spamwriter.writerow(row)
                 if options.newline:
                     spamwriter.writerow('')
         
@@ -170,8 +221,26 @@ def main():
     if (sys.version_info < (3, 0)):
         options.output_encoding = None
     
-    results, keys = parse(options)
-    generate_csv(results, keys, options)
+    try:
+        fgoutput.check_options(options, parser.defaults['output_file'])
+        fgselect.check_options(options)
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if options.split_vdoms:
+        with fgstats.phase('stream'):
+            fgcommon.write_vdoms(sys.modules[__name__], options)
+    elif options.stream:
+        with fgstats.phase('stream'):
+            fgcommon.stream_csv(sys.modules[__name__], options)
+    else:
+        results, keys = fgcommon.parse_input(sys.modules[__name__], options)
+        with fgstats.phase('write'):
+            generate_csv(results, keys, options)
+    
+    fgcache.print_stats(options)
+    fgstats.finish(options)
     
     return None
 
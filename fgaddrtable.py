@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Packed numeric table of the address objects
+
+    Every ipmask, iprange, wildcard (address) and ipprefix, iprange (address6) object is parsed once
+    into the sorted integer ranges it covers, packed in arrays of 32-bit words: one word per bound
+    for IPv4, four for IPv6. Containment, overlap and union checks between objects are then integer
+    comparisons instead of parsing their settings again for every query.
+    FQDN, geography and dynamic objects have no numeric range: they are kept apart as opaque names.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from array import array
+import re
+
+from fgaddressestocsv import FAMILY_KEY, IPV4, IPV6
+import fgresolve
+import fginterval
+
+# Number of bits of an address
+FAMILY_BITS = {IPV4: 32, IPV6: 128}
+
+# Highest number of ranges a wildcard address is split into, a wider one being left opaque
+MAX_WILDCARD_RANGES = 1024
+
+# Handful patterns
+# -- Group of an IPv6 address
+p_ip6_group = re.compile(r'^[0-9a-fA-F]{1,4}$')
+
+# Functions
+def ip6_to_int(ip):
+    """
+        Return the integer value of an IPv6 address, possibly compressed with "::" or ending with a dotted IPv4 address, or None
+    """
+    halves = ip.split('::')
+    if len(halves) > 2:
+        return None
+
+    parsed = []
+    for half_position, half in enumerate(halves):
+        groups = half.split(':') if half else []
+        values = []
+        for position, group in enumerate(groups):
+            # an embedded IPv4 address can only come last
+            if '.' in group and half_position == len(halves) - 1 and position == len(groups) - 1:
+                value = fgresolve.ip_to_int(group)
+                if value is None:
+                    return None
+                values.extend([value >> 16, value & 0xffff])
+
+            elif p_ip6_group.match(group):
+                values.append(int(group, 16))
+
+            else:
+                return None
+        parsed.append(values)
+
+    if len(parsed) == 1:
+        values = parsed[0]
+        if len(values) != 8:
+            return None
+    else:
+        missing = 8 - len(parsed[0]) - len(parsed[1])
+        if missing < 1:
+            return None
+        values = parsed[0] + [0] * missing + parsed[1]
+
+    result = 0
+    for value in values:
+        result = (result << 16) | value
+
+    return result
+
+
+def prefix_range(network, prefix, bits):
+    """
+        Return the (first, last) integer range of a network and its prefix length, or None
+    """
+    if network is None or not(0 <= prefix <= bits):
+        return None
+
+    hostmask = (1 << (bits - prefix)) - 1
+    first = network & ~hostmask
+
+    return (first, first | hostmask)
+
+
+def wildcard_ranges(ip, mask, bits=32):
+    """
+        Return the sorted integer ranges matched by an address and a wildcard mask, whose 0 bits may
+        take any value, or None when they are more than MAX_WILDCARD_RANGES
+
+        The 0 bits below the lowest 1 bit make a contiguous range, every other 0 bit doubles the number of ranges.
+    """
+    full = (1 << bits) - 1
+    free = ~mask & full
+
+    low = 0
+    while low < bits and (free >> low) & 1:
+        low += 1
+
+    positions = [position for position in range(low, bits) if (free >> position) & 1]
+    if (1 << len(positions)) > MAX_WILDCARD_RANGES:
+        return None
+
+    base = ip & mask & full
+    size = (1 << low) - 1
+    ranges = []
+    # counting over the free bits keeps the ranges sorted
+    for counter in range(1 << len(positions)):
+        first = base
+        for bit, position in enumerate(positions):
+            if (counter >> bit) & 1:
+                first |= 1 << position
+        ranges.append((first, first | size))
+
+    return ranges
+
+
+def address_family(address):
+    """
+        Return the family of an address entry, IPV4 or IPV6
+    """
+    return address.get(FAMILY_KEY, IPV4)
+
+
+def address_ranges(address):
+    """
+        Return the integer ranges covered by an address or address6 object
+
+        @param address:  address entry, see fgaddressestocsv.parse()
+        @rtype: return the list of (first, last) ranges, or None for the objects without numeric range (FQDN, geography, ...)
+    """
+    if address_family(address) == IPV6:
+        address_type = address.get('type', 'ipprefix')
+
+        if address_type == 'ipprefix':
+            ip6 = address.get('ip6', '::/0').split('/')
+            prefix = ip6[1] if len(ip6) == 2 else '128'
+            if not(prefix.isdigit()):
+                return None
+            interval = prefix_range(ip6_to_int(ip6[0]), int(prefix), 128)
+            return [interval] if interval else None
+
+        if address_type == 'iprange':
+            first = ip6_to_int(address.get('start-ip', ''))
+            last = ip6_to_int(address.get('end-ip', ''))
+            if first is None or last is None:
+                return None
+            return [(min(first, last), max(first, last))]
+
+        return None
+
+    if address.get('type', 'ipmask') == 'wildcard':
+        wildcard = address.get('wildcard', '').split()
+        if len(wildcard) != 2:
+            return None
+        ip = fgresolve.ip_to_int(wildcard[0])
+        mask = fgresolve.ip_to_int(wildcard[1])
+        if ip is None or mask is None:
+            return None
+        return wildcard_ranges(ip, mask)
+
+    interval = fgresolve.address_interval(address)
+
+    return [interval] if interval else None
+
+
+class AddressTable(object):
+    """
+        Integer ranges of the address objects of one family, packed in arrays of 32-bit words
+
+        The ranges of the object i are the rows offsets[i] to offsets[i + 1], sorted and merged,
+        a bound taking words consecutive items of the firsts and lasts arrays, most significant first.
+    """
+
+    def __init__(self, addresses=(), family=IPV4):
+        """
+            @param addresses:  iterable of address entries, see fgaddressestocsv.parse(), the entries of the other family being skipped
+            @param family:  IPV4 or IPV6
+        """
+        self.family = family
+        self.words = FAMILY_BITS[family] // 32
+        self.shifts = list(range(32 * (self.words - 1), -1, -32))
+
+        # object position -> name, name -> object position
+        self.names = []
+        self.positions = {}
+
+        self.firsts = array('I')
+        self.lasts = array('I')
+        self.offsets = array('L', [0])
+
+        # names of the objects without numeric range
+        self.opaque = set()
+
+        # lazily built stabbing index, see covering()
+        self.index = None
+
+        for address in addresses:
+            self.add(address)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def add(self, address):
+        """
+            Add an address entry of the family of the table, the names being unique within a VDOM
+        """
+        if address_family(address) != self.family:
+            return None
+
+        name = address.get('name')
+        ranges = address_ranges(address)
+        if ranges is None:
+            self.opaque.add(name)
+            return None
+
+        self.opaque.discard(name)
+        self.positions[name] = len(self.names)
+        self.names.append(name)
+        for first, last in fginterval.merge_intervals(ranges):
+            self.firsts.extend(self.pack(first))
+            self.lasts.extend(self.pack(last))
+        self.offsets.append(len(self.firsts) // self.words)
+        self.index = None
+
+        return None
+
+    def pack(self, value):
+        """
+            Return the 32-bit words of an integer bound, most significant first
+        """
+        return [(value >> shift) & 0xffffffff for shift in self.shifts]
+
+    def unpack(self, words, row):
+        """
+            Return the integer bound of a row from the firsts or lasts array
+        """
+        if self.words == 1:
+            return words[row]
+
+        value = 0
+        for word in words[row * self.words:(row + 1) * self.words]:
+            value = (value << 32) | word
+
+        return value
+
+    def ranges(self, name):
+        """
+            Return the sorted and merged (first, last) ranges of an object, or None for an unknown or opaque object
+        """
+        position = self.positions.get(name)
+        if position is None:
+            return None
+
+        return [(self.unpack(self.firsts, row), self.unpack(self.lasts, row)) for row in range(self.offsets[position], self.offsets[position + 1])]
+
+    def iter_ranges(self):
+        """
+            Yield the (first, last, name) ranges of every object
+        """
+        for position, name in enumerate(self.names):
+            for row in range(self.offsets[position], self.offsets[position + 1]):
+                yield (self.unpack(self.firsts, row), self.unpack(self.lasts, row), name)
+
+    def union(self, names):
+        """
+            Return the merged ranges covered by several objects, and the names of the opaque or unknown ones
+        """
+        intervals = []
+        others = []
+        for name in names:
+            ranges = self.ranges(name)
+            if ranges is None:
+                others.append(name)
+            else:
+                intervals.extend(ranges)
+
+        return (fginterval.merge_intervals(intervals), others)
+
+    def contains(self, outer, inner):
+        """
+            Check if the object outer covers every address of the object inner, an opaque object only covering itself
+        """
+        if outer == inner:
+            return True
+
+        outer_ranges = self.ranges(outer)
+        inner_ranges = self.ranges(inner)
+        if outer_ranges is None or inner_ranges is None:
+            return False
+
+        return fginterval.covers(outer_ranges, inner_ranges)
+
+    def overlaps(self, name, other):
+        """
+            Check if two objects share at least one address, an opaque object only overlapping itself
+        """
+        if name == other:
+            return True
+
+        ranges = self.ranges(name)
+        other_ranges = self.ranges(other)
+        if ranges is None or other_ranges is None:
+            return False
+
+        # both lists being sorted, walk them together
+        position = 0
+        other_position = 0
+        while position < len(ranges) and other_position < len(other_ranges):
+            first, last = ranges[position]
+            other_first, other_last = other_ranges[other_position]
+            if first <= other_last and other_first <= last:
+                return True
+            if last < other_last:
+                position += 1
+            else:
+                other_position += 1
+
+        return False
+
+    def covering(self, point):
+        """
+            Return the tuple of the names of the objects covering an integer address, in name order
+        """
+        if self.index is None:
+            self.index = fginterval.IntervalIndex(self.iter_ranges())
+
+        return self.index.lookup(point)
+
+
+def build_tables(addresses):
+    """
+        Split address entries into one AddressTable per family
+
+        @rtype: return a dict of IPV4 and IPV6 -> AddressTable
+    """
+    tables = dict((family, AddressTable(family=family)) for family in FAMILY_BITS)
+    for address in addresses:
+        tables[address_family(address)].add(address)
+
+    return tables
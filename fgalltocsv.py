@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import sys
+import os
+import copy
+import itertools
+import csv
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+import fgpoliciestocsv
+import fgaddressestocsv
+import fggroupstocsv
+import fgservicestocsv
+
+from fgtokenizer import tokenize_lines
+import fgtree
+import fgstore
+import fgcommon
+import fgcache
+import fgstats
+import fgoutput
+
+# Extractors, in the order their outputs are written
+EXTRACTORS = OrderedDict([
+    ('policies', fgpoliciestocsv),
+    ('addresses', fgaddressestocsv),
+    ('groups', fggroupstocsv),
+    ('services', fgservicestocsv),
+])
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file, possibly gzip, xz or bzip2 compressed, "-" reading the standard input. Ex: fgfw.cfg')
+main_grp.add_option('-o', '--output-dir', help='Output directory for the <extractor>-out.csv files (default ./)', default=os.getcwd())
+main_grp.add_option('-x', '--extract', help='Comma separated list of extractors to run among "%s" (default all)' % ','.join(EXTRACTORS.keys()), default=','.join(EXTRACTORS.keys()))
+main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
+main_grp.add_option('-n', '--newline', help='Insert a newline between each entry for better readability', action='store_true', default=False)
+main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+main_grp.add_option('--stream', help='Write every entry as soon as it is parsed instead of loading all of them in memory first, the columns being discovered by a first pass over the input file', action='store_true', default=False)
+parser.option_groups.extend([main_grp])
+fgoutput.add_output_options(parser)
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
+
+# Functions
+def iter_extractor_entries(tokens, extractors):
+    """
+        Route the entries of the configuration tree to the extractor handling their section
+
+        @param tokens:  iterator over the configuration tokens
+        @param extractors:  dict of extractor name -> extractor module
+        @rtype: yield (extractor name, entries) tuples for every run of entries of the same extractor, the entries being
+                (vdom, section name, fgtree.Entry) tuples which must be consumed before going to the next run
+    """
+    # section name -> extractor name
+    routes = {}
+
+    def route(entry):
+        section = entry[1]
+        if not(section in routes):
+            for name, extractor in extractors.items():
+                if extractor.p_entering_block.search(section):
+                    routes[section] = name
+                    break
+        return routes[section]
+
+    patterns = [extractor.p_entering_block for extractor in extractors.values()]
+    for name, entries in itertools.groupby(fgtree.iter_entries(tokens, patterns), route):
+        yield (name, entries)
+
+
+def parse_lines(lines, extractors):
+    """
+        Read the configuration once and route every block to the extractor handling it
+
+        @param lines:  iterable of configuration lines
+        @param extractors:  dict of extractor name -> extractor module
+        @rtype: return a dict of extractor name -> (results, order_keys)
+    """
+    outputs = OrderedDict((name, (fgstore.RecordStore(), [])) for name in extractors)
+
+    for name, entries in iter_extractor_entries(tokenize_lines(lines), extractors):
+        results, order_keys = outputs[name]
+        results.extend(fgstats.counted(extractors[name].iter_entry_records(entries, order_keys)))
+
+    return outputs
+
+
+def parse(options, extractors):
+    """
+        Parse the input file in a single pass, the results found in the parse cache being skipped
+
+        @param options:  options
+        @rtype: see parse_lines()
+    """
+    outputs = OrderedDict()
+    cache_keys = {}
+    missing = OrderedDict()
+
+    for name, extractor in extractors.items():
+        outputs[name] = None
+        if fgcache.is_enabled(options):
+            with fgstats.phase('cache'):
+                cache_keys[name] = fgcache.cache_key(fgcommon.module_name(extractor), options)
+                outputs[name] = fgcache.load(options, cache_keys[name])
+
+        if outputs[name] is None:
+            missing[name] = extractor
+
+    if missing:
+        patterns = [extractor.p_entering_block for extractor in missing.values()]
+        with fgstats.phase('parse'):
+            parsed = parse_lines(fgcommon.iter_input_lines(options, patterns), missing)
+
+        for name, value in parsed.items():
+            outputs[name] = value
+            if name in cache_keys:
+                with fgstats.phase('cache'):
+                    fgcache.store(options, cache_keys[name], value)
+
+    return outputs
+
+
+def select_extractors(names):
+    """
+        Return the extractors matching a comma separated list of names
+    """
+    selected = OrderedDict()
+    for name in names.split(','):
+        name = name.strip().lower()
+        if name:
+            if not(name in EXTRACTORS):
+                raise ValueError('Unknown extractor "%s", choose among "%s"' % (name, ','.join(EXTRACTORS.keys())))
+            selected[name] = EXTRACTORS[name]
+
+    return selected
+
+
+def generate_csv(outputs, extractors, options):
+    """
+        Generate a plain csv file per extractor
+    """
+    if not(path.isdir(options.output_dir)):
+        os.makedirs(options.output_dir)
+
+    for name, (results, keys) in outputs.items():
+        extractor_options = copy.copy(options)
+        extractor_options.output_file = output_file(options, name)
+        extractors[name].generate_csv(results, keys, extractor_options)
+
+    return None
+
+def output_file(options, name):
+    """
+        Return the output file of an extractor, with the extension of the output format
+    """
+    return path.abspath(path.join(options.output_dir, '%s-out%s' % (name, fgoutput.extension(options))))
+
+
+def stream_csv(options, extractors):
+    """
+        Write every entry as soon as it is parsed, after a first pass discovering the columns of every extractor
+    """
+    patterns = [extractor.p_entering_block for extractor in extractors.values()]
+
+    outputs = OrderedDict((name, ([], [])) for name in extractors)
+    with fgstats.phase('discover'):
+        for name, entries in iter_extractor_entries(tokenize_lines(fgcommon.iter_input_lines(options, patterns)), extractors):
+            for record in extractors[name].iter_entry_records(entries, outputs[name][1]):
+                pass
+
+    if not(path.isdir(options.output_dir)):
+        os.makedirs(options.output_dir)
+
+    fd_outputs = {}
+    spamwriters = {}
+    writers = {}
+    try:
+        for name, entries in iter_extractor_entries(tokenize_lines(fgcommon.iter_input_lines(options, patterns)), extractors):
+            extractor = extractors[name]
+            keys = outputs[name][1]
+
+            # -- other output formats
+            if fgoutput.output_format(options) != fgoutput.CSV:
+                if not(name in writers):
+                    writers[name] = fgoutput.open_writer(output_file(options, name), keys, options, name, extractor.INTEGER_KEYS)
+                for record in fgstats.counted(extractor.iter_entry_records(entries, [])):
+                    writers[name].write(record)
+                continue
+
+            if not(name in spamwriters):
+                fd_outputs[name] = fgcommon.open_output(output_file(options, name), options)
+                spamwriters[name] = csv.writer(fd_outputs[name], delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
+                if not(options.skip_header):
+                    spamwriters[name].writerow(keys)
+
+            for record in fgstats.counted(extractor.iter_entry_records(entries, [])):
+                spamwriters[name].writerow(extractor.format_row(record, keys))
+                if options.newline:
+                    spamwriters[name].writerow('')
+    except Exception:
+        for writer in writers.values():
+            writer.abort()
+        raise
+    else:
+        for writer in writers.values():
+            writer.close()
+    finally:
+        for fd_output in fd_outputs.values():
+            fd_output.close()
+
+    return None
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    if (options.input_file == None):
+        parser.error('Please specify a valid input file')
+
+    try:
+        extractors = select_extractors(options.extract)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    try:
+        fgoutput.check_options(options)
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if options.stream:
+        with fgstats.phase('stream'):
+            stream_csv(options, extractors)
+    else:
+        outputs = parse(options, extractors)
+        with fgstats.phase('write'):
+            generate_csv(outputs, extractors, options)
+
+    fgcache.print_stats(options)
+    fgstats.finish(options)
+
+    return None
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import io
+import sys
+import os
+import copy
+import csv
+import json
+import glob
+import shutil
+import tempfile
+import time
+import multiprocessing
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+import fgalltocsv
+import fgcache
+import fgcommon
+import fgcompress
+import fgstats
+import fgoutput
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-i', '--input', help='Directory of Fortigate configuration files, or glob pattern. Ex: "backups/*.conf". Can be repeated', action='append', default=[])
+main_grp.add_option('-o', '--output-dir', help='Output directory (default ./)', default=os.getcwd())
+main_grp.add_option('-x', '--extract', help='Comma separated list of extractors to run among "%s" (default all)' % ','.join(fgalltocsv.EXTRACTORS.keys()), default=','.join(fgalltocsv.EXTRACTORS.keys()))
+main_grp.add_option('-c', '--combine', help='Write one <extractor>-out.csv file for the whole fleet with a leading "device" column, instead of one <device>-<extractor>-out.csv file per device', action='store_true', default=False)
+main_grp.add_option('-j', '--jobs', help='Number of worker processes (default: number of cores)', type='int', default=multiprocessing.cpu_count())
+main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
+main_grp.add_option('-n', '--newline', help='Insert a newline between each entry for better readability', action='store_true', default=False)
+main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+parser.option_groups.extend([main_grp])
+fgoutput.add_output_options(parser)
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
+
+# Encoding and delimiter of the per-device parts merged in combine mode
+PART_ENCODING = 'utf-8'
+PART_DELIMITER = ';'
+
+# Functions
+def list_input_files(inputs):
+    """
+        Expand the directories and glob patterns into a sorted list of files, without duplicates
+    """
+    input_files = []
+    for item in inputs:
+        if path.isdir(item):
+            candidates = [path.join(item, name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item)
+
+        input_files.extend(candidate for candidate in candidates if path.isfile(candidate))
+
+    return sorted(set(input_files))
+
+
+def device_names(input_files):
+    """
+        Return the device name of every file: its base name without extension, made unique
+    """
+    names = []
+    seen = {}
+    for input_file in input_files:
+        name = path.splitext(fgcompress.strip_extension(path.basename(input_file)))[0]
+        if name in seen:
+            seen[name] += 1
+            name = '%s-%d' % (name, seen[name])
+        else:
+            seen[name] = 1
+        names.append(name)
+
+    return names
+
+
+def process_file(job):
+    """
+        Worker: parse one configuration file and write its outputs
+
+        @param job:  (input_file, output file pattern with a "%s" for the extractor name, extractor names, options)
+        @rtype: return (input_file, size in bytes, {extractor name: order_keys}, error message or None,
+                        statistics of the file or None, see fgstats.Collector.as_dict())
+    """
+    input_file, output_pattern, names, options = job
+
+    # a worker process handles several files: fresh statistics for each of them
+    if options.stats or options.stats_file:
+        fgstats.collector = fgstats.Collector()
+
+    try:
+        extractors = fgalltocsv.select_extractors(names)
+
+        file_options = copy.copy(options)
+        file_options.input_file = input_file
+
+        outputs = fgalltocsv.parse(file_options, extractors)
+
+        keys = OrderedDict()
+        with fgstats.phase('write'):
+            for name, (results, order_keys) in outputs.items():
+                file_options.output_file = output_pattern % name
+                extractors[name].generate_csv(results, order_keys, file_options)
+                keys[name] = order_keys
+
+        return (input_file, path.getsize(input_file), keys, None, fgstats.collector.as_dict() if fgstats.collector else None)
+
+    except Exception as e:
+        return (input_file, 0, {}, '%s: %s' % (e.__class__.__name__, e), None)
+
+    finally:
+        fgstats.collector = None
+
+
+def combine_csv(name, parts, keys, options):
+    """
+        Merge the per-device parts of an extractor into a single csv file with a leading "device" column
+
+        @param name:  extractor name
+        @param parts:  list of (device, part file) in output order
+        @param keys:  union of the columns of every part
+    """
+    with fgcommon.open_output(path.join(options.output_dir, '%s-out.csv' % name), options) as fd_output:
+        spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+        if not(options.skip_header):
+            spamwriter.writerow(['device'] + keys)
+
+        for device, part in parts:
+            if not(path.isfile(part)):
+                continue
+
+            with io.open(part, mode='r', encoding=PART_ENCODING, newline='') as fd_part:
+                spamreader = csv.reader(fd_part, delimiter=PART_DELIMITER)
+                part_keys = next(spamreader, [])
+                positions = [part_keys.index(key) if key in part_keys else None for key in keys]
+
+                for row in spamreader:
+                    spamwriter.writerow([device] + [row[position] if position is not None else '' for position in positions])
+                    if options.newline:
+                        spamwriter.writerow('')
+
+    return None
+
+
+def combine_records(name, parts, keys, options):
+    """
+        Merge the per-device JSON Lines parts of an extractor into a single file of the output format with a leading "device" column
+
+        @param name:  extractor name, also the SQLite table name
+        @param parts:  list of (device, part file) in output order
+        @param keys:  union of the columns of every part
+    """
+    writer = fgoutput.open_writer(path.join(options.output_dir, '%s-out%s' % (name, fgoutput.extension(options))), ['device'] + keys, options, name, fgalltocsv.EXTRACTORS[name].INTEGER_KEYS)
+    try:
+        for device, part in parts:
+            if not(path.isfile(part)):
+                continue
+
+            with io.open(part, mode='r', encoding=fgoutput.JSONL_ENCODING) as fd_part:
+                for line in fd_part:
+                    record = json.loads(line)
+                    record['device'] = device
+                    writer.write(record)
+    except Exception:
+        writer.abort()
+        raise
+
+    writer.close()
+
+    return None
+
+
+def remove_parts(output_pattern, names):
+    """
+        Remove the parts a worker may have written for an extractor before failing
+    """
+    for name in names:
+        part = output_pattern % name
+        if path.isfile(part):
+            os.remove(part)
+
+    return None
+
+
+def run(input_files, extractors, options):
+    """
+        Process the files with a pool of worker processes
+
+        @rtype: return (number of processed files, number of bytes, list of (input_file, error message))
+    """
+    names = ','.join(extractors.keys())
+    devices = device_names(input_files)
+
+    if not(path.isdir(options.output_dir)):
+        os.makedirs(options.output_dir)
+
+    if options.combine:
+        parts_dir = tempfile.mkdtemp(prefix='fgbatch-', dir=options.output_dir)
+        part_options = copy.copy(options)
+        part_options.skip_header = False
+        part_options.newline = False
+        part_options.delimiter = PART_DELIMITER
+        if (sys.version_info >= (3, 0)):
+            part_options.output_encoding = PART_ENCODING
+        # the parts of the other output formats are JSON Lines, keeping the missing settings apart from the empty ones
+        if fgoutput.output_format(options) != fgoutput.CSV:
+            part_options.output_format = fgoutput.JSONL
+        jobs = [(input_file, path.join(parts_dir, '%d-%%s%s' % (position, fgoutput.extension(part_options))), names, part_options) for position, input_file in enumerate(input_files)]
+    else:
+        parts_dir = None
+        jobs = [(input_file, path.join(options.output_dir, '%s-%%s-out%s' % (device.replace('%', '%%'), fgoutput.extension(options))), names, options) for input_file, device in zip(input_files, devices)]
+
+    processed = 0
+    total_size = 0
+    errors = []
+    all_keys = OrderedDict((name, []) for name in extractors)
+    device_of = dict(zip(input_files, devices))
+    job_of = dict((job[0], job) for job in jobs)
+    completed = set()
+
+    try:
+        pool = multiprocessing.Pool(processes=max(1, options.jobs))
+        try:
+            # imap keeps the input order, needed to merge the columns as a sequential run would
+            for input_file, size, keys, error, stats in pool.imap(process_file, jobs, chunksize=1):
+                if stats and fgstats.collector:
+                    fgstats.collector.merge(stats, device_of[input_file])
+
+                if error:
+                    errors.append((input_file, error))
+                    # a device failing halfway must not land in the combined files
+                    if options.combine:
+                        remove_parts(job_of[input_file][1], extractors)
+                    continue
+
+                completed.add(input_file)
+                processed += 1
+                total_size += size
+                for name, order_keys in keys.items():
+                    all_keys[name].extend(key for key in order_keys if not(key in all_keys[name]))
+        finally:
+            pool.close()
+            pool.join()
+
+        if options.combine:
+            for name in extractors:
+                if all_keys[name]:
+                    parts = [(device, job[1] % name) for device, job in zip(devices, jobs) if job[0] in completed]
+                    if fgoutput.output_format(options) == fgoutput.CSV:
+                        combine_csv(name, parts, all_keys[name], options)
+                    else:
+                        combine_records(name, parts, all_keys[name], options)
+    finally:
+        if parts_dir:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+    return (processed, total_size, errors)
+
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    input_files = list_input_files(options.input + arguments)
+    if not(input_files):
+        parser.error('Please specify a valid input directory or glob pattern')
+
+    try:
+        extractors = fgalltocsv.select_extractors(options.extract)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    # the files are parsed by the worker processes: only their statistics are gathered
+    if options.profile:
+        parser.error('Profiling is not available with fgbatch.py, profile a single file with fgalltocsv.py')
+
+    try:
+        fgoutput.check_options(options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    fgstats.start(options)
+
+    start = time.time()
+    processed, total_size, errors = run(input_files, extractors, options)
+    elapsed = max(time.time() - start, 1e-6)
+
+    for input_file, error in errors:
+        print('[!] %s: %s' % (input_file, error), file=sys.stderr)
+
+    print('[+] %d/%d files, %.1f MB in %.2fs: %.1f files/s, %.1f MB/s with %d worker(s)' % (processed, len(input_files), total_size / (1024.0 * 1024.0), elapsed, processed / elapsed, total_size / (1024.0 * 1024.0) / elapsed, options.jobs), file=sys.stderr)
+    fgstats.finish(options)
+
+    return None
+
+if __name__ == "__main__" :
+    main()
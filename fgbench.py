@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import io
+import sys
+import os
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import multiprocessing
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+import fgalltocsv
+import fgstats
+import fgcompress
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-i', '--input-file', help='Configuration file to benchmark, instead of a generated one')
+main_grp.add_option('-o', '--output-file', help='Output JSON results file (default ./bench-results.json)', default=path.abspath(path.join(os.getcwd(), './bench-results.json')))
+main_grp.add_option('-x', '--extract', help='Comma separated list of extractors to run among "%s" (default all)' % ','.join(fgalltocsv.EXTRACTORS.keys()), default=','.join(fgalltocsv.EXTRACTORS.keys()))
+main_grp.add_option('-r', '--repeat', help='Number of runs of every extractor, the fastest one being kept (default 3)', type='int', default=3)
+main_grp.add_option('-l', '--label', help='Label of the run saved in the results, e.g. a version or a branch name', default='')
+main_grp.add_option('-c', '--compare', help='Previous JSON results file to compare the run with')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+
+generator_grp = OptionGroup(parser, 'Generator parameters')
+generator_grp.add_option('-g', '--generate', help='Only write a generated configuration file to this path, without benchmarking it')
+generator_grp.add_option('-p', '--policies', help='Number of policies (default 10000)', type='int', default=10000)
+generator_grp.add_option('-a', '--addresses', help='Number of addresses (default: half the number of policies)', type='int')
+generator_grp.add_option('-G', '--groups', help='Number of address groups, nested up to 3 levels (default: a tenth of the number of addresses)', type='int')
+generator_grp.add_option('-S', '--services', help='Number of custom services, a tenth of them being grouped (default 500)', type='int', default=500)
+generator_grp.add_option('-v', '--vdoms', help='Number of VDOMs, the objects and policies being spread over them (default 1: no VDOM)', type='int', default=1)
+generator_grp.add_option('-N', '--noise', help='Number of non-firewall sections (default: a tenth of the number of policies)', type='int')
+generator_grp.add_option('--seed', help='Random seed of the generator (default 1)', type='int', default=1)
+parser.option_groups.extend([main_grp, generator_grp])
+
+# Results file format version
+RESULTS_VERSION = 1
+
+# Proportion of ssl-vpn policies, carrying a nested "config identity-based-policy" block
+SSL_VPN_RATIO = 0.02
+
+INTERFACES = ['port1', 'port2', 'port3', 'internal', 'dmz', 'wan1', 'wan2']
+ACTIONS = ['accept', 'accept', 'accept', 'deny']
+
+# Functions
+def quoted(names):
+    """
+        Return the quoted, space separated names of a multi-valued setting
+    """
+    return ' '.join('"%s"' % name for name in names)
+
+
+def uuid(rng):
+    """
+        Return a random uuid, as written by FortiOS
+    """
+    value = '%032x' % rng.getrandbits(128)
+    return '%s-%s-%s-%s-%s' % (value[:8], value[8:12], value[12:16], value[16:20], value[20:])
+
+
+def spread(count, parts):
+    """
+        Return the sizes of count items spread over parts
+    """
+    return [count // parts + (1 if part < count % parts else 0) for part in range(parts)]
+
+
+def write_noise(fd, rng, count):
+    """
+        Write count non-firewall sections, some of them holding nested blocks
+    """
+    for position in range(count):
+        kind = position % 3
+        if kind == 0:
+            fd.write(u'config system interface\n')
+            for interface in INTERFACES:
+                fd.write(u'    edit "%s"\n        set vdom "root"\n        set ip 192.168.%d.1 255.255.255.0\n        set allowaccess ping https ssh\n' % (interface, rng.randrange(256)))
+                fd.write(u'        config ipv6\n            set ip6-mode static\n        end\n    next\n')
+            fd.write(u'end\n')
+        elif kind == 1:
+            fd.write(u'config router static\n    edit %d\n        set gateway 172.16.%d.254\n        set device "wan1"\n    next\nend\n' % (position + 1, rng.randrange(256)))
+        else:
+            fd.write(u'config log setting\n    set resolve-ip enable\n    set log-invalid-packet enable\nend\n')
+
+    return None
+
+
+def write_addresses(fd, rng, offset, count):
+    """
+        Write a "config firewall address" block of ipmask, iprange and fqdn addresses
+
+        @rtype: return the list of the address names
+    """
+    names = []
+    fd.write(u'config firewall address\n')
+    for number in range(offset, offset + count):
+        name = 'addr-%d' % number
+        names.append(name)
+        fd.write(u'    edit "%s"\n        set uuid %s\n' % (name, uuid(rng)))
+
+        kind = rng.random()
+        if kind < 0.8:
+            fd.write(u'        set subnet 10.%d.%d.%d 255.255.255.%d\n' % ((number >> 16) & 255, (number >> 8) & 255, number & 255 & 0xf0, rng.choice([255, 255, 240])))
+        elif kind < 0.9:
+            fd.write(u'        set type iprange\n        set start-ip 172.%d.%d.1\n        set end-ip 172.%d.%d.200\n' % (16 + (number & 15), (number >> 4) & 255, 16 + (number & 15), (number >> 4) & 255))
+        else:
+            fd.write(u'        set type fqdn\n        set fqdn "host%d.example.com"\n' % number)
+
+        if rng.random() < 0.2:
+            fd.write(u'        set comment "Generated \'%s\'"\n' % name)
+        fd.write(u'    next\n')
+    fd.write(u'end\n')
+
+    return names
+
+
+def write_groups(fd, rng, offset, count, addresses):
+    """
+        Write a "config firewall addrgrp" block, a third of the groups nesting earlier groups
+
+        @rtype: return the list of the group names
+    """
+    names = []
+    fd.write(u'config firewall addrgrp\n')
+    for number in range(offset, offset + count):
+        name = 'grp-%d' % number
+        members = rng.sample(addresses, min(len(addresses), rng.randint(1, 6)))
+        if names and rng.random() < 0.33:
+            members.append(rng.choice(names[-50:]))
+        names.append(name)
+        fd.write(u'    edit "%s"\n        set uuid %s\n        set member %s\n    next\n' % (name, uuid(rng), quoted(members)))
+    fd.write(u'end\n')
+
+    return names
+
+
+def write_services(fd, rng, count):
+    """
+        Write the "config firewall service custom" and "config firewall service group" blocks
+
+        @rtype: return the list of the service and service group names
+    """
+    names = ['ALL', 'HTTP', 'HTTPS', 'PING']
+    fd.write(u'config firewall service custom\n')
+    fd.write(u'    edit "ALL"\n        set category "General"\n        set protocol IP\n    next\n')
+    fd.write(u'    edit "HTTP"\n        set category "Web Access"\n        set tcp-portrange 80\n    next\n')
+    fd.write(u'    edit "HTTPS"\n        set category "Web Access"\n        set tcp-portrange 443\n    next\n')
+    fd.write(u'    edit "PING"\n        set protocol ICMP\n        set icmptype 8\n    next\n')
+    for number in range(count):
+        name = 'svc-%d' % number
+        names.append(name)
+        port = 1024 + number
+        if number % 4 == 3:
+            fd.write(u'    edit "%s"\n        set udp-portrange %d\n    next\n' % (name, port))
+        else:
+            fd.write(u'    edit "%s"\n        set tcp-portrange %d-%d:1024-65535\n    next\n' % (name, port, port + rng.randrange(10)))
+    fd.write(u'end\n')
+
+    fd.write(u'config firewall service group\n')
+    for number in range(count // 10):
+        name = 'svc-grp-%d' % number
+        fd.write(u'    edit "%s"\n        set member %s\n    next\n' % (name, quoted(rng.sample(names, min(len(names), 3)))))
+        names.append(name)
+    fd.write(u'end\n')
+
+    return names
+
+
+def write_policies(fd, rng, offset, count, objects, services):
+    """
+        Write a "config firewall policy" block, with a few ssl-vpn policies and their nested block
+    """
+    fd.write(u'config firewall policy\n')
+    for number in range(offset + 1, offset + count + 1):
+        srcintf, dstintf = rng.sample(INTERFACES, 2)
+        ssl_vpn = rng.random() < SSL_VPN_RATIO
+        if ssl_vpn:
+            srcintf = 'ssl.root'
+
+        fd.write(u'    edit %d\n' % number)
+        fd.write(u'        set name "policy %d"\n' % number)
+        fd.write(u'        set uuid %s\n' % uuid(rng))
+        fd.write(u'        set srcintf "%s"\n        set dstintf "%s"\n' % (srcintf, dstintf))
+        fd.write(u'        set srcaddr %s\n' % quoted(rng.sample(objects, min(len(objects), rng.randint(1, 3)))))
+        fd.write(u'        set dstaddr %s\n' % (quoted(['all']) if rng.random() < 0.3 else quoted(rng.sample(objects, min(len(objects), rng.randint(1, 3))))))
+
+        if ssl_vpn:
+            fd.write(u'        set action ssl-vpn\n')
+            fd.write(u'        config identity-based-policy\n            edit 1\n                set schedule "always"\n                set groups "vpn-users"\n                set service "ALL"\n            next\n        end\n')
+        else:
+            fd.write(u'        set action %s\n' % rng.choice(ACTIONS))
+
+        fd.write(u'        set schedule "always"\n')
+        fd.write(u'        set service %s\n' % quoted(rng.sample(services, min(len(services), rng.randint(1, 3)))))
+        if rng.random() < 0.5:
+            fd.write(u'        set logtraffic all\n')
+        if rng.random() < 0.3:
+            fd.write(u'        set nat enable\n')
+        if rng.random() < 0.05:
+            fd.write(u'        set status disable\n')
+        if rng.random() < 0.1:
+            fd.write(u'        set comments "Ticket #%d"\n' % rng.randrange(100000))
+        fd.write(u'    next\n')
+    fd.write(u'end\n')
+
+    return None
+
+
+def generate_config(output_file, policies, addresses, groups, services, vdoms=1, noise=0, seed=1):
+    """
+        Write a synthetic FortiGate configuration file, always the same for the same parameters
+
+        @param vdoms:  number of VDOMs, 1 writing a configuration without VDOM
+    """
+    rng = random.Random(seed)
+
+    with io.open(output_file, mode='w', encoding='utf-8', newline='\n') as fd:
+        fd.write(u'#config-version=FGT60F-7.0.12-FW-build0523-230501:opmode=0:vdom=%d:user=admin\n' % (1 if vdoms > 1 else 0))
+
+        vdom_names = ['root'] + ['vdom%d' % number for number in range(1, vdoms)]
+        if vdoms > 1:
+            fd.write(u'config vdom\n')
+            for vdom in vdom_names:
+                fd.write(u'edit %s\nnext\n' % vdom)
+            fd.write(u'end\n')
+            fd.write(u'config global\n')
+        fd.write(u'config system global\n    set hostname "FGT-BENCH"\n    set timezone 28\nend\n')
+        write_noise(fd, rng, noise)
+        if vdoms > 1:
+            fd.write(u'end\nconfig vdom\n')
+
+        service_names = None
+        for vdom, vdom_policies, vdom_addresses, vdom_groups, offset in zip(vdom_names, spread(policies, vdoms), spread(addresses, vdoms), spread(groups, vdoms), range(vdoms)):
+            if vdoms > 1:
+                fd.write(u'edit %s\n' % vdom)
+
+            address_names = write_addresses(fd, rng, offset * addresses, vdom_addresses)
+            group_names = write_groups(fd, rng, offset * groups, vdom_groups, address_names or ['all'])
+            service_names = write_services(fd, rng, services)
+            write_noise(fd, rng, noise // (10 * vdoms))
+            write_policies(fd, rng, sum(spread(policies, vdoms)[:offset]), vdom_policies, (address_names + group_names) or ['all'], service_names)
+
+            if vdoms > 1:
+                fd.write(u'next\n')
+
+        if vdoms > 1:
+            fd.write(u'end\n')
+
+    return None
+
+
+def count_lines(input_file):
+    """
+        Return the number of lines of a file, once decompressed
+    """
+    count = 0
+    with fgcompress.open_binary(input_file) as fd_input:
+        for data in iter(lambda: fd_input.read(1024 * 1024), b''):
+            count += data.count(b'\n')
+
+    return count
+
+
+def run_extractor(job):
+    """
+        Worker: parse a file with an extractor then write its csv output, in a process of its own to get its peak memory
+
+        @param job:  (extractor name, input file, input encoding, output directory)
+        @rtype: return a dict of the records count, the parse and write times and the peak memory
+    """
+    name, input_file, input_encoding, output_dir = job
+    extractor = fgalltocsv.EXTRACTORS[name]
+
+    options = extractor.parser.get_default_values()
+    options.input_file = input_file
+    options.input_encoding = input_encoding
+    options.output_file = path.join(output_dir, '%s-out.csv' % name)
+    options.no_cache = True
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    start = time.time()
+    results, keys = extractor.parse(options)
+    parsed = time.time()
+    extractor.generate_csv(results, keys, options)
+    written = time.time()
+
+    return {'records': len(results), 'parse_s': parsed - start, 'write_s': written - parsed, 'peak_rss_mb': fgstats.peak_rss()}
+
+
+def benchmark(input_file, names, options):
+    """
+        Run every extractor options.repeat times on input_file, keeping the fastest run
+
+        @rtype: return an ordered dict of extractor name -> results
+    """
+    size = path.getsize(input_file)
+    lines = count_lines(input_file)
+    output_dir = tempfile.mkdtemp(prefix='fgbench-')
+
+    results = OrderedDict()
+    try:
+        for name in names:
+            best = None
+            for run in range(max(1, options.repeat)):
+                # a fresh process per run: no warm caches, and a peak memory of this run only
+                pool = multiprocessing.Pool(processes=1)
+                try:
+                    result = pool.apply(run_extractor, ((name, input_file, options.input_encoding, output_dir),))
+                finally:
+                    pool.close()
+                    pool.join()
+
+                if best is None or result['parse_s'] + result['write_s'] < best['parse_s'] + best['write_s']:
+                    best = result
+
+            total = max(best['parse_s'] + best['write_s'], 1e-6)
+            best['total_s'] = total
+            best['lines_per_s'] = lines / total
+            best['records_per_s'] = best['records'] / total
+            best['mb_per_s'] = size / (1024.0 * 1024.0) / total
+            results[name] = best
+
+            print('[+] %-9s %8d records in %6.2fs (parse %.2fs, write %.2fs): %9d lines/s, %8d records/s, %6.1f MB/s, peak RSS %s MB' % (name, best['records'], total, best['parse_s'], best['write_s'], best['lines_per_s'], best['records_per_s'], best['mb_per_s'], '%.1f' % best['peak_rss_mb'] if best['peak_rss_mb'] is not None else '?'), file=sys.stderr)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    return results
+
+
+def compare(previous, current):
+    """
+        Print the throughput change of every extractor between two results
+    """
+    print('[+] Compared with %s (%s)' % (previous.get('label') or 'previous run', previous.get('date', '?')), file=sys.stderr)
+    for name, result in current['results'].items():
+        if not(name in previous.get('results', {})):
+            continue
+
+        before = previous['results'][name]
+        print('[+] %-9s %9d -> %9d lines/s: x%.2f' % (name, before['lines_per_s'], result['lines_per_s'], result['lines_per_s'] / max(before['lines_per_s'], 1e-6)), file=sys.stderr)
+
+    return None
+
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    try:
+        extractors = fgalltocsv.select_extractors(options.extract)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if options.addresses == None:
+        options.addresses = max(1, options.policies // 2)
+    if options.groups == None:
+        options.groups = options.addresses // 10
+    if options.noise == None:
+        options.noise = options.policies // 10
+
+    generator = OrderedDict([('policies', options.policies), ('addresses', options.addresses), ('groups', options.groups), ('services', options.services), ('vdoms', max(1, options.vdoms)), ('noise', options.noise), ('seed', options.seed)])
+
+    if options.generate:
+        generate_config(options.generate, **generator)
+        print('[+] Generated %s: %d lines, %.1f MB' % (options.generate, count_lines(options.generate), path.getsize(options.generate) / (1024.0 * 1024.0)), file=sys.stderr)
+        return None
+
+    temp_dir = None
+    try:
+        if options.input_file:
+            input_file = options.input_file
+            generator = None
+        else:
+            temp_dir = tempfile.mkdtemp(prefix='fgbench-')
+            input_file = path.join(temp_dir, 'bench.cfg')
+            generate_config(input_file, **generator)
+
+        print('[+] Benchmarking %s: %d lines, %.1f MB' % (options.input_file or 'generated configuration', count_lines(input_file), path.getsize(input_file) / (1024.0 * 1024.0)), file=sys.stderr)
+
+        current = OrderedDict([
+            ('version', RESULTS_VERSION),
+            ('label', options.label),
+            ('date', time.strftime('%Y-%m-%dT%H:%M:%S')),
+            ('python', platform.python_version()),
+            ('platform', platform.platform()),
+            ('input', OrderedDict([('file', options.input_file), ('generator', generator), ('size', path.getsize(input_file)), ('lines', count_lines(input_file))])),
+            ('repeat', options.repeat),
+            ('results', benchmark(input_file, list(extractors.keys()), options)),
+        ])
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    with io.open(options.output_file, mode='w', encoding='utf-8') as fd_output:
+        fd_output.write(u'%s\n' % json.dumps(current, indent=2))
+
+    if options.compare:
+        with io.open(options.compare, mode='r', encoding='utf-8') as fd_previous:
+            compare(json.load(fd_previous), current)
+
+    return None
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    On-disk cache of the parsed results
+
+    An entry holds the (results, order_keys) returned by the parse() of an extractor,
+    keyed by a hash of the configuration file content, the extractor, the parser version
+    and the parsing options. The cache is bounded in size, the least recently used
+    entries being evicted first.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+import hashlib
+import os
+import sys
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# OptionParser imports
+from optparse import OptionGroup
+
+import fgstats
+import fgcompress
+
+# Bump it whenever a change in the parsers changes their results, to invalidate the existing entries
+PARSER_VERSION = 5
+
+CACHE_SUFFIX = '.pickle'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Hits and misses of the current run
+stats = {'hits': 0, 'misses': 0}
+
+# Content hashes of the current run, keyed by (path, size, mtime)
+content_hashes = {}
+
+# Functions
+def default_cache_dir():
+    """
+        Return the default cache directory: $XDG_CACHE_HOME/fgpoliciestocsv or ~/.cache/fgpoliciestocsv
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or path.join(path.expanduser('~'), '.cache')
+    return path.join(cache_home, 'fgpoliciestocsv')
+
+
+def add_cache_options(parser):
+    """
+        Add the cache options to an OptionParser
+    """
+    cache_grp = OptionGroup(parser, 'Cache parameters')
+    cache_grp.add_option('--no-cache', help='Do not read nor write the parse cache', action='store_true', default=False)
+    cache_grp.add_option('--rebuild-cache', help='Parse the input file again and replace its cache entry', action='store_true', default=False)
+    cache_grp.add_option('--cache-dir', help='Parse cache directory (default "%s")' % default_cache_dir(), default=default_cache_dir())
+    cache_grp.add_option('--cache-size', help='Maximum size of the parse cache in MB, least recently used entries are evicted first (default 512)', type='int', default=512)
+    parser.option_groups.extend([cache_grp])
+
+    return cache_grp
+
+
+def is_enabled(options):
+    """
+        Check if the cache can be used for this run, the options of a script without a single input file disabling it
+    """
+    input_file = getattr(options, 'input_file', None)
+    if input_file is None:
+        return False
+
+    return not(getattr(options, 'no_cache', True)) and (input_file == fgcompress.STDIN or path.isfile(input_file))
+
+
+def content_hash(input_file):
+    """
+        Return the SHA-256 of the file content as stored (compressed or not), computed once per run
+    """
+    global content_hashes
+
+    if input_file == fgcompress.STDIN:
+        hash_key = input_file
+    else:
+        stat = os.stat(input_file)
+        hash_key = (path.abspath(input_file), stat.st_size, stat.st_mtime)
+
+    if not(hash_key in content_hashes):
+        digest = hashlib.sha256()
+        with fgcompress.open_raw(input_file) as fd_input:
+            for data in iter(lambda: fd_input.read(HASH_BLOCK_SIZE), b''):
+                digest.update(data)
+        content_hashes[hash_key] = digest.hexdigest()
+
+    return content_hashes[hash_key]
+
+
+def cache_key(extractor_name, options, extra=()):
+    """
+        Return the cache key of the parse of options.input_file by an extractor
+
+        @param extractor_name:  extractor name
+        @param extra:  any other option changing the parsed results
+    """
+    parts = [content_hash(options.input_file), 'v%d' % PARSER_VERSION, extractor_name, options.input_encoding] + [repr(item) for item in extra]
+    return hashlib.sha256(u'\x00'.join(parts).encode('utf-8')).hexdigest()
+
+
+def entry_path(options, key):
+    """
+        Return the file of a cache entry
+    """
+    return path.join(options.cache_dir, key + CACHE_SUFFIX)
+
+
+def load(options, key):
+    """
+        Return the cached (results, order_keys) or None, counting the hit or the miss
+    """
+    global stats
+
+    entry = entry_path(options, key)
+
+    if not(options.rebuild_cache) and path.isfile(entry):
+        try:
+            with open(entry, 'rb') as fd_entry:
+                value = pickle.load(fd_entry)
+
+            # refresh the entry for the LRU eviction
+            os.utime(entry, None)
+            stats['hits'] += 1
+            return value
+
+        except Exception:
+            pass
+
+    stats['misses'] += 1
+    return None
+
+
+def store(options, key, value):
+    """
+        Write a cache entry atomically then evict the least recently used entries above the size limit
+    """
+    if not(path.isdir(options.cache_dir)):
+        os.makedirs(options.cache_dir)
+
+    fd_temp, temp_file = tempfile.mkstemp(dir=options.cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd_temp, 'wb') as fd_entry:
+            pickle.dump(value, fd_entry, pickle.HIGHEST_PROTOCOL)
+        if hasattr(os, 'replace'):
+            os.replace(temp_file, entry_path(options, key))
+        else:
+            # Python 2 on Windows does not rename over an existing file
+            if path.exists(entry_path(options, key)) and sys.platform.startswith('win'):
+                os.remove(entry_path(options, key))
+            os.rename(temp_file, entry_path(options, key))
+    except Exception:
+        if path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+    evict(options)
+
+    return None
+
+
+def evict(options):
+    """
+        Remove the least recently used entries until the cache fits in options.cache_size MB
+    """
+    max_size = options.cache_size * 1024 * 1024
+
+    entries = []
+    for name in os.listdir(options.cache_dir):
+        if name.endswith(CACHE_SUFFIX):
+            entry = path.join(options.cache_dir, name)
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total_size = sum(size for mtime, size, entry in entries)
+    for mtime, size, entry in sorted(entries):
+        if total_size <= max_size:
+            break
+
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+        total_size -= size
+
+    return None
+
+
+def cached_parse(extractor_name, parse_function, options, extra=()):
+    """
+        Return the cached result of parse_function(options), parsing and caching it on a miss
+
+        @param extractor_name:  extractor name, part of the cache key
+        @param parse_function:  function returning (results, order_keys)
+        @param extra:  any other option changing the parsed results
+    """
+    if not(is_enabled(options)):
+        return parse_function(options)
+
+    with fgstats.phase('cache'):
+        key = cache_key(extractor_name, options, extra)
+        value = load(options, key)
+
+    if value is None:
+        value = parse_function(options)
+        try:
+            with fgstats.phase('cache'):
+                store(options, key, value)
+        except (OSError, IOError) as e:
+            print('[!] Unable to write the parse cache: %s' % e, file=sys.stderr)
+
+    return value
+
+
+def print_stats(options):
+    """
+        Print the cache hits and misses of the run on stderr, when the cache is enabled and --stats requested
+    """
+    global stats
+
+    if is_enabled(options) and getattr(options, 'stats', False) and (stats['hits'] or stats['misses']):
+        print('[+] Parse cache: %d hit(s), %d miss(es)' % (stats['hits'], stats['misses']), file=sys.stderr)
+
+    return None
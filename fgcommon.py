@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Helpers shared by the fg*tocsv extractors
+
+    An extractor is one of the fg*tocsv modules, exposing:
+        - p_entering_block:  pattern matching the name of the "config" blocks it handles
+        - iter_entry_records(entries, order_keys, selection=None):  view of the entries of the configuration tree
+          as records, see fgtree and iter_entry_records()
+        - iter_records(tokens, order_keys, selection=None):  generator of the parsed entries, see fgselect
+        - format_row(record, keys):  csv row of an entry
+        - INTEGER_KEYS:  columns holding integers, typed by the output formats other than csv, see fgoutput
+        - generate_csv(results, keys, options):  csv writer
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+import re
+import sys
+import copy
+import mmap
+import itertools
+import importlib
+import multiprocessing
+
+# OptionParser imports
+from optparse import OptionGroup
+
+from fgtokenizer import tokenize_lines, VDOM_KEY
+import fgindex
+import fgcompress
+import fgcache
+import fgstats
+import fgselect
+import fgstore
+
+# Python 2 and 3 compatibility
+if (sys.version_info < (3, 0)):
+    fd_read_options = 'r'
+    fd_write_options = 'wb'
+else:
+    fd_read_options = 'r'
+    fd_write_options = 'w'
+
+# Smallest block worth splitting between worker processes
+MIN_CHUNK_SIZE = 256 * 1024
+
+# Handful patterns
+# -- Characters replaced in a VDOM name to make it part of a file name
+p_unsafe_file_name = re.compile(r'[^\w.-]+', re.UNICODE)
+
+# Functions
+def add_stream_options(parser):
+    """
+        Add the streaming mode options to an OptionParser
+    """
+    stream_grp = OptionGroup(parser, 'Streaming parameters')
+    stream_grp.add_option('--stream', help='Write every entry as soon as it is parsed instead of loading all of them in memory first', action='store_true', default=False)
+    stream_grp.add_option('--schema', help='Comma separated list of the columns to write in streaming mode. Ex: id,srcintf,dstintf,action. Without it, a first pass over the input file discovers the columns')
+    stream_grp.add_option('--split-vdoms', help='Write one <output>-<vdom> file per VDOM, each of them as soon as the entries of its VDOM are parsed', action='store_true', default=False)
+    parser.option_groups.extend([stream_grp])
+
+    return stream_grp
+
+
+def module_name(extractor):
+    """
+        Return the module name of an extractor, even when it runs as __main__
+    """
+    return path.splitext(path.basename(extractor.__file__))[0]
+
+
+def split_list(value):
+    """
+        Split a comma separated option value, dropping the empty items
+    """
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def open_input(options):
+    """
+        Open the input file for reading, decompressing it, "-" being the standard input
+    """
+    return fgcompress.open_text(options.input_file, options.input_encoding)
+
+
+def iter_input_lines(options, patterns):
+    """
+        Yield the lines of the input file relevant to the given block patterns
+
+        When the file can be indexed, only the "config firewall <x>" blocks matching one of the patterns
+        are decoded, the index being shared by all the extractors of the same run, and the block of
+        a VDOM is wrapped into "config vdom" / "edit <vdom>" ... "end" lines for the parsers to know it.
+        Otherwise every line of the file is yielded.
+
+        @param options:  options
+        @param patterns:  list of patterns matched against the "config" block names, see p_entering_block
+    """
+    if fgindex.is_indexable(options.input_file, options.input_encoding):
+        blocks = fgindex.select_blocks(fgindex.load_index(options.input_file), patterns)
+
+        # one block at a time, to account for each of them
+        for block in blocks:
+            for line in vdom_header(block.vdom):
+                yield line
+
+            with fgstats.block(block.vdom, block.name, block.end - block.start):
+                for line in fgstats.timed_lines(fgindex.iter_block_lines(options.input_file, [block], options.input_encoding)):
+                    yield line
+
+            for line in vdom_footer(block.vdom):
+                yield line
+
+    else:
+        with open_input(options) as fd_input:
+            for line in fgstats.timed_lines(fd_input):
+                yield line
+
+
+def vdom_header(vdom):
+    """
+        Return the lines opening the section of a VDOM, none outside of a VDOM
+    """
+    if vdom is None:
+        return []
+
+    return [u'config vdom\n', u'edit "%s"\n' % vdom]
+
+
+def vdom_footer(vdom):
+    """
+        Return the lines closing the section of a VDOM, none outside of a VDOM
+    """
+    if vdom is None:
+        return []
+
+    return [u'end\n']
+
+
+def iter_entry_records(entries, order_keys, id_key, selection=None, numeric_id=False):
+    """
+        View the entries of the configuration tree as records: the settings of an entry, with its name as
+        identifier and its VDOM
+
+        The record is the settings dict of the entry itself, entries holding the nested sub-configurations apart.
+
+        @param entries:  iterable of (vdom, section name, fgtree.Entry) tuples, see fgtree.iter_entries()
+        @param order_keys:  list of seen keys, extended in place with the new keys found ['id', 'srcintf', 'dstintf', ...]
+        @param id_key:  key of the entry name. Ex: 'id'
+        @param selection:  optional fgselect.Selection, its settings being already dropped by fgtree.iter_entries(),
+                           yielding the entries it accepts
+        @param numeric_id:  only keep the entry names made of digits as identifier
+        @rtype: yield every record ( {'id' : '1', 'srcintf' : 'internal', ...} )
+    """
+    seen_keys = set(order_keys)
+
+    stored = None
+    if selection is not None:
+        stored = selection.stored
+        # the settings only stored for the conditions are not columns
+        seen_keys.update(selection.hidden)
+
+    keep_vdom = stored is None or VDOM_KEY in stored
+    keep_id = stored is None or id_key in stored
+
+    for vdom, section, entry in entries:
+        record = entry.settings
+
+        if vdom is not None and keep_vdom:
+            if not(VDOM_KEY in seen_keys):
+                seen_keys.add(VDOM_KEY)
+                order_keys.append(VDOM_KEY)
+
+        has_id = keep_id and not(numeric_id and not(entry.name.isdigit()))
+        if has_id and not(id_key in seen_keys):
+            seen_keys.add(id_key)
+            order_keys.append(id_key)
+
+        # the keys of the settings, in their order of appearance
+        if not(seen_keys.issuperset(record)):
+            for key in record:
+                if not(key in seen_keys):
+                    seen_keys.add(key)
+                    order_keys.append(key)
+
+        # a setting of the same name wins over the entry name and the VDOM
+        if vdom is not None and keep_vdom and not(VDOM_KEY in record):
+            record[VDOM_KEY] = vdom
+        if has_id and not(id_key in record):
+            record[id_key] = entry.name
+
+        if selection is None or selection.accepts(record):
+            yield record
+
+
+def open_output(output_file, options):
+    """
+        Open an output file for writing, compressed according to its extension (.gz, .xz, .bz2)
+    """
+    return fgcompress.open_output(output_file, fd_write_options, options.output_encoding)
+
+
+def discover_keys(extractor, options):
+    """
+        First pass over the input file only collecting the keys, the entries are dropped as soon as they are parsed
+
+        @rtype: return the list of unique seen keys ['id', 'srcintf', 'dstintf', ...]
+    """
+    order_keys = []
+
+    lines = iter_input_lines(options, [extractor.p_entering_block])
+    for record in extractor.iter_records(tokenize_lines(lines), order_keys, fgselect.selection(options)):
+        pass
+
+    return order_keys
+
+
+def stream_keys(extractor, options, transform_keys=None):
+    """
+        Return the columns written in streaming mode: the --schema ones, the --columns ones or the discovered ones
+    """
+    selection = fgselect.selection(options)
+
+    if options.schema:
+        return split_list(options.schema)
+
+    if selection is not None and selection.columns is not None:
+        keys = list(selection.columns)
+    else:
+        with fgstats.phase('discover'):
+            keys = discover_keys(extractor, options)
+
+    if transform_keys:
+        keys = transform_keys(keys)
+
+    return keys
+
+
+def count_exploded(extractor, options, explode):
+    """
+        Pass over the input file reporting the number of rows of the explode mode, before writing them
+    """
+    lines = iter_input_lines(options, [extractor.p_entering_block])
+
+    with fgstats.phase('count'):
+        return explode.report(extractor.iter_records(tokenize_lines(lines), [], fgselect.selection(options)))
+
+
+def chain_transforms(transforms):
+    """
+        Chain the transforms of the records, each one adding its columns after the previous ones
+
+        @param transforms:  list of (transform, transform_keys) function pairs, see stream_csv()
+        @rtype: return the (transform, transform_keys) applying all of them, (None, None) without any
+    """
+    if not(transforms):
+        return (None, None)
+
+    if len(transforms) == 1:
+        return transforms[0]
+
+    def transform(record):
+        for record_transform, record_transform_keys in transforms:
+            record = record_transform(record)
+        return record
+
+    def transform_keys(keys):
+        for record_transform, record_transform_keys in transforms:
+            keys = record_transform_keys(keys)
+        return keys
+
+    return (transform, transform_keys)
+
+
+def stream_csv(extractor, options, transform=None, transform_keys=None, explode=None):
+    """
+        Parse the input file and write every entry as soon as its "next" is seen, keeping the memory usage flat
+
+        @param transform:  optional function applied to every entry before writing it
+        @param transform_keys:  optional function applied to the discovered keys, adding the columns of transform
+        @param explode:  optional fgexplode.Exploder, writing one row per combination of the values of its settings
+    """
+    selection = fgselect.selection(options)
+    keys = stream_keys(extractor, options, transform_keys)
+
+    if explode:
+        count_exploded(extractor, options, explode)
+
+    lines = iter_input_lines(options, [extractor.p_entering_block])
+    records = fgstats.counted(extractor.iter_records(tokenize_lines(lines), [], selection))
+    if transform:
+        records = (transform(record) for record in records)
+    if explode:
+        records = explode.explode_all(records)
+
+    extractor.generate_csv(records, keys, options)
+
+    return None
+
+
+def vdom_output_file(output_file, vdom, occurrence=0):
+    """
+        Return the output file of a VDOM partition, "policies-out.csv.gz" giving "policies-out-root.csv.gz"
+
+        @param occurrence:  number of previous partitions of the same VDOM, when its blocks are not contiguous
+    """
+    if vdom is None:
+        return output_file
+
+    name = p_unsafe_file_name.sub(u'_', vdom)
+    if occurrence:
+        name = u'%s-%d' % (name, occurrence + 1)
+
+    base = fgcompress.strip_extension(output_file)
+    base, extension = path.splitext(base)
+
+    return u'%s-%s%s%s' % (base, name, extension, output_file[len(base) + len(extension):])
+
+
+def write_vdoms(extractor, options, transform=None, transform_keys=None, explode=None):
+    """
+        Parse the input file and write one output file per VDOM, a VDOM being written as soon as its
+        last entry is parsed, so that only the entries of one VDOM are held in memory at once
+
+        In streaming mode, the entries are even written as soon as they are parsed.
+
+        @param transform:  optional function applied to every entry before writing it
+        @param transform_keys:  optional function applied to the columns, adding the columns of transform
+        @param explode:  optional fgexplode.Exploder, writing one row per combination of the values of its settings,
+                         the rows being counted before writing the first VDOM in streaming mode, else per VDOM
+        @rtype: return the list of the written (VDOM, output file)
+    """
+    selection = fgselect.selection(options)
+
+    keys = None
+    if options.stream:
+        keys = stream_keys(extractor, options, transform_keys)
+        if explode:
+            count_exploded(extractor, options, explode)
+
+    # the selected columns come first, in their given order
+    order_keys = list(selection.columns) if (selection is not None and selection.columns is not None) else []
+
+    lines = iter_input_lines(options, [extractor.p_entering_block])
+    records = fgstats.counted(extractor.iter_records(tokenize_lines(lines), order_keys, selection))
+
+    partitions = []
+    occurrences = {}
+    for vdom, vdom_records in itertools.groupby(records, lambda record: record.get(VDOM_KEY)):
+        if transform:
+            vdom_records = (transform(record) for record in vdom_records)
+
+        vdom_keys = keys
+        if vdom_keys is None:
+            vdom_records = fgstore.RecordStore(vdom_records)
+            if selection is not None and selection.columns is not None:
+                vdom_keys = list(order_keys)
+            else:
+                # the columns seen in this VDOM, in the order of their first appearance in the file
+                seen_keys = set(vdom_records.keys)
+                vdom_keys = [key for key in order_keys if key in seen_keys]
+            if transform_keys:
+                vdom_keys = transform_keys(vdom_keys)
+            if explode:
+                explode.report(vdom_records, vdom)
+
+        if explode:
+            vdom_records = explode.explode_all(vdom_records)
+
+        vdom_options = copy.copy(options)
+        vdom_options.output_file = vdom_output_file(options.output_file, vdom, occurrences.get(vdom, 0))
+        occurrences[vdom] = occurrences.get(vdom, 0) + 1
+
+        extractor.generate_csv(vdom_records, vdom_keys, vdom_options)
+        partitions.append((vdom, vdom_options.output_file))
+
+    return partitions
+
+
+def parse_chunk(job):
+    """
+        Worker: parse a byte range of a block made of complete entries
+
+        @param job:  (extractor module name, input file, encoding, start, end, block header line or None, add a closing "end",
+                      VDOM of the block, fgselect.Selection or None)
+        @rtype: see parse_lines() of the extractor
+    """
+    name, input_file, encoding, start, end, header, footer, vdom, selection = job
+
+    extractor = importlib.import_module(name)
+
+    with open(input_file, 'rb') as fd_input:
+        buf = mmap.mmap(fd_input.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            lines = fgindex.split_lines(buf[start:end].decode(encoding))
+        finally:
+            buf.close()
+
+    # a chunk cut in the middle of a block is wrapped back into its "config" ... "end" lines
+    if header:
+        lines.insert(0, header)
+    if footer:
+        lines.append(u'end\n')
+
+    lines = vdom_header(vdom) + lines + vdom_footer(vdom)
+
+    return extractor.parse_lines(lines, selection)
+
+
+def parse_parallel(extractor, options):
+    """
+        Parse the blocks of an extractor with options.jobs worker processes
+
+        Every block is split at "edit" boundaries into chunks, parsed by the workers and merged back
+        in the original order, giving the same entries and order_keys as a sequential parse.
+        Falls back to the sequential parse when the input file cannot be indexed.
+
+        @rtype: see parse_lines() of the extractor
+    """
+    jobs = getattr(options, 'jobs', 1) or 1
+    if jobs <= 1 or not(fgindex.is_indexable(options.input_file, options.input_encoding)):
+        return extractor.parse(options)
+
+    blocks = fgindex.select_blocks(fgindex.load_index(options.input_file), [extractor.p_entering_block])
+
+    chunks = []
+    with open(options.input_file, 'rb') as fd_input:
+        buf = mmap.mmap(fd_input.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for block in blocks:
+                parts = min(jobs * 4, max(1, (block.end - block.start) // MIN_CHUNK_SIZE))
+                header = u'config %s\n' % block.name
+                for start, end in fgindex.split_block(buf, block, parts):
+                    chunks.append((module_name(extractor), options.input_file, options.input_encoding, start, end, header if start != block.start else None, end != block.end, block.vdom, fgselect.selection(options)))
+        finally:
+            buf.close()
+
+    results = fgstore.RecordStore()
+    order_keys = []
+    seen_keys = set()
+
+    pool = multiprocessing.Pool(processes=jobs)
+    try:
+        # imap keeps the chunks order
+        for chunk_results, chunk_keys in pool.imap(parse_chunk, chunks):
+            results.extend(chunk_results)
+            fgstats.count('records', len(chunk_results))
+            for key in chunk_keys:
+                if not(key in seen_keys):
+                    seen_keys.add(key)
+                    order_keys.append(key)
+    finally:
+        pool.close()
+        pool.join()
+
+    return (results, order_keys)
+
+
+def parse_input(extractor, options):
+    """
+        Parse the input file of an extractor, through the parse cache and with options.jobs worker processes
+
+        @rtype: see parse_lines() of the extractor
+    """
+    selection = fgselect.selection(options)
+
+    with fgstats.phase('parse'):
+        return fgcache.cached_parse(module_name(extractor), lambda options: parse_parallel(extractor, options), options, selection.cache_extra() if selection is not None else ())
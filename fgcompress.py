@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Compressed and piped input, compressed output
+
+    The compression of an input file is detected from its magic bytes and the file is
+    decompressed while being read, without any temporary file. "-" reads the standard input:
+    it is read once and kept in memory (compressed, if it is), so that the scripts reading
+    their input several times still can. An output file is compressed according to its extension.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+import io
+import sys
+import gzip
+import bz2
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# Input file name of the standard input
+STDIN = '-'
+
+GZIP = 'gzip'
+XZ = 'xz'
+BZIP2 = 'bzip2'
+
+# Magic bytes of the supported compressions
+MAGIC_NUMBERS = [
+    (b'\x1f\x8b', GZIP),
+    (b'\xfd7zXZ\x00', XZ),
+    (b'BZh', BZIP2),
+]
+MAGIC_SIZE = 6
+
+# Output file extensions of the supported compressions
+EXTENSIONS = {
+    '.gz': GZIP,
+    '.xz': XZ,
+    '.bz2': BZIP2,
+}
+
+# Content of the standard input, once read
+stdin_data = None
+
+# Functions
+def read_stdin():
+    """
+        Return the content of the standard input, read on the first call
+    """
+    global stdin_data
+
+    if stdin_data is None:
+        stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+        stdin_data = stdin.read()
+
+    return stdin_data
+
+
+def open_raw(input_file):
+    """
+        Open an input file, or the standard input, as it is stored
+    """
+    if input_file == STDIN:
+        return io.BytesIO(read_stdin())
+
+    return open(input_file, 'rb')
+
+
+def compression(input_file):
+    """
+        Return the compression of an input file detected from its magic bytes, or None
+    """
+    with open_raw(input_file) as fd_input:
+        magic = fd_input.read(MAGIC_SIZE)
+
+    for magic_number, name in MAGIC_NUMBERS:
+        if magic.startswith(magic_number):
+            return name
+
+    return None
+
+
+def is_plain_file(input_file):
+    """
+        Check if an input file is a regular uncompressed file, which can be memory-mapped and seeked
+    """
+    return input_file != STDIN and path.isfile(input_file) and compression(input_file) is None
+
+
+def check_available(name):
+    """
+        Raise an IOError if a compression is not supported by this Python
+    """
+    if name == XZ and lzma is None:
+        raise IOError('xz compression needs the lzma module, available from Python 3.3')
+
+    return None
+
+
+def open_binary(input_file):
+    """
+        Open an input file, or the standard input, for reading its decompressed bytes
+    """
+    name = compression(input_file)
+    if name is None:
+        return open_raw(input_file)
+
+    check_available(name)
+
+    if input_file == STDIN:
+        fd_input = io.BytesIO(read_stdin())
+        if name == GZIP:
+            return gzip.GzipFile(fileobj=fd_input, mode='rb')
+        if name == XZ:
+            return lzma.LZMAFile(fd_input, mode='rb')
+        return bz2.BZ2File(fd_input, mode='rb')
+
+    if name == GZIP:
+        return gzip.GzipFile(input_file, mode='rb')
+    if name == XZ:
+        return lzma.LZMAFile(input_file, mode='rb')
+    return bz2.BZ2File(input_file, mode='rb')
+
+
+def open_text(input_file, encoding):
+    """
+        Open an input file, or the standard input, for reading its decompressed lines
+    """
+    if is_plain_file(input_file):
+        return io.open(input_file, mode='r', encoding=encoding)
+
+    return io.TextIOWrapper(open_binary(input_file), encoding=encoding)
+
+
+def output_compression(output_file):
+    """
+        Return the compression of an output file according to its extension, or None
+    """
+    return EXTENSIONS.get(path.splitext(output_file)[1].lower())
+
+
+def open_output(output_file, mode, encoding):
+    """
+        Open an output file for writing, compressed according to its extension
+
+        @param mode:  mode of an uncompressed file, "w" or "wb"
+        @param encoding:  text encoding, None to write bytes
+    """
+    name = output_compression(output_file)
+    if name is None:
+        return io.open(output_file, mode=mode, encoding=encoding)
+
+    check_available(name)
+
+    if name == GZIP:
+        fd_output = gzip.GzipFile(output_file, mode='wb')
+    elif name == XZ:
+        fd_output = lzma.LZMAFile(output_file, mode='wb')
+    else:
+        fd_output = bz2.BZ2File(output_file, mode='wb')
+
+    if encoding is None:
+        return fd_output
+
+    return io.TextIOWrapper(fd_output, encoding=encoding)
+
+
+def strip_extension(file_name):
+    """
+        Return a file name without its compression extension, "fw1.conf.gz" giving "fw1.conf"
+    """
+    base, extension = path.splitext(file_name)
+    if extension.lower() in EXTENSIONS:
+        return base
+
+    return file_name
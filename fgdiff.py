@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import sys
+import csv
+import os
+import copy
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+from fgtokenizer import VDOM_KEY
+import fgalltocsv
+import fgcommon
+import fgcache
+import fgstats
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-a', '--old-file', help='Old Fortigate configuration file, possibly gzip, xz or bzip2 compressed. Ex: fgfw-yesterday.cfg')
+main_grp.add_option('-b', '--new-file', help='New Fortigate configuration file, possibly gzip, xz or bzip2 compressed. Ex: fgfw-today.cfg')
+main_grp.add_option('-x', '--extract', help='Extractor to compare among "%s" (default "policies")' % ','.join(fgalltocsv.EXTRACTORS.keys()), default='policies')
+main_grp.add_option('-o', '--output-file', help='Output csv file, compressed when ending with .gz, .xz or .bz2 (default ./<extractor>-diff.csv)')
+main_grp.add_option('-I', '--ignore-keys', help='Comma separated list of keys not to compare. Ex: uuid', default='')
+main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
+main_grp.add_option('-n', '--newline', help='Insert a newline between each entry for better readability', action='store_true', default=False)
+main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+parser.option_groups.extend([main_grp])
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
+
+# Kinds of change
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+# Functions
+def index_records(results, id_key, ignore_keys):
+    """
+        Index the entries by VDOM and identifier, hashing their content
+
+        An identifier seen several times in the same VDOM is made unique by its occurrence number.
+
+        @rtype: return an ordered dict of ((VDOM, identifier), occurrence) -> (content hash, entry), in the entries order
+    """
+    index = OrderedDict()
+    occurrences = {}
+
+    for record in results:
+        identifier = (record.get(VDOM_KEY), record.get(id_key, ''))
+        occurrence = occurrences.get(identifier, 0)
+        occurrences[identifier] = occurrence + 1
+
+        if ignore_keys:
+            compared = frozenset(item for item in record.items() if not(item[0] in ignore_keys))
+        else:
+            compared = frozenset(record.items())
+
+        index[(identifier, occurrence)] = (hash(compared), record)
+
+    return index
+
+
+def changed_keys(old_record, new_record, keys, ignore_keys):
+    """
+        Return the keys whose value differs between the two entries, in the keys order
+    """
+    return [key for key in keys if not(key in ignore_keys) and old_record.get(key) != new_record.get(key)]
+
+
+def diff(old_results, new_results, keys, id_key, ignore_keys=frozenset()):
+    """
+        Compare two lists of entries, matched by identifier through hash indexes
+
+        @param keys:  union of the keys of both lists
+        @rtype: return (list of (change, changed keys, old entry, new entry): added and modified entries
+                        in the new order then removed entries in the old order, number of unchanged entries)
+    """
+    old_index = index_records(old_results, id_key, ignore_keys)
+    new_index = index_records(new_results, id_key, ignore_keys)
+
+    changes = []
+    unchanged = 0
+
+    for identifier, (new_hash, new_record) in new_index.items():
+        old_hash, old_record = old_index.get(identifier, (None, None))
+
+        if old_record is None:
+            changes.append((ADDED, [], None, new_record))
+            continue
+
+        # equal hashes still need a real comparison to rule out a collision
+        if old_hash == new_hash and old_record == new_record:
+            unchanged += 1
+            continue
+
+        keys_changed = changed_keys(old_record, new_record, keys, ignore_keys)
+        if keys_changed:
+            changes.append((MODIFIED, keys_changed, old_record, new_record))
+        else:
+            unchanged += 1
+
+    for identifier, (old_hash, old_record) in old_index.items():
+        if not(identifier in new_index):
+            changes.append((REMOVED, [], old_record, None))
+
+    return (changes, unchanged)
+
+
+def format_row(extractor, change, keys_changed, old_record, new_record, keys):
+    """
+        Return the csv row of a change: the new values, the old ones for a removed entry,
+        and "old -> new" for the changed keys of a modified entry
+    """
+    record = new_record if new_record is not None else old_record
+    output_line = [change, ' '.join(keys_changed)] + extractor.format_row(record, keys)
+
+    if change == MODIFIED:
+        old_line = extractor.format_row(old_record, keys)
+        for key in keys_changed:
+            position = keys.index(key)
+            output_line[2 + position] = u'%s -> %s' % (old_line[position], output_line[2 + position])
+
+    return output_line
+
+
+def generate_csv(changes, keys, extractor, options):
+    """
+        Generate a plain csv file of the changes, written even without any change not to leave the one of a previous run
+    """
+    with fgcommon.open_output(options.output_file, options) as fd_output:
+        spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+        if not(options.skip_header):
+            spamwriter.writerow(['change', 'changed_keys'] + keys)
+
+        for change, keys_changed, old_record, new_record in changes:
+            spamwriter.writerow(format_row(extractor, change, keys_changed, old_record, new_record, keys))
+            if options.newline:
+                spamwriter.writerow('')
+
+    return None
+
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    if (options.old_file == None) or (options.new_file == None):
+        parser.error('Please specify valid old and new input files')
+
+    try:
+        extractors = fgalltocsv.select_extractors(options.extract)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if len(extractors) != 1:
+        parser.error('Please specify a single extractor')
+
+    name, extractor = list(extractors.items())[0]
+
+    if options.output_file == None:
+        options.output_file = path.abspath(path.join(os.getcwd(), '%s-diff.csv' % name))
+
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    try:
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    ignore_keys = frozenset(fgcommon.split_list(options.ignore_keys))
+
+    parsed = []
+    for input_file in (options.old_file, options.new_file):
+        file_options = copy.copy(options)
+        file_options.input_file = input_file
+        parsed.append(fgcommon.parse_input(extractor, file_options))
+
+    (old_results, old_keys), (new_results, new_keys) = parsed
+    keys = list(new_keys) + [key for key in old_keys if not(key in new_keys)]
+
+    with fgstats.phase('diff'):
+        changes, unchanged = diff(old_results, new_results, keys, extractor.ID_KEY, ignore_keys)
+
+    with fgstats.phase('write'):
+        generate_csv(changes, keys, extractor, options)
+
+    counts = dict((change, 0) for change in (ADDED, REMOVED, MODIFIED))
+    for change in changes:
+        counts[change[0]] += 1
+
+    print('[+] %d added, %d removed, %d modified, %d unchanged' % (counts[ADDED], counts[REMOVED], counts[MODIFIED], unchanged), file=sys.stderr)
+    # the cache is used with the options of each input file
+    fgcache.print_stats(file_options)
+    fgstats.finish(options)
+
+    return None
+
+if __name__ == "__main__" :
+    main()
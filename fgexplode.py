@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Explode mode: one row per combination of the values of the multi-valued settings
+
+    A policy is written as the Cartesian product of its srcaddr, dstaddr and service values,
+    generated one row at a time with itertools.product: a policy of 200 x 200 x 50 values never
+    holds its 2 million rows in memory. The number of rows of a policy being the product of its
+    numbers of values, the total is computed before writing the first one.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import copy
+import itertools
+
+# OptionParser imports
+from optparse import OptionGroup
+
+import fgaddressestocsv
+import fggroupstocsv
+import fgservicestocsv
+import fgcommon
+import fgselect
+import fgresolve
+
+# Multi-valued policy settings exploded by default
+EXPLODE_KEYS = ['srcaddr', 'dstaddr', 'service']
+
+# Extractors of the objects referenced by the exploded settings, to split the names holding spaces
+OBJECT_EXTRACTORS = [fgaddressestocsv, fggroupstocsv, fgservicestocsv]
+
+# Functions
+def add_explode_options(parser):
+    """
+        Add the explode mode options to an OptionParser
+    """
+    explode_grp = OptionGroup(parser, 'Explode parameters')
+    explode_grp.add_option('--explode', help='Write one row per combination of the values of the multi-valued settings, the other columns being repeated. The total number of rows is printed before writing them', action='store_true', default=False)
+    explode_grp.add_option('--explode-keys', help='Comma separated list of the settings exploded by --explode (default "%s")' % ','.join(EXPLODE_KEYS), default=','.join(EXPLODE_KEYS))
+    parser.option_groups.extend([explode_grp])
+
+    return explode_grp
+
+
+class Exploder(object):
+    """
+        Split the multi-valued settings of the entries and generate the combinations of their values
+    """
+
+    def __init__(self, keys, known_names=frozenset()):
+        """
+            @param keys:  settings to explode ['srcaddr', 'dstaddr', 'service']
+            @param known_names:  set of the existing object names, see fgresolve.split_names()
+        """
+        self.keys = keys
+        self.known_names = known_names
+
+        # setting value -> tuple of its values, the same values coming back in many policies
+        self.values = {}
+
+    def split(self, value):
+        """
+            Return the tuple of the values of a setting, an empty setting giving a single empty value
+        """
+        values = self.values.get(value)
+        if values is None:
+            values = tuple(fgresolve.split_names(value, self.known_names)) or (value,)
+            self.values[value] = values
+
+        return values
+
+    def count(self, record):
+        """
+            Return the number of rows of an entry
+        """
+        rows = 1
+        for key in self.keys:
+            if key in record:
+                rows *= len(self.split(record[key]))
+
+        return rows
+
+    def count_all(self, records):
+        """
+            Return the number of entries and the total number of rows of an iterable of entries
+        """
+        entries = 0
+        rows = 0
+        for record in records:
+            entries += 1
+            rows += self.count(record)
+
+        return (entries, rows)
+
+    def report(self, records, vdom=None):
+        """
+            Count the rows of an iterable of entries and report them on stderr, before writing them
+        """
+        entries, rows = self.count_all(records)
+        print('[+] Explode%s: %d entries into %d rows' % (' of VDOM %s' % vdom if vdom is not None else '', entries, rows), file=sys.stderr)
+
+        return rows
+
+    def explode(self, record):
+        """
+            Yield a copy of an entry per combination of the values of its exploded settings
+        """
+        keys = [key for key in self.keys if key in record]
+        if not(keys):
+            yield record
+            return
+
+        for combination in itertools.product(*[self.split(record[key]) for key in keys]):
+            row = dict(record)
+            row.update(zip(keys, combination))
+            yield row
+
+    def explode_all(self, records):
+        """
+            Yield the rows of an iterable of entries, one at a time
+        """
+        for record in records:
+            for row in self.explode(record):
+                yield row
+
+
+def load_exploder(options):
+    """
+        Parse the object names of options.input_file and return the Exploder of the options
+
+        @rtype: return an Exploder
+    """
+    object_options = copy.copy(options)
+    object_options.jobs = 1
+    # only the names are needed, whatever the --columns and --where of the policies
+    object_options.selection = fgselect.Selection([u'name'], [])
+
+    known_names = set()
+    for extractor in OBJECT_EXTRACTORS:
+        objects, object_keys = fgcommon.parse_input(extractor, object_options)
+        for record in objects:
+            known_names.add(record.get(u'name'))
+
+    return Exploder(fgcommon.split_list(options.explode_keys), frozenset(known_names))
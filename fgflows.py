@@ -0,0 +1,828 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Batch evaluation of flows against the rulebase: the policy each flow hits first
+
+    The enabled policies are compiled into numeric rules: interface codes, merged integer intervals
+    of their resolved addresses, and destination port intervals per IP protocol of their resolved
+    services. The flows are read in batches of parallel integer columns and sorted by source and by
+    destination address; each rule, in rulebase order, only checks the flows falling in its most
+    selective address intervals (a binary search over the sorted flows) that no earlier rule matched.
+    With NumPy, a rule checks all its candidate flows with a few array comparisons, otherwise the
+    same evaluation runs in pure Python.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import sys
+import csv
+import os
+import copy
+import time
+import bisect
+import socket
+import struct
+import operator
+import itertools
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from fgtokenizer import VDOM_KEY
+import fgpoliciestocsv
+import fgservicestocsv
+import fgresolve
+import fgaddrtable
+import fgports
+import fginterval
+import fgcommon
+import fgcompress
+import fgcache
+import fgstats
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file, possibly gzip, xz or bzip2 compressed, "-" reading the standard input. Ex: fgfw.cfg')
+main_grp.add_option('-l', '--flow-file', help='CSV file of flows, possibly gzip, xz or bzip2 compressed, whose header holds the srcip, dstip, proto and dstport columns, and optionally srcintf, dstintf and vd. Ex: flows.csv')
+main_grp.add_option('-o', '--output-file', help='Output csv file, compressed when ending with .gz, .xz or .bz2 (default ./flows-out.csv)', default=path.abspath(path.join(os.getcwd(), './flows-out.csv')))
+main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
+main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
+main_grp.add_option('--flow-delimiter', help='CSV delimiter of the flow file (default ",")', default=',')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+main_grp.add_option('-b', '--batch-size', help='Number of flows evaluated at once (default 100000)', type='int', default=100000)
+main_grp.add_option('--no-numpy', help='Evaluate the flows in pure Python even when NumPy is available', action='store_true', default=False)
+parser.option_groups.extend([main_grp])
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
+
+# Columns of the flow file, named after the traffic log fields
+FLOW_KEYS = ['srcip', 'dstip', 'proto', 'dstport', 'srcintf', 'dstintf', 'vd']
+REQUIRED_FLOW_KEYS = ['srcip', 'dstip', 'proto']
+
+# Columns added to the flows
+RESULT_KEYS = ['policyid', 'action']
+
+# Policy id and action of the flows no policy matches, as in the traffic logs
+IMPLICIT_DENY = ('0', 'deny')
+
+# Policies matching traffic in a way not modelled here: they never match
+UNSUPPORTED_SETTINGS = {
+    'internet-service': 'enable',
+    'internet-service-src': 'enable',
+}
+
+# IP protocol numbers
+PROTOCOL_NUMBERS = {'icmp': 1, 'tcp': 6, 'udp': 17, 'icmp6': 58, 'sctp': 132}
+
+# Interface code of a flow without interface, matching every policy, and of an interface no policy references
+ANY_INTERFACE = -1
+UNKNOWN_INTERFACE = -2
+
+MAX_ADDRESS = 0xffffffff
+
+# frozenset of interface codes -> NumPy boolean table, see interface_table()
+interface_tables = {}
+
+# Classes
+class IntervalSet(object):
+    """
+        Merged integer intervals, checked by binary search over their first integers
+    """
+    __slots__ = ('firsts', 'lasts', 'array_firsts', 'array_lasts', 'full')
+
+    def __init__(self, intervals, maximum):
+        merged = fginterval.merge_intervals(intervals)
+        self.firsts = [first for first, last in merged]
+        self.lasts = [last for first, last in merged]
+        self.full = merged == [(0, maximum)]
+
+        if numpy is not None:
+            self.array_firsts = numpy.array(self.firsts, dtype=numpy.int64)
+            self.array_lasts = numpy.array(self.lasts, dtype=numpy.int64)
+
+    def contains(self, value):
+        """
+            Check if an integer falls in an interval
+        """
+        position = bisect.bisect_right(self.firsts, value) - 1
+        return position >= 0 and value <= self.lasts[position]
+
+    def contains_array(self, values):
+        """
+            Return the boolean array of the integers of a NumPy array falling in an interval
+        """
+        if self.full:
+            return numpy.ones(len(values), dtype=bool)
+
+        positions = numpy.searchsorted(self.array_firsts, values, side='right') - 1
+        found = positions >= 0
+        if len(self.lasts):
+            found &= values <= self.array_lasts[numpy.maximum(positions, 0)]
+
+        return found
+
+
+class CompiledRule(object):
+    """
+        Policy compiled into interface codes, address intervals and service port intervals
+    """
+    __slots__ = ('id', 'action', 'srcintf', 'dstintf', 'srcaddr', 'dstaddr', 'srcaddr_negate', 'dstaddr_negate', 'service', 'service_negate')
+
+    def matches(self, flows, position, skipped=None):
+        """
+            Check if the flow at position of a Flows matches the rule, the address key skipped being already known to match
+        """
+        srcintf = flows.srcintf[position]
+        if not(self.srcintf is None or srcintf == ANY_INTERFACE or srcintf in self.srcintf):
+            return False
+
+        dstintf = flows.dstintf[position]
+        if not(self.dstintf is None or dstintf == ANY_INTERFACE or dstintf in self.dstintf):
+            return False
+
+        if skipped != 'srcaddr' and self.srcaddr.contains(flows.src[position]) == self.srcaddr_negate:
+            return False
+
+        if skipped != 'dstaddr' and self.dstaddr.contains(flows.dst[position]) == self.dstaddr_negate:
+            return False
+
+        if self.service is None:
+            return not(self.service_negate)
+
+        ports = self.service.get(flows.proto[position])
+        return (ports is not None and ports.contains(flows.dport[position])) != self.service_negate
+
+    def matching_array(self, flows, candidates, skipped=None):
+        """
+            Return the NumPy array of the candidate flow positions of a Flows holding NumPy arrays matching the rule
+
+            The candidates are narrowed down check after check, the next checks being skipped once none is left.
+        """
+        checks = []
+        for intf_key, codes in (('srcintf', self.srcintf), ('dstintf', self.dstintf)):
+            if codes is not None:
+                checks.append(lambda candidates, column=getattr(flows, intf_key), table=interface_table(codes): table.take(column[candidates] - UNKNOWN_INTERFACE, mode='clip'))
+
+        if skipped != 'srcaddr':
+            checks.append(lambda candidates: self.srcaddr.contains_array(flows.src[candidates]) != self.srcaddr_negate)
+
+        if skipped != 'dstaddr':
+            checks.append(lambda candidates: self.dstaddr.contains_array(flows.dst[candidates]) != self.dstaddr_negate)
+
+        if self.service is None:
+            if self.service_negate:
+                return candidates[:0]
+        else:
+            checks.append(lambda candidates: self.service_array(flows, candidates) != self.service_negate)
+
+        for check in checks:
+            candidates = candidates[check(candidates)]
+            if not(len(candidates)):
+                break
+
+        return candidates
+
+    def service_array(self, flows, candidates):
+        """
+            Return the boolean array of the candidate flows of a Flows holding NumPy arrays allowed by the service of the rule
+        """
+        protocols = flows.proto[candidates]
+        ports = flows.dport[candidates]
+        if len(self.service) == 1:
+            for protocol, intervals in self.service.items():
+                return (protocols == protocol) & intervals.contains_array(ports)
+
+        allowed = numpy.zeros(len(candidates), dtype=bool)
+        for protocol, intervals in self.service.items():
+            selected = protocols == protocol
+            if selected.any():
+                allowed[selected] = intervals.contains_array(ports[selected])
+
+        return allowed
+
+
+def interface_table(codes):
+    """
+        Return the NumPy boolean array of the interface codes, shifted by -UNKNOWN_INTERFACE, matching a set of interface codes,
+        its last item being False for the higher codes, see numpy.take(mode='clip')
+    """
+    if not(codes in interface_tables):
+        table = numpy.zeros(max(codes | set([ANY_INTERFACE])) - UNKNOWN_INTERFACE + 2, dtype=bool)
+        table[ANY_INTERFACE - UNKNOWN_INTERFACE] = True
+        table[[code - UNKNOWN_INTERFACE for code in codes]] = True
+        interface_tables[codes] = table
+
+    return interface_tables[codes]
+
+
+class Compiler(object):
+    """
+        Compile the policies of a VDOM, the intervals of the values shared by several policies being computed once
+    """
+
+    def __init__(self, address_resolver, services, interface_codes):
+        """
+            @param address_resolver:  fgresolve.Resolver of the addresses of a VDOM
+            @param services:  list of the services and service groups of the same VDOM, see fgservicestocsv.parse()
+            @param interface_codes:  dict of interface name -> code, shared by every VDOM and extended in place
+        """
+        self.address_resolver = address_resolver
+        self.address_table = fgaddrtable.AddressTable(address_resolver.addresses.values())
+
+        self.services = dict((service.get('name'), service) for service in services if not('member' in service))
+        service_groups = [service for service in services if 'member' in service]
+        self.service_resolver = fgresolve.Resolver(self.services.values(), service_groups)
+
+        self.interface_codes = interface_codes
+
+        self.address_sets = {}
+        self.service_sets = {}
+
+    def interfaces(self, value):
+        """
+            Return the frozenset of the interface codes of a srcintf or dstintf value, None for "any" or no interface at all,
+            which does not restrict the flows
+        """
+        names = value.split()
+        if not(names) or 'any' in names:
+            return None
+
+        return frozenset(self.interface_codes.setdefault(name, len(self.interface_codes)) for name in names)
+
+    def address_set(self, value):
+        """
+            Return the IntervalSet of a srcaddr or dstaddr value, the FQDN and geography objects matching nothing
+        """
+        if not(value in self.address_sets):
+            intervals, others = self.address_table.union(self.address_resolver.resolve_value(value))
+            if 'all' in others:
+                intervals = [(0, MAX_ADDRESS)]
+
+            self.address_sets[value] = IntervalSet(intervals, MAX_ADDRESS)
+
+        return self.address_sets[value]
+
+    def service_set(self, value):
+        """
+            Return the dict of IP protocol number -> IntervalSet of the destination ports of a service value, None for every protocol
+        """
+        if not(value in self.service_sets):
+            intervals = {}
+            full = False
+            for name in self.service_resolver.resolve_value(value):
+                service = self.services.get(name)
+                if service is None:
+                    full = full or name.upper() == 'ALL'
+                    continue
+
+                protocol = service.get('protocol', 'TCP/UDP/SCTP').upper()
+                if protocol == 'IP':
+                    number = service.get('protocol-number', '0')
+                    if number == '0':
+                        full = True
+                    elif number.isdigit():
+                        intervals.setdefault(int(number), []).append(fgports.FULL_PORT_RANGE)
+
+                elif protocol in ('ICMP', 'ICMP6'):
+                    intervals.setdefault(PROTOCOL_NUMBERS[protocol.lower()], []).append(fgports.FULL_PORT_RANGE)
+
+                else:
+                    # the flows have no source port: the source port ranges are not checked
+                    for port_protocol, destination, source in fgports.service_ports(service):
+                        intervals.setdefault(PROTOCOL_NUMBERS[port_protocol], []).append(destination)
+
+            if full:
+                self.service_sets[value] = None
+            else:
+                self.service_sets[value] = dict((protocol, IntervalSet(protocol_intervals, 65535)) for protocol, protocol_intervals in intervals.items())
+
+        return self.service_sets[value]
+
+    def compile(self, record):
+        """
+            Return the CompiledRule of a policy, or None for a policy never matching
+        """
+        if record.get('status') == 'disable':
+            return None
+
+        for key, value in UNSUPPORTED_SETTINGS.items():
+            if record.get(key) == value:
+                return None
+
+        rule = CompiledRule()
+        rule.id = record.get(fgpoliciestocsv.ID_KEY, '')
+        rule.action = record.get('action', 'deny')
+        rule.srcintf = self.interfaces(record.get('srcintf', ''))
+        rule.dstintf = self.interfaces(record.get('dstintf', ''))
+        rule.srcaddr = self.address_set(record.get('srcaddr', ''))
+        rule.dstaddr = self.address_set(record.get('dstaddr', ''))
+        rule.srcaddr_negate = record.get('srcaddr-negate') == 'enable'
+        rule.dstaddr_negate = record.get('dstaddr-negate') == 'enable'
+        rule.service = self.service_set(record.get('service', ''))
+        rule.service_negate = record.get('service-negate') == 'enable'
+
+        return rule
+
+
+class Rulebase(list):
+    """
+        Compiled rules of a VDOM, in rulebase order
+    """
+
+    def __init__(self, rules=()):
+        list.__init__(self, rules)
+
+        # address key -> concatenated intervals of the rules, see address_bounds()
+        self.bounds = {}
+
+
+class Flows(object):
+    """
+        Parallel integer columns of a batch of flows, NumPy arrays or lists
+    """
+    __slots__ = ('count', 'src', 'dst', 'proto', 'dport', 'srcintf', 'dstintf')
+
+    def __init__(self, columns, use_numpy):
+        """
+            @param columns:  list of the src, dst, proto, dport, srcintf and dstintf integer columns, see parse_flows()
+        """
+        self.count = len(columns[0])
+        if use_numpy:
+            columns = [numpy.array(column, dtype=numpy.int64) for column in columns]
+        self.src, self.dst, self.proto, self.dport, self.srcintf, self.dstintf = columns
+
+
+# Functions
+def load_rules(options):
+    """
+        Parse the policies, addresses, groups and services of options.input_file and compile the policies
+
+        @rtype: return (OrderedDict of VDOM -> Rulebase, dict of interface name -> code, fgresolve.VdomResolvers)
+    """
+    address_resolvers = fgresolve.load_resolver(options)
+
+    object_options = copy.copy(options)
+    object_options.jobs = 1
+    services, service_keys = fgcommon.parse_input(fgservicestocsv, object_options)
+
+    policies, policy_keys = fgcommon.parse_input(fgpoliciestocsv, options)
+
+    # the policies of a VDOM only reference the objects of that VDOM
+    vdom_services = fgresolve.group_by_vdom(services)
+    compilers = {}
+    interface_codes = {}
+
+    rules = OrderedDict()
+    with fgstats.phase('compile'):
+        for record in policies:
+            vdom = record.get(VDOM_KEY)
+            if not(vdom in compilers):
+                compilers[vdom] = Compiler(address_resolvers.resolver(vdom), vdom_services.get(vdom, []), interface_codes)
+                rules[vdom] = Rulebase()
+
+            rule = compilers[vdom].compile(record)
+            if rule is not None:
+                rules[vdom].append(rule)
+
+    return (rules, interface_codes, address_resolvers)
+
+
+def ip_value(ip):
+    """
+        Return the integer value of a dotted IPv4 address, or None
+    """
+    try:
+        return struct.unpack('!I', socket.inet_pton(socket.AF_INET, ip))[0]
+    except (socket.error, ValueError):
+        return None
+
+
+def ip_column(values):
+    """
+        Return the list of the integer values of a column of dotted IPv4 addresses, None for an invalid one
+    """
+    try:
+        # a whole valid column is converted by a single unpack
+        return list(struct.unpack('!%dI' % len(values), b''.join([socket.inet_pton(socket.AF_INET, value) for value in values])))
+    except (socket.error, ValueError):
+        return [ip_value(value) for value in values]
+
+
+def protocol_value(value):
+    """
+        Return the IP protocol number of a "6" or "tcp" value, or None
+    """
+    if value.isdigit():
+        return int(value)
+
+    return PROTOCOL_NUMBERS.get(value.lower())
+
+
+def port_value(value):
+    """
+        Return the integer value of a port, 0 for an empty port as a flow without dstport column gets, or None
+    """
+    # ICMP and the other flows without ports usually leave it empty
+    if not(value):
+        return 0
+
+    if value.isdigit() and int(value) <= 65535:
+        return int(value)
+
+    return None
+
+
+def distinct_column(values, parse):
+    """
+        Return the list of the parsed values of a column holding few distinct values, each one being parsed once
+    """
+    parsed = dict((value, parse(value)) for value in set(values))
+
+    return list(map(parsed.__getitem__, values))
+
+
+def parse_flows(rows, columns, interface_codes):
+    """
+        Parse the flow rows of a batch column by column
+
+        @param columns:  dict of flow key -> position in the rows, see FLOW_KEYS
+        @rtype: return (list of the src, dst, proto, dport, srcintf and dstintf integer columns, with None for an invalid value,
+                list of the vd column or None)
+    """
+    width = max(columns.values()) + 1
+    if min(map(len, rows)) < width:
+        rows = [row + [''] * (width - len(row)) if len(row) < width else row for row in rows]
+
+    def column(key):
+        if not(key in columns):
+            return [''] * len(rows)
+        return list(map(operator.itemgetter(columns[key]), rows))
+
+    def interface_code(name):
+        return interface_codes.get(name, UNKNOWN_INTERFACE) if name else ANY_INTERFACE
+
+    flow_columns = [
+        ip_column(column('srcip')),
+        ip_column(column('dstip')),
+        distinct_column(column('proto'), protocol_value),
+        distinct_column(column('dstport'), port_value) if 'dstport' in columns else [0] * len(rows),
+        distinct_column(column('srcintf'), interface_code),
+        distinct_column(column('dstintf'), interface_code),
+    ]
+
+    return (flow_columns, column('vd') if 'vd' in columns else None)
+
+
+def candidates_python(rule, flows, orders, unmatched):
+    """
+        Return the positions of the flows able to match a rule and the address key they already match, see evaluate_python()
+    """
+    best = (len(unmatched), None, None)
+    for key, negate in (('srcaddr', rule.srcaddr_negate), ('dstaddr', rule.dstaddr_negate)):
+        intervals = getattr(rule, key)
+        if negate or intervals.full:
+            continue
+
+        order, values = orders[key]
+        slices = [(bisect.bisect_left(values, first), bisect.bisect_right(values, last)) for first, last in zip(intervals.firsts, intervals.lasts)]
+        size = sum(end - start for start, end in slices)
+        if size < best[0]:
+            best = (size, key, slices)
+
+    size, key, slices = best
+    if key is None:
+        return (unmatched, None)
+
+    order = orders[key][0]
+    return ([position for start, end in slices for position in order[start:end]], key)
+
+
+def evaluate_python(rules, flows):
+    """
+        Return the list of the position in rules of the first rule matching every flow, -1 for none
+    """
+    hits = [-1] * flows.count
+
+    orders = {}
+    for key, column in (('srcaddr', flows.src), ('dstaddr', flows.dst)):
+        order = sorted(range(flows.count), key=column.__getitem__)
+        orders[key] = (order, [column[position] for position in order])
+
+    unmatched = list(range(flows.count))
+    remaining = flows.count
+    for number, rule in enumerate(rules):
+        if not(remaining):
+            break
+
+        candidates, skipped = candidates_python(rule, flows, orders, unmatched)
+        matched = False
+        for position in candidates:
+            if hits[position] < 0 and rule.matches(flows, position, skipped):
+                hits[position] = number
+                remaining -= 1
+                matched = True
+
+        if matched:
+            unmatched = [position for position in unmatched if hits[position] < 0]
+
+    return hits
+
+
+def address_bounds(rules, key):
+    """
+        Concatenate the address intervals of a key of every rule, for counting the candidate flows of all the rules at once
+
+        @rtype: return (NumPy array of the first integers, NumPy array of the last integers, list of the offsets of the
+                intervals of every rule, NumPy boolean array of the rules not narrowing their candidates down by this key)
+    """
+    firsts = []
+    lasts = []
+    offsets = [0]
+    unusable = []
+    for rule in rules:
+        intervals = getattr(rule, key)
+        negate = getattr(rule, key + '_negate')
+        if not(negate or intervals.full):
+            firsts.extend(intervals.firsts)
+            lasts.extend(intervals.lasts)
+        offsets.append(len(firsts))
+        unusable.append(negate or intervals.full)
+
+    return (numpy.array(firsts, dtype=numpy.int64), numpy.array(lasts, dtype=numpy.int64), offsets, numpy.array(unusable, dtype=bool))
+
+
+def evaluate_numpy(rules, flows):
+    """
+        Return the NumPy array of the position in rules of the first rule matching every flow, -1 for none
+
+        The flows falling in the address intervals of every rule are counted with a single binary search over all
+        the intervals: a rule without any candidate flow is skipped without a NumPy call.
+    """
+    hits = numpy.full(flows.count, -1, dtype=numpy.int64)
+
+    slices = {}
+    for key, column in (('srcaddr', flows.src), ('dstaddr', flows.dst)):
+        if not(key in rules.bounds):
+            rules.bounds[key] = address_bounds(rules, key)
+        firsts, lasts, offsets, unusable = rules.bounds[key]
+
+        order = numpy.argsort(column, kind='stable')
+        values = column[order]
+        starts = numpy.searchsorted(values, firsts, side='left')
+        ends = numpy.searchsorted(values, lasts, side='right')
+
+        # number of flows in the intervals of every rule
+        sums = numpy.concatenate(([0], numpy.cumsum(ends - starts)))
+        sizes = sums[offsets[1:]] - sums[offsets[:-1]]
+        sizes[unusable] = flows.count
+
+        slices[key] = (order, starts, ends, offsets, sizes.tolist())
+
+    unmatched = numpy.arange(flows.count)
+    stale = False
+    remaining = flows.count
+    for number, rule in enumerate(rules):
+        if not(remaining):
+            break
+
+        size, key = min((slices[key][4][number], key) for key in ('srcaddr', 'dstaddr'))
+        if not(size):
+            continue
+
+        if size < remaining:
+            # concatenate the order slices of the rule intervals without a Python loop, the merged intervals never sharing a flow
+            order, starts, ends, offsets, sizes = slices[key]
+            starts = starts[offsets[number]:offsets[number + 1]]
+            lengths = ends[offsets[number]:offsets[number + 1]] - starts
+            positions = numpy.arange(size) + numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+
+            candidates = order[positions]
+            candidates = candidates[hits[candidates] < 0]
+            if not(len(candidates)):
+                continue
+        else:
+            # the unmatched flows are only compacted when a rule needs them
+            if stale:
+                unmatched = unmatched[hits[unmatched] < 0]
+                stale = False
+            candidates = unmatched
+            key = None
+
+        matched = rule.matching_array(flows, candidates, key)
+        if len(matched):
+            hits[matched] = number
+            remaining -= len(matched)
+            stale = True
+
+    return hits
+
+
+def evaluate(rules, flows, use_numpy):
+    """
+        Return the list of the first rule matching every flow, None for none
+    """
+    if use_numpy:
+        hits = evaluate_numpy(rules, flows).tolist()
+    else:
+        hits = evaluate_python(rules, flows)
+
+    return [rules[hit] if hit >= 0 else None for hit in hits]
+
+
+def flow_columns(header):
+    """
+        Return the dict of flow key -> position of a flow file header
+
+        @rtype: raise ValueError when a required column is missing
+    """
+    columns = {}
+    for position, name in enumerate(header):
+        name = name.strip().lower().lstrip(u'\ufeff')
+        if name in FLOW_KEYS and not(name in columns):
+            columns[name] = position
+
+    missing = [key for key in REQUIRED_FLOW_KEYS if not(key in columns)]
+    if missing:
+        raise ValueError('The flow file header misses the %s column(s)' % ','.join(missing))
+
+    return columns
+
+
+def evaluate_batch(rows, rules, columns, interface_codes, use_numpy):
+    """
+        Evaluate a batch of flow rows
+
+        @param rules:  OrderedDict of VDOM -> Rulebase, see load_rules()
+        @rtype: return the list of the (policyid, action) of every row, empty for an invalid flow
+    """
+    results = [('', '')] * len(rows)
+
+    flow_columns, vdoms = parse_flows(rows, columns, interface_codes)
+
+    valid = range(len(rows))
+    if any(None in flow_column for flow_column in flow_columns):
+        valid = [position for position, flow in enumerate(zip(*flow_columns)) if not(None in flow)]
+
+    # a configuration without VDOM gets every flow, whatever the vd field of the logs ("root")
+    vdom_positions = OrderedDict()
+    if list(rules) == [None] or vdoms is None:
+        vdom_positions[None] = valid
+    else:
+        for position in valid:
+            vdom_positions.setdefault(vdoms[position], []).append(position)
+
+    for vdom, positions in vdom_positions.items():
+        if len(positions) < len(rows):
+            vdom_columns = [[flow_column[position] for position in positions] for flow_column in flow_columns]
+        else:
+            vdom_columns = flow_columns
+
+        matched = evaluate(rules.get(vdom, Rulebase()), Flows(vdom_columns, use_numpy), use_numpy)
+        for position, rule in zip(positions, matched):
+            results[position] = (rule.id, rule.action) if rule is not None else IMPLICIT_DENY
+
+    return results
+
+
+def read_header(reader, flow_file):
+    """
+        Return the header of a flow file csv reader and its dict of flow key -> position
+
+        @rtype: raise ValueError for an empty file or a missing required column
+    """
+    header = next(reader, None)
+    if header is None:
+        raise ValueError('The flow file "%s" is empty' % flow_file)
+
+    return (header, flow_columns(header))
+
+
+def check_flow_file(options):
+    """
+        Check the flow file of the options before parsing the configuration and opening the output
+
+        @rtype: raise ValueError for an empty file or a missing required column
+    """
+    with fgcompress.open_text(options.flow_file, options.input_encoding) as fd_flows:
+        read_header(csv.reader(fd_flows, delimiter=options.flow_delimiter), options.flow_file)
+
+    return None
+
+
+def generate_csv(rules, interface_codes, options, use_numpy):
+    """
+        Generate a plain csv file, the flow file rows followed by the policy they hit first
+
+        @rtype: return (number of flows, number of invalid flows)
+    """
+    count = 0
+    invalid = 0
+
+    with fgcompress.open_text(options.flow_file, options.input_encoding) as fd_flows:
+        reader = csv.reader(fd_flows, delimiter=options.flow_delimiter)
+        header, columns = read_header(reader, options.flow_file)
+
+        with fgcommon.open_output(options.output_file, options) as fd_output:
+            spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+            if not(options.skip_header):
+                spamwriter.writerow(header + RESULT_KEYS)
+
+            while True:
+                rows = list(itertools.islice(reader, options.batch_size))
+                if not(rows):
+                    break
+
+                with fgstats.phase('evaluate'):
+                    results = evaluate_batch(rows, rules, columns, interface_codes, use_numpy)
+
+                for row, result in zip(rows, results):
+                    if not(result[0]):
+                        invalid += 1
+                    spamwriter.writerow(row + list(result))
+                count += len(rows)
+
+    return (count, invalid)
+
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    if (options.input_file == None):
+        parser.error('Please specify a valid input file')
+
+    if (options.flow_file == None):
+        parser.error('Please specify a valid flow file')
+
+    if options.batch_size < 1:
+        parser.error('The batch size must be a positive number')
+
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    try:
+        check_flow_file(options)
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+    except (IOError, OSError) as e:
+        parser.error('Unable to read the flow file: %s' % e)
+
+    use_numpy = numpy is not None and not(options.no_numpy)
+
+    rules, interface_codes, address_resolvers = load_rules(options)
+
+    start = time.time()
+    with fgstats.phase('write'):
+        count, invalid = generate_csv(rules, interface_codes, options, use_numpy)
+    elapsed = max(time.time() - start, 1e-6)
+
+    print('[+] %d flow(s) evaluated in %.2fs (%d flows/s) against %d rule(s)%s' % (count, elapsed, count / elapsed, sum(len(vdom_rules) for vdom_rules in rules.values()), ' with NumPy' if use_numpy else ''), file=sys.stderr)
+    if invalid:
+        print('[!] %d invalid flow(s), left without policy' % invalid, file=sys.stderr)
+
+    fgresolve.print_cycles(address_resolvers)
+    fgcache.print_stats(options)
+    fgstats.finish(options)
+
+    return None
+
+if __name__ == "__main__" :
+    main()
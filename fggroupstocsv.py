@@ -24,12 +24,20 @@ from __future__ import division
 from __future__ import print_function
 
 from os import path
-import io
 import sys
 import re
 import csv
 import os
 
+from fgtokenizer import tokenize_lines
+import fgtree
+import fgstore
+import fgcommon
+import fgcache
+import fgstats
+import fgoutput
+import fgselect
+
 # OptionParser imports
 from optparse import OptionParser
 from optparse import OptionGroup
@@ -38,14 +46,19 @@ from optparse import OptionGroup
 parser = OptionParser(usage="%prog [options]")
 
 main_grp = OptionGroup(parser, 'Main parameters')
-main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file. Ex: fgfw.cfg')
-main_grp.add_option('-o', '--output-file', help='Output csv file (default ./groups-out.csv)', default=path.abspath(path.join(os.getcwd(), './groups-out.csv')))
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file, possibly gzip, xz or bzip2 compressed, "-" reading the standard input. Ex: fgfw.cfg')
+main_grp.add_option('-o', '--output-file', help='Output csv file, compressed when ending with .gz, .xz or .bz2 (default ./groups-out.csv)', default=path.abspath(path.join(os.getcwd(), './groups-out.csv')))
 main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
 main_grp.add_option('-n', '--newline', help='Insert a newline between each group for better readability', action='store_true', default=False)
 main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
 main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
 main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
 parser.option_groups.extend([main_grp])
+fgcommon.add_stream_options(parser)
+fgoutput.add_output_options(parser)
+fgselect.add_select_options(parser)
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
 
 # Python 2 and 3 compatibility
 if (sys.version_info < (3, 0)):
@@ -56,100 +69,128 @@ else:
     fd_write_options = 'w'
 
 # Handful patterns
-# -- Entering group definition block
-p_entering_group_block = re.compile(r'^\s*config firewall addrgrp$', re.IGNORECASE)
+# -- Entering group definition block, matched against the name of a "config" line
+p_entering_group_block = re.compile(r'^firewall addrgrp$', re.IGNORECASE)
+p_entering_block = p_entering_group_block
 
-# -- Exiting group definition block
-p_exiting_group_block = re.compile(r'^end$', re.IGNORECASE)
+# Key identifying an entry, from its "edit" line
+ID_KEY = u'name'
 
-# -- Commiting the current group definition and going to the next one
-p_group_next = re.compile(r'^next$', re.IGNORECASE)
+# Columns holding integers, typed by the other output formats than csv
+INTEGER_KEYS = []
 
-# -- Policy number
-p_group_name = re.compile(r'^\s*edit\s+"(?P<group_name>.*)"$', re.IGNORECASE)
+# Functions
+def iter_entry_records(entries, order_keys, selection=None):
+    """
+        View the entries of the configuration tree as group records
+        
+        @param entries:  iterable of (vdom, section name, fgtree.Entry) tuples, see fgtree.iter_entries()
+        @param order_keys:  list of seen keys, extended in place with the new keys found ['id', 'srcintf', 'dstintf', ...]
+        @param selection:  optional fgselect.Selection, yielding the entries it accepts
+        @rtype: yield every group ( {'id' : '1', 'srcintf' : 'internal', ...} )
+    """
+    return fgcommon.iter_entry_records(entries, order_keys, ID_KEY, selection)
 
-# -- Policy setting
-p_group_set = re.compile(r'^\s*set\s+(?P<group_key>\S+)\s+(?P<group_value>.*)$', re.IGNORECASE)
 
-# Functions
-def parse(options):
+def iter_records(tokens, order_keys, selection=None):
     """
-        Parse the data according to several regexes
+        Parse the data according to the tokenized lines
         
-        @param options:  options
-        @rtype: return a list of groups ( [ {'id' : '1', 'srcintf' : 'internal', ...}, {'id' : '2', 'srcintf' : 'external', ...}, ... ] )  
-                and the list of unique seen keys ['id', 'srcintf', 'dstintf', ...]
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @param order_keys:  list of seen keys, extended in place with the new keys found ['id', 'srcintf', 'dstintf', ...]
+        @param selection:  optional fgselect.Selection, only storing its columns and yielding the entries it accepts
+        @rtype: yield every group as soon as it is complete ( {'id' : '1', 'srcintf' : 'internal', ...} )
     """
-    global p_entering_group_block, p_exiting_group_block, p_group_next, p_group_name, p_group_set
+    global p_entering_group_block
     
-    in_group_block = False
+    stored = selection.stored if selection is not None else None
+    entries = fgtree.iter_entries(tokens, [p_entering_group_block], stored)
     
-    group_list = []
-    group_elem = {}
+    return iter_entry_records(entries, order_keys, selection)
+
+
+def parse_tokens(tokens, selection=None):
+    """
+        Parse the data according to the tokenized lines
+        
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @param selection:  optional fgselect.Selection, see iter_records()
+        @rtype: return a fgstore.RecordStore of groups ( [ {'id' : '1', 'srcintf' : 'internal', ...}, {'id' : '2', 'srcintf' : 'external', ...}, ... ] )  
+                and the list of unique seen keys ['id', 'srcintf', 'dstintf', ...]
+    """
+    # the selected columns come first, in their given order
+    order_keys = list(selection.columns) if (selection is not None and selection.columns is not None) else []
+    group_list = fgstore.RecordStore(fgstats.counted(iter_records(tokens, order_keys, selection)))
     
-    order_keys = []
+    return (group_list, order_keys)
+
+
+def parse_lines(lines, selection=None):
+    """
+        Parse an iterable of configuration lines (file object, list, ...)
+        
+        @param lines:  iterable of configuration lines
+        @param selection:  optional fgselect.Selection, see iter_records()
+        @rtype: see parse_tokens()
+    """
+    return parse_tokens(tokenize_lines(lines), selection)
+
+
+def parse(options):
+    """
+        Parse the input file
+        
+        @param options:  options
+        @rtype: see parse_lines()
+    """
+    return parse_lines(fgcommon.iter_input_lines(options, [p_entering_block]), fgselect.selection(options))
+
+
+def format_member(value):
+    """
+        Return the csv value of a member list, one member per line
+    """
+    return "\n".join(value.split(" "))
+
+
+# Settings reformatted in the csv rows, see format_row()
+FORMATTERS = {'member': format_member}
+
+
+def format_row(group, keys):
+    """
+        Return the csv row of a group, following the order of keys
+    """
+    output_line = []
     
-    with io.open(options.input_file, mode=fd_read_options, encoding=options.input_encoding) as fd_input:
-        for line in fd_input:
-            line = line.strip()
-            
-            # We match a group block
-            if p_entering_group_block.search(line):
-                in_group_block = True
-            
-            # We are in a group block
-            if in_group_block:
-                if p_group_name.search(line):
-                    group_name = p_group_name.search(line).group('group_name')
-                    group_elem['name'] = group_name
-                    if not('name' in order_keys): order_keys.append('name')
-                
-                # We match a setting
-                if p_group_set.search(line):
-                    group_key = p_group_set.search(line).group('group_key')
-                    if not(group_key in order_keys): order_keys.append(group_key)
-                    
-                    group_value = p_group_set.search(line).group('group_value').strip()
-                    group_value = re.sub('["]', '', group_value)
-                    
-                    group_elem[group_key] = group_value
-                
-                # We are done with the current group id
-                if p_group_next.search(line):
-                    group_list.append(group_elem)
-                    group_elem = {}
-            
-            # We are exiting the group block
-            if p_exiting_group_block.search(line):
-                in_group_block = False
+    for key in keys:
+        if key in group:
+            if "member" == key:
+                output_line.append(format_member(group[key]))
+            else:
+                output_line.append(group[key])
+        else:
+            output_line.append('')
     
-    return (group_list, order_keys)
+    return output_line
 
 
 def generate_csv(results, keys, options):
     """
-        Generate a plain ';' separated csv file
+        Generate a plain ';' separated csv file, or a file of the --format output format
     """
-    if results and keys:
-        with io.open(options.output_file, mode=fd_write_options, encoding=options.output_encoding) as fd_output:
+    if results and keys and fgoutput.output_format(options) != fgoutput.CSV:
+        fgoutput.write_records(results, keys, options, u'groups', INTEGER_KEYS)
+    
+    elif results and keys:
+        with fgcommon.open_output(options.output_file, options) as fd_output:
             spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
             
             if not(options.skip_header):
                 spamwriter.writerow(keys)
             
-            for group in results:
-                output_line = []
-                
-                for key in keys:
-                    if key in group.keys():
-                        if "member" == key:
-                            output_line.append("\n".join(group[key].split(" ")))
-                        else:
-                            output_line.append(group[key])
-                    else:
-                        output_line.append('')
-            
-                spamwriter.writerow(output_line)
+            for row in fgstore.iter_rows(results, keys, format_row, FORMATTERS):
+                spamwriter.writerow(row)
                 if options.newline:
                     spamwriter.writerow('')
         
@@ -171,8 +212,26 @@ def main():
     if (sys.version_info < (3, 0)):
         options.output_encoding = None
     
-    results, keys = parse(options)
-    generate_csv(results, keys, options)
+    try:
+        fgoutput.check_options(options, parser.defaults['output_file'])
+        fgselect.check_options(options)
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if options.split_vdoms:
+        with fgstats.phase('stream'):
+            fgcommon.write_vdoms(sys.modules[__name__], options)
+    elif options.stream:
+        with fgstats.phase('stream'):
+            fgcommon.stream_csv(sys.modules[__name__], options)
+    else:
+        results, keys = fgcommon.parse_input(sys.modules[__name__], options)
+        with fgstats.phase('write'):
+            generate_csv(results, keys, options)
+    
+    fgcache.print_stats(options)
+    fgstats.finish(options)
     
     return None
 
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Hit counts of the policies, from the traffic logs
+
+    The "key=value" lines of the FortiGate traffic logs are streamed, possibly gzip, xz or bzip2
+    compressed, and only their "policyid", "vd", "date" and "time" fields are extracted, as bytes.
+    The lines are never kept: the memory only holds one (hits, last seen) counter per policy
+    of each VDOM, however big the logs are.
+    Several log files are read by as many worker processes, an uncompressed file being
+    split into byte ranges cut at line boundaries; their counters are summed afterwards.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+import re
+import sys
+import itertools
+import multiprocessing
+
+# OptionParser imports
+from optparse import OptionGroup
+
+from fgtokenizer import VDOM_KEY
+import fgcompress
+import fgcommon
+import fgstats
+
+# Columns added to the policies
+HITS_KEY = u'hits'
+LAST_SEEN_KEY = u'last_seen'
+HIT_KEYS = [HITS_KEY, LAST_SEEN_KEY]
+
+# Smallest byte range of an uncompressed log file worth a worker process
+MIN_LOG_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Handful patterns, matched against the raw bytes of a log line, a value being possibly quoted.
+# They start with a literal for the regular expression engine to skip quickly to it: the fields
+# after the first one follow a space, and "date" comes right before "time"
+# -- Policy id, "shapingpolicyid" being another field
+p_policyid = re.compile(br' policyid="?(\d+)')
+# -- VDOM
+p_vd = re.compile(br' vd="?([^"\s]*)')
+# -- Date and time, "2022-01-31" and "23:59:59" sorting in chronological order
+p_date_time = re.compile(br'date="?([\d-]+)"? time="?([\d:]+)')
+
+# Functions
+def add_hits_options(parser):
+    """
+        Add the hit count options to an OptionParser
+    """
+    hits_grp = OptionGroup(parser, 'Hit count parameters')
+    hits_grp.add_option('--logs', help='Comma separated list of FortiGate traffic log files, possibly gzip, xz or bzip2 compressed, whose "policyid" and "vd" fields give the "%s" and "%s" columns added to the policies. Ex: tlog-1.log.gz,tlog-2.log.gz' % (HITS_KEY, LAST_SEEN_KEY))
+    hits_grp.add_option('--log-jobs', help='Number of worker processes reading the log files in parallel (default 1)', type='int', default=1)
+    hits_grp.add_option('--log-encoding', help='Encoding of the VDOM names in the log files (default "utf-8")', default='utf-8')
+    parser.option_groups.extend([hits_grp])
+
+    return hits_grp
+
+
+def latest(last_seen, other):
+    """
+        Return the latest of two "date time" timestamps, either of them being possibly None
+    """
+    if last_seen is None or (other is not None and other > last_seen):
+        return other
+
+    return last_seen
+
+
+def merge_counters(counters, other):
+    """
+        Add the counters of other to counters, in place
+
+        @param counters:  dict of (vd, policy id) -> [hits, last seen "date time" or None]
+    """
+    for key, (hits, last_seen) in other.items():
+        counter = counters.get(key)
+        if counter is None:
+            counters[key] = [hits, last_seen]
+        else:
+            counter[0] += hits
+            counter[1] = latest(counter[1], last_seen)
+
+    return counters
+
+
+def count_lines(lines):
+    """
+        Count the hits of the policies in an iterable of raw log lines
+
+        @param lines:  iterable of bytes lines
+        @rtype: return (dict of (vd, policy id) -> [hits, last seen "date time" or None], number of lines, number of lines without policy id)
+    """
+    global p_policyid, p_vd, p_date_time
+
+    counters = {}
+    total = 0
+    skipped = 0
+
+    search_policyid = p_policyid.search
+    search_vd = p_vd.search
+    search_date_time = p_date_time.search
+
+    for line in lines:
+        total += 1
+
+        policyid = search_policyid(line)
+        if policyid is None:
+            skipped += 1
+            continue
+
+        vd = search_vd(line)
+        key = (vd.group(1) if vd else None, policyid.group(1))
+
+        date_time = search_date_time(line)
+        last_seen = date_time.group(1) + b' ' + date_time.group(2) if date_time else None
+
+        counter = counters.get(key)
+        if counter is None:
+            counters[key] = [1, last_seen]
+        else:
+            counter[0] += 1
+            if last_seen is not None and (counter[1] is None or last_seen > counter[1]):
+                counter[1] = last_seen
+
+    return (counters, total, skipped)
+
+
+def iter_range_lines(fd_input, start, end):
+    """
+        Yield the lines of a seekable file starting within the byte range [start, end), a line cut by start
+        belonging to the previous range
+    """
+    if start > 0:
+        fd_input.seek(start - 1)
+        # the end of the line holding start - 1, which is itself a complete line when start - 1 is a newline
+        fd_input.readline()
+    position = fd_input.tell()
+
+    while position < end:
+        line = fd_input.readline()
+        if not(line):
+            break
+        position += len(line)
+        yield line
+
+
+def count_chunk(job):
+    """
+        Worker: count the hits of a log file, or of a byte range of an uncompressed log file
+
+        @param job:  (log file, start, end or None for the whole file)
+        @rtype: see count_lines()
+    """
+    log_file, start, end = job
+
+    with fgcompress.open_binary(log_file) as fd_input:
+        if end is None:
+            return count_lines(fd_input)
+
+        return count_lines(iter_range_lines(fd_input, start, end))
+
+
+def log_chunks(log_files, jobs):
+    """
+        Return the (log file, start, end) jobs reading a list of log files, the uncompressed ones
+        being split into byte ranges to keep jobs worker processes busy
+    """
+    chunks = []
+    for log_file in log_files:
+        if not(fgcompress.is_plain_file(log_file)):
+            chunks.append((log_file, 0, None))
+            continue
+
+        size = path.getsize(log_file)
+        parts = min(jobs, max(1, size // MIN_LOG_CHUNK_SIZE))
+        step = -(-size // parts) if size else 1
+        for start in range(0, max(size, 1), step):
+            chunks.append((log_file, start, min(start + step, size)))
+
+    return chunks
+
+
+class HitCounts(object):
+    """
+        Hits and last seen timestamp of the policies, per VDOM
+    """
+
+    def __init__(self, counters=None, encoding='utf-8'):
+        """
+            @param counters:  dict of (vd, policy id) -> [hits, last seen], raw bytes from the logs, see count_lines()
+            @param encoding:  encoding of the VDOM names
+        """
+        # (VDOM, policy id) -> (hits, last seen), and policy id -> (hits, last seen) all VDOMs together
+        self.counts = {}
+        self.totals = {}
+
+        self.lines = 0
+        self.skipped = 0
+
+        for (vd, policyid), (hits, last_seen) in (counters or {}).items():
+            vdom = vd.decode(encoding, 'replace') if vd is not None else None
+            policyid = policyid.decode('ascii')
+            last_seen = last_seen.decode('ascii') if last_seen is not None else None
+            self.counts[(vdom, policyid)] = (hits, last_seen)
+            total = self.totals.get(policyid, (0, None))
+            self.totals[policyid] = (total[0] + hits, latest(total[1], last_seen))
+
+    def __len__(self):
+        return len(self.counts)
+
+    def lookup(self, vdom, policyid):
+        """
+            Return the (hits, last seen or None) of a policy, a policy outside of a VDOM getting the hits of every VDOM
+        """
+        if vdom is None:
+            return self.totals.get(policyid, (0, None))
+
+        return self.counts.get((vdom, policyid), (0, None))
+
+    def add_hits(self, record):
+        """
+            Add the hit count columns of a policy, a policy without hits getting a count of "0" and no last seen timestamp
+        """
+        hits, last_seen = self.lookup(record.get(VDOM_KEY), record.get(u'id'))
+
+        record[HITS_KEY] = u'%d' % hits
+        if last_seen is not None:
+            record[LAST_SEEN_KEY] = last_seen
+
+        return record
+
+    def total_hits(self):
+        """
+            Return the number of log lines holding a policy id
+        """
+        return sum(hits for hits, last_seen in self.counts.values())
+
+
+def hit_keys(order_keys):
+    """
+        Return order_keys followed by the columns added by the hit counts
+    """
+    return order_keys + [key for key in HIT_KEYS if not(key in order_keys)]
+
+
+def count_logs(log_files, jobs=1, encoding='utf-8'):
+    """
+        Count the hits of the policies in log files, with jobs worker processes
+
+        The standard input, read once, is counted by the main process.
+
+        @rtype: return a HitCounts
+    """
+    counters = {}
+    lines = 0
+    skipped = 0
+
+    results = []
+    if fgcompress.STDIN in log_files:
+        results.append(count_chunk((fgcompress.STDIN, 0, None)))
+
+    chunks = log_chunks([log_file for log_file in log_files if log_file != fgcompress.STDIN], jobs)
+    pool = None
+    if jobs > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(processes=min(jobs, len(chunks)))
+        results = itertools.chain(results, pool.imap_unordered(count_chunk, chunks))
+    else:
+        results = itertools.chain(results, (count_chunk(chunk) for chunk in chunks))
+
+    try:
+        for chunk_counters, chunk_lines, chunk_skipped in results:
+            merge_counters(counters, chunk_counters)
+            lines += chunk_lines
+            skipped += chunk_skipped
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    hits = HitCounts(counters, encoding)
+    hits.lines = lines
+    hits.skipped = skipped
+    fgstats.count('log lines', lines)
+
+    return hits
+
+
+def load_hits(options):
+    """
+        Count the hits of the policies in the --logs files of the options
+
+        @rtype: return a HitCounts
+    """
+    with fgstats.phase('logs'):
+        return count_logs(fgcommon.split_list(options.logs), options.log_jobs, options.log_encoding)
+
+
+def print_summary(hits):
+    """
+        Report the log lines read by a HitCounts on stderr
+    """
+    print('[+] Hits: %d log line(s) read, %d hit(s) on %d policy(ies)' % (hits.lines, hits.total_hits(), len(hits)), file=sys.stderr)
+    if hits.skipped:
+        print('[!] %d log line(s) without policyid, not counted' % hits.skipped, file=sys.stderr)
+
+    return None
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Block index of a FortiGate configuration file
+
+    The file is scanned once as a memory-mapped bytes buffer, only looking at the
+    "config ..." and "end" lines, to record the byte offsets of every
+    "config firewall <x>" ... "end" block, along with its VDOM.
+    Extractors then only decode and parse the ranges they need.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import namedtuple
+import bisect
+import codecs
+import heapq
+import io
+import mmap
+import os
+import re
+
+import fgstats
+import fgcompress
+
+# A "config firewall <x>" block: VDOM (None outside of "config vdom"), section name ("firewall policy"),
+# offset of its "config" line and offset right after its "end" line
+Block = namedtuple('Block', ['vdom', 'name', 'start', 'end'])
+
+# Size of the slices decoded at once when reading a block
+CHUNK_SIZE = 1024 * 1024
+
+# Keywords written otherwise than in lowercase, switching a scan to the case-insensitive patterns
+CASED_KEYWORDS = [b'CONFIG', b'Config', b'END', b'End', b'EDIT', b'Edit']
+
+# Handful patterns
+# FortiOS always writes the keywords in lowercase: sticking to it, the patterns keep a literal prefix
+# and the regex engine jumps from one candidate to the next instead of testing every line.
+# Their "_any_case" variants, 5 times slower, scan the files holding other keywords
+# -- Entering a (sub)configuration block
+p_config = re.compile(br'config[ \t]+(?P<name>[^\r\n]*)')
+p_config_any_case = re.compile(p_config.pattern, re.IGNORECASE)
+
+# -- Exiting a (sub)configuration block
+p_end = re.compile(br'end[ \t]*\r?(?=\n|\Z)')
+p_end_any_case = re.compile(p_end.pattern, re.IGNORECASE)
+
+# -- VDOM name, between the "config vdom" line and the blocks of that VDOM
+p_vdom_edit = re.compile(br'^[ \t]*edit[ \t]+"?(?P<vdom>[^"\r\n]*?)"?[ \t]*\r?$', re.MULTILINE | re.IGNORECASE)
+
+# -- Entry of a block
+p_edit = re.compile(br'edit[ \t]')
+p_edit_any_case = re.compile(p_edit.pattern, re.IGNORECASE)
+
+# -- Line of an entry of a block, a newline being a cheaper literal prefix than a line start
+p_edit_line = re.compile(br'\n[ \t]*edit[ \t]')
+p_edit_line_any_case = re.compile(p_edit_line.pattern, re.IGNORECASE)
+
+# -- Sections indexed
+p_firewall_section = re.compile(r'^firewall ', re.IGNORECASE)
+
+# Index cache, to share it between the extractors of the same run
+index_cache = {}
+
+# Functions
+def at_line_start(buf, position):
+    """
+        Check if only blanks are found between the start of the line and position
+    """
+    line_start = buf.rfind(b'\n', 0, position) + 1
+    return not(buf[line_start:position].strip())
+
+
+def split_lines(text):
+    """
+        Split a decoded text into lines the way iterating a text file does: at the line feeds only, CR LF and
+        CR being read as a line feed, where str.splitlines() also cuts at the form feeds or the Unicode line
+        separators of the quoted values
+    """
+    return io.StringIO(text, newline=None).readlines()
+
+
+def is_lowercase(buf, start=0, end=None):
+    """
+        Check if the keywords of a range of buf are all written in lowercase, as FortiOS does
+    """
+    if end is None:
+        end = len(buf)
+
+    return not(any(buf.find(keyword, start, end) >= 0 for keyword in CASED_KEYWORDS))
+
+
+def iter_config_and_end(buf, start=0, end=None, lowercase=True):
+    """
+        Yield the (start, end, section name) of the "config" lines and the (start, end, None) of the "end" lines, in file order
+
+        @param lowercase:  only match the lowercase keywords, see is_lowercase()
+    """
+    global p_config, p_end, p_config_any_case, p_end_any_case
+
+    if end is None:
+        end = len(buf)
+
+    config_pattern, end_pattern = (p_config, p_end) if lowercase else (p_config_any_case, p_end_any_case)
+
+    configs = ((match.start(), match.end(), match.group('name')) for match in config_pattern.finditer(buf, start, end) if at_line_start(buf, match.start()))
+    ends = ((match.start(), match.end(), None) for match in end_pattern.finditer(buf, start, end) if at_line_start(buf, match.start()))
+
+    return heapq.merge(configs, ends)
+
+
+def build_index(buf, lowercase=None):
+    """
+        Scan a bytes-like buffer (bytes, mmap, ...) for the "config firewall <x>" blocks
+
+        @param buf:  the configuration file content
+        @param lowercase:  only match the lowercase keywords, by default when is_lowercase(buf), a scan finding
+                           no block being done again whatever the case of the keywords
+        @rtype: return the list of blocks, in file order
+    """
+    global p_vdom_edit, p_firewall_section
+
+    if lowercase is None:
+        blocks = build_index(buf, is_lowercase(buf))
+        if not(blocks):
+            blocks = build_index(buf, False)
+        return blocks
+
+    blocks = []
+
+    # stack of the section names of the currently opened blocks
+    stack = []
+    vdom = None
+    block_start = None
+    block_name = None
+    block_depth = 0
+    previous_end = 0
+
+    for start, end, name in iter_config_and_end(buf, lowercase=lowercase):
+        # the lines between two "config"/"end" lines at the "config vdom" level carry the VDOM names
+        if stack == ['vdom']:
+            for vdom_match in p_vdom_edit.finditer(buf, previous_end, start):
+                vdom = vdom_match.group('vdom').decode('utf-8', 'replace')
+
+        previous_end = end
+
+        if name is not None:
+            name = name.decode('utf-8', 'replace').strip()
+            if block_start is None and p_firewall_section.search(name):
+                block_start = start
+                block_name = name
+                block_depth = len(stack)
+
+            stack.append(name.lower())
+
+        elif stack:
+            stack.pop()
+
+            if block_start is not None and len(stack) == block_depth:
+                if buf[end:end + 1] == b'\n':
+                    end += 1
+
+                blocks.append(Block(vdom, block_name, block_start, end))
+                block_start = None
+
+            if not(stack):
+                vdom = None
+
+    return blocks
+
+
+def split_block(buf, block, parts):
+    """
+        Split a block in at most parts byte ranges of similar size, only cutting right before a top-level "edit" line,
+        so that every range holds complete entries, nested "config ... end" sub-blocks included
+
+        @param buf:  the configuration file content
+        @param block:  the block to split
+        @param parts:  number of wanted ranges
+        @rtype: return the list of (start, end) byte ranges, in file order
+    """
+    global p_edit, p_edit_any_case
+
+    lowercase = is_lowercase(buf, block.start, block.end)
+    edit_pattern = p_edit if lowercase else p_edit_any_case
+
+    # nested sub-blocks, where an "edit" line is not the start of an entry
+    nested_starts = []
+    nested_ends = []
+    depth = 0
+    for start, end, name in iter_config_and_end(buf, block.start, block.end, lowercase):
+        if name is not None:
+            if depth == 1:
+                nested_starts.append(start)
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                nested_ends.append(end)
+
+    boundaries = [block.start]
+    step = (block.end - block.start) // max(parts, 1)
+    for part in range(1, parts):
+        target = max(block.start + part * step, boundaries[-1] + 1)
+
+        boundary = None
+        for match in edit_pattern.finditer(buf, target, block.end):
+            position = match.start()
+            if not(at_line_start(buf, position)):
+                continue
+
+            nested = bisect.bisect_right(nested_starts, position) - 1
+            if nested >= 0 and nested < len(nested_ends) and position < nested_ends[nested]:
+                continue
+
+            boundary = buf.rfind(b'\n', 0, position) + 1
+            break
+
+        if boundary is None:
+            break
+
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+
+    boundaries.append(block.end)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def entry_ranges(buf, block):
+    """
+        Split a block into its top-level entries, each one running from its "edit" line to the next one,
+        nested "config ... end" sub-blocks included
+
+        @param buf:  the configuration file content
+        @param block:  the block to split
+        @rtype: return the list of (start, end) byte ranges of the entries, in file order, the last one ending
+                right before the "end" line of the block
+    """
+    global p_edit_line, p_edit_line_any_case
+
+    lowercase = is_lowercase(buf, block.start, block.end)
+    edit_line_pattern = p_edit_line if lowercase else p_edit_line_any_case
+
+    # nested sub-blocks, where an "edit" line is not the start of an entry
+    nested = []
+    depth = 0
+    block_end = block.end
+    for start, end, name in iter_config_and_end(buf, block.start, block.end, lowercase):
+        if name is not None:
+            if depth == 1:
+                nested.append([start, block.end])
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                nested[-1][1] = end
+            elif depth == 0:
+                block_end = start
+                break
+
+    starts = []
+    nested_position = 0
+    for match in edit_line_pattern.finditer(buf, block.start, block_end):
+        position = match.start() + 1
+        while nested_position < len(nested) and nested[nested_position][1] <= position:
+            nested_position += 1
+        if nested_position < len(nested) and nested[nested_position][0] <= position:
+            continue
+        starts.append(position)
+
+    return list(zip(starts, starts[1:] + [block_end]))
+
+
+def is_indexable(input_file, encoding):
+    """
+        Check if a file can be indexed: a non-empty, uncompressed regular file with an ASCII compatible encoding
+    """
+    try:
+        if not(fgcompress.is_plain_file(input_file)) or os.path.getsize(input_file) == 0:
+            return False
+
+        return codecs.lookup(encoding).encode(u'config end')[0] == b'config end'
+
+    except (LookupError, OSError):
+        return False
+
+
+def load_index(input_file):
+    """
+        Build the index of a file, or return it from the cache if the file did not change since
+
+        @rtype: return the list of blocks, in file order
+    """
+    global index_cache
+
+    stat = os.stat(input_file)
+    cache_key = (os.path.abspath(input_file), stat.st_size, stat.st_mtime)
+
+    if not(cache_key in index_cache):
+        with fgstats.phase('index'), open(input_file, 'rb') as fd_input:
+            buf = mmap.mmap(fd_input.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                index_cache[cache_key] = build_index(buf)
+            finally:
+                buf.close()
+
+    return index_cache[cache_key]
+
+
+def select_blocks(blocks, patterns):
+    """
+        Return the blocks whose section name matches one of the patterns
+    """
+    return [block for block in blocks if any(pattern.search(block.name) for pattern in patterns)]
+
+
+def iter_block_lines(input_file, blocks, encoding):
+    """
+        Decode and yield the lines of the given blocks only, slice by slice to keep the memory usage flat
+
+        @param input_file:  configuration file
+        @param blocks:  blocks to read, see select_blocks()
+        @param encoding:  file encoding
+        @rtype: yield the lines of the blocks, in file order
+    """
+    decoder = codecs.getincrementaldecoder(encoding)
+
+    with open(input_file, 'rb') as fd_input:
+        buf = mmap.mmap(fd_input.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for block in blocks:
+                block_decoder = decoder()
+                pending = u''
+                position = block.start
+                while position < block.end:
+                    chunk_end = min(position + CHUNK_SIZE, block.end)
+                    text = pending + block_decoder.decode(buf[position:chunk_end], chunk_end == block.end)
+                    position = chunk_end
+
+                    # the last line of a slice may continue in the next one, a "\r\n" possibly cut in two
+                    pending = u''
+                    if position < block.end:
+                        line_end = text.rfind(u'\n') + 1
+                        text, pending = text[:line_end], text[line_end:]
+
+                    for line in split_lines(text):
+                        yield line
+        finally:
+            buf.close()
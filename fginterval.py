@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Integer interval helpers and indexes
+
+    Addresses and ports are handled as closed integer intervals (first, last).
+    A set of intervals is kept as a sorted list of disjoint, non-adjacent intervals,
+    see merge_intervals().
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bisect
+
+# Functions
+def merge_intervals(intervals):
+    """
+        Return the sorted list of the disjoint intervals covering the same integers as intervals
+    """
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+
+    return merged
+
+
+def covers(outer, inner):
+    """
+        Check if every interval of inner is included in an interval of outer, both being merged lists
+    """
+    if not(inner):
+        return True
+
+    if not(outer):
+        return False
+
+    starts = [first for first, last in outer]
+    for first, last in inner:
+        position = bisect.bisect_right(starts, first) - 1
+        if position < 0 or outer[position][1] < last:
+            return False
+
+    return True
+
+
+class IntervalIndex(object):
+    """
+        Stabbing index over integer intervals
+
+        The interval bounds cut the integer line into elementary segments, each one holding the
+        tuple of the values of the intervals covering it: a lookup is a binary search over the
+        sorted segment starts.
+    """
+
+    def __init__(self, intervals):
+        """
+            @param intervals:  iterable of (first, last, value)
+        """
+        events = []
+        for first, last, value in intervals:
+            events.append((first, 1, value))
+            events.append((last + 1, -1, value))
+        events.sort(key=lambda event: event[0])
+
+        self.starts = []
+        self.values = []
+
+        # identical segment contents are shared
+        interned = {}
+        active = {}
+        position = 0
+        while position < len(events):
+            boundary = events[position][0]
+            while position < len(events) and events[position][0] == boundary:
+                unused, delta, value = events[position]
+                count = active.get(value, 0) + delta
+                if count:
+                    active[value] = count
+                else:
+                    del active[value]
+                position += 1
+
+            covering = tuple(sorted(active))
+            covering = interned.setdefault(covering, covering)
+
+            if self.values and self.values[-1] is covering:
+                continue
+
+            self.starts.append(boundary)
+            self.values.append(covering)
+
+    def lookup(self, point):
+        """
+            Return the tuple of the values of the intervals covering point
+        """
+        segment = bisect.bisect_right(self.starts, point) - 1
+        if segment < 0:
+            return ()
+
+        return self.values[segment]
+
+
+class SegmentTree(object):
+    """
+        Static segment tree over integer intervals
+
+        Unlike IntervalIndex, an interval is stored in O(log n) nodes instead of in every segment
+        it covers: it suits many overlapping intervals, such as the addresses of a whole rulebase.
+        The values of a node keep their insertion order.
+    """
+
+    def __init__(self, intervals):
+        """
+            @param intervals:  list of (first, last, value)
+        """
+        self.bounds = sorted(set([first for first, last, value in intervals] + [last + 1 for first, last, value in intervals]))
+
+        self.size = 1
+        while self.size < len(self.bounds):
+            self.size *= 2
+
+        self.nodes = {}
+        for first, last, value in intervals:
+            left = bisect.bisect_left(self.bounds, first) + self.size
+            right = bisect.bisect_left(self.bounds, last + 1) + self.size
+            while left < right:
+                if left & 1:
+                    self.nodes.setdefault(left, []).append(value)
+                    left += 1
+                if right & 1:
+                    right -= 1
+                    self.nodes.setdefault(right, []).append(value)
+                left >>= 1
+                right >>= 1
+
+    def stab(self, point):
+        """
+            Return the lists of values of the nodes covering point: their concatenation holds
+            the values of every interval including point, a value possibly appearing in several lists
+            when it was given several intervals
+        """
+        segment = bisect.bisect_right(self.bounds, point) - 1
+        if segment < 0:
+            return []
+
+        found = []
+        node = segment + self.size
+        while node:
+            if node in self.nodes:
+                found.append(self.nodes[node])
+            node >>= 1
+
+        return found
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    IP lookup: the address objects, groups and policies covering IPv4 addresses
+
+    The address objects of every VDOM are converted to integer ranges, cut into disjoint
+    segments by an interval index: looking up an address is a binary search over the segments
+    instead of a walk through every object. The groups and policies of the covering addresses are
+    computed once per segment, then shared by every address falling in it.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import io
+import sys
+import csv
+import os
+import time
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+from fgtokenizer import VDOM_KEY
+import fgpoliciestocsv
+import fgresolve
+import fgaddrtable
+import fginterval
+import fgcommon
+import fgcache
+import fgstats
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file, possibly gzip, xz or bzip2 compressed, "-" reading the standard input. Ex: fgfw.cfg')
+main_grp.add_option('-q', '--query', help='IPv4 address to look up. Can be repeated', action='append', default=[])
+main_grp.add_option('-l', '--query-file', help='File of IPv4 addresses to look up, one per line')
+main_grp.add_option('-o', '--output-file', help='Output csv file, compressed when ending with .gz, .xz or .bz2 (default ./lookup-out.csv)', default=path.abspath(path.join(os.getcwd(), './lookup-out.csv')))
+main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
+main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+parser.option_groups.extend([main_grp])
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
+
+# Columns of the output
+OUTPUT_KEYS = ['ip', 'addresses', 'groups', 'srcaddr_policies', 'dstaddr_policies']
+
+# Functions
+class Lookup(object):
+    """
+        IP to address objects, groups and policies
+    """
+
+    def __init__(self, resolver, policies):
+        """
+            @param resolver:  fgresolve.Resolver of the objects of a VDOM
+            @param policies:  list of the policies of the same VDOM, see fgpoliciestocsv.parse()
+        """
+        self.resolver = resolver
+
+        addresses = dict(resolver.addresses)
+        # "all" is built-in, even when the configuration does not list it
+        if not('all' in addresses):
+            addresses['all'] = {'name': 'all'}
+
+        self.table = fgaddrtable.AddressTable(addresses.values())
+        self.index = fginterval.IntervalIndex(self.table.iter_ranges())
+        self.memo = {}
+        self.groups = resolver.containing_groups()
+
+        # object name -> positions in the rulebase of the policies referencing it, per address key
+        self.policy_ids = [policy.get(fgpoliciestocsv.ID_KEY, '') for policy in policies]
+        self.policies = dict((key, {}) for key in fgresolve.ADDRESS_KEYS)
+        for position, policy in enumerate(policies):
+            for key in fgresolve.ADDRESS_KEYS:
+                for name in resolver.members(policy.get(key, '')):
+                    self.policies[key].setdefault(name, []).append(position)
+
+    def match(self, addresses):
+        """
+            Return the groups and policies columns of a tuple of covering addresses, the policies in rulebase order
+        """
+        groups = set()
+        for address in addresses:
+            groups.update(self.groups.get(address, ()))
+        groups = sorted(groups)
+
+        result = {'addresses': ' '.join(addresses), 'groups': ' '.join(groups)}
+        for key in fgresolve.ADDRESS_KEYS:
+            positions = set()
+            for name in list(addresses) + groups:
+                positions.update(self.policies[key].get(name, ()))
+            result[key + '_policies'] = ' '.join(self.policy_ids[position] for position in sorted(positions))
+
+        return result
+
+    def query(self, ip):
+        """
+            Look up an IPv4 address
+
+            @rtype: return a dict with the OUTPUT_KEYS, or None for an invalid address
+        """
+        value = fgresolve.ip_to_int(ip.strip())
+        if value is None:
+            return None
+
+        addresses = self.index.lookup(value)
+
+        # the addresses of a segment are shared by every IP falling in it
+        if not(addresses in self.memo):
+            self.memo[addresses] = self.match(addresses)
+
+        result = dict(self.memo[addresses])
+        result['ip'] = ip.strip()
+
+        return result
+
+
+def load_lookups(options):
+    """
+        Parse the addresses, groups and policies of options.input_file and return their lookup index
+
+        @rtype: return (fgresolve.VdomResolvers, OrderedDict of VDOM (None outside of a VDOM) -> Lookup of its objects and policies)
+    """
+    resolvers = fgresolve.load_resolver(options)
+    policies, policy_keys = fgcommon.parse_input(fgpoliciestocsv, options)
+
+    vdom_policies = fgresolve.group_by_vdom(policies)
+    vdoms = list(resolvers.resolvers) + [vdom for vdom in vdom_policies if not(vdom in resolvers.resolvers)]
+
+    lookups = OrderedDict()
+    with fgstats.phase('build'):
+        for vdom in vdoms:
+            lookups[vdom] = Lookup(resolvers.resolver(vdom), vdom_policies.get(vdom, []))
+
+    return (resolvers, lookups)
+
+
+def iter_queries(options):
+    """
+        Yield the addresses to look up, from the options then from the query file
+    """
+    for ip in options.query:
+        yield ip
+
+    if options.query_file:
+        with io.open(options.query_file, mode='r', encoding='utf-8') as fd_queries:
+            for line in fd_queries:
+                line = line.strip()
+                if line and not(line.startswith('#')):
+                    yield line
+
+
+def generate_csv(lookups, queries, options):
+    """
+        Generate a plain csv file, one line per looked up address, and per VDOM in a multi-VDOM configuration
+
+        @param lookups:  OrderedDict of VDOM -> Lookup, see load_lookups()
+        @rtype: return the number of looked up addresses
+    """
+    count = 0
+
+    keys = OUTPUT_KEYS
+    if any(vdom is not None for vdom in lookups):
+        keys = [VDOM_KEY] + OUTPUT_KEYS
+
+    with fgcommon.open_output(options.output_file, options) as fd_output:
+        spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+        if not(options.skip_header):
+            spamwriter.writerow(keys)
+
+        for ip in queries:
+            if fgresolve.ip_to_int(ip.strip()) is None:
+                print('[!] Invalid IPv4 address "%s"' % ip, file=sys.stderr)
+                continue
+
+            for vdom, lookup in lookups.items():
+                result = lookup.query(ip)
+                result[VDOM_KEY] = vdom or ''
+                spamwriter.writerow([result[key] for key in keys])
+            count += 1
+
+    return count
+
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    if (options.input_file == None):
+        parser.error('Please specify a valid input file')
+
+    if not(options.query) and not(options.query_file):
+        parser.error('Please specify at least an address to look up')
+
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    try:
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    resolvers, lookups = load_lookups(options)
+
+    start = time.time()
+    with fgstats.phase('write'):
+        count = generate_csv(lookups, iter_queries(options), options)
+    elapsed = max(time.time() - start, 1e-6)
+
+    print('[+] %d address(es) looked up in %.2fs against %d object interval(s)' % (count, elapsed, sum(len(lookup.index.starts) for lookup in lookups.values())), file=sys.stderr)
+
+    fgresolve.print_cycles(resolvers)
+    fgcache.print_stats(options)
+    fgstats.finish(options)
+
+    return None
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Output backends next to csv: JSON Lines, SQLite, Parquet and Arrow
+
+    A writer receives the entries one at a time, as the csv writer of the extractors does, so that
+    the streaming mode keeps a flat memory usage: JSON Lines entries are written at once, SQLite
+    and Parquet/Arrow ones are buffered into batches. A missing setting is written as a null value,
+    and the integer columns (the policy id) are typed.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import json
+import sqlite3
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# OptionParser imports
+from optparse import OptionGroup
+
+import fgcompress
+
+CSV = 'csv'
+JSONL = 'jsonl'
+SQLITE = 'sqlite'
+PARQUET = 'parquet'
+ARROW = 'arrow'
+
+FORMATS = [CSV, JSONL, SQLITE, PARQUET, ARROW]
+
+# Extension of the default output file of every format
+EXTENSIONS = {
+    CSV: '.csv',
+    JSONL: '.jsonl',
+    SQLITE: '.sqlite',
+    PARQUET: '.parquet',
+    ARROW: '.arrow',
+}
+
+# Output file extensions recognized when no format is given
+GUESSED_FORMATS = {
+    '.csv': CSV,
+    '.jsonl': JSONL,
+    '.ndjson': JSONL,
+    '.sqlite': SQLITE,
+    '.sqlite3': SQLITE,
+    '.db': SQLITE,
+    '.parquet': PARQUET,
+    '.arrow': ARROW,
+    '.feather': ARROW,
+}
+
+# Formats writing a binary file, which cannot be compressed by its extension
+BINARY_FORMATS = [SQLITE, PARQUET, ARROW]
+
+# JSON Lines files are always UTF-8, without a byte order mark
+JSONL_ENCODING = 'utf-8'
+
+# Columns indexed in a SQLite table, when present
+SQLITE_INDEX_KEYS = ['device', 'id', 'name']
+
+SQLITE_BATCH_SIZE = 10000
+ARROW_BATCH_SIZE = 65536
+
+# Functions
+def add_output_options(parser):
+    """
+        Add the output format options to an OptionParser
+    """
+    output_grp = OptionGroup(parser, 'Output parameters')
+    output_grp.add_option('--format', dest='output_format', help='Output format among "%s" (default: guessed from the output file extension, else csv). parquet and arrow need pyarrow' % ','.join(FORMATS), choices=FORMATS)
+    parser.option_groups.extend([output_grp])
+
+    return output_grp
+
+
+def output_format(options):
+    """
+        Return the output format of the options, csv when there is none
+    """
+    return getattr(options, 'output_format', None) or CSV
+
+
+def extension(options):
+    """
+        Return the output file extension of the options format, ".csv" for csv
+    """
+    return EXTENSIONS[output_format(options)]
+
+
+def guess_format(output_file):
+    """
+        Return the format of an output file according to its extension, ignoring a compression extension, or None
+    """
+    return GUESSED_FORMATS.get(path.splitext(fgcompress.strip_extension(output_file))[1].lower())
+
+
+def check_options(options, default_output_file=None):
+    """
+        Settle the output format of the options, raising a ValueError when it cannot be written
+
+        Without --format, the format is guessed from the output file extension.
+        With it, a default output file gets the extension of the format.
+
+        @param default_output_file:  default value of the --output-file option, if any
+    """
+    output_file = getattr(options, 'output_file', None)
+
+    if options.output_format is None:
+        options.output_format = (guess_format(output_file) if output_file else None) or CSV
+
+    elif output_file and output_file == default_output_file:
+        options.output_file = path.splitext(output_file)[0] + EXTENSIONS[options.output_format]
+
+    if options.output_format in BINARY_FORMATS and output_file and fgcompress.output_compression(options.output_file):
+        raise ValueError('The %s format cannot be compressed by the output file extension' % options.output_format)
+
+    if options.output_format in (PARQUET, ARROW) and pyarrow is None:
+        raise ValueError('The %s format needs pyarrow: pip install pyarrow' % options.output_format)
+
+    return None
+
+
+def typed_value(value, integer):
+    """
+        Return a value of an entry as written by the typed backends: None when missing, an int for an integer column
+    """
+    if integer and value is not None:
+        try:
+            return int(value)
+        except ValueError:
+            pass
+
+    return value
+
+
+def quote_identifier(name):
+    """
+        Quote a table or column name for SQLite
+    """
+    return u'"%s"' % name.replace(u'"', u'""')
+
+
+class JsonLinesWriter(object):
+    """
+        Write every entry as a JSON object on its own line, its keys following the columns order
+    """
+
+    def __init__(self, output_file, keys, table, integer_keys):
+        self.keys = keys
+        self.integer_keys = frozenset(integer_keys)
+        self.fd_output = fgcompress.open_output(output_file, 'w', JSONL_ENCODING)
+
+    def write(self, record):
+        entry = OrderedDict((key, typed_value(record[key], key in self.integer_keys)) for key in self.keys if key in record)
+        self.fd_output.write(u'%s\n' % json.dumps(entry, ensure_ascii=False))
+
+        return None
+
+    def close(self):
+        self.fd_output.close()
+
+        return None
+
+    def abort(self):
+        return self.close()
+
+
+class SQLiteWriter(object):
+    """
+        Write the entries into a table of a SQLite database, replacing it
+
+        The rows are inserted with executemany() by batches inside a single transaction,
+        the indexes being created once the table is filled.
+    """
+
+    def __init__(self, output_file, keys, table, integer_keys):
+        self.keys = keys
+        self.integer = [key in integer_keys for key in keys]
+        self.table = table
+        self.batch = []
+
+        # transactions are handled explicitly
+        self.connection = sqlite3.connect(output_file, isolation_level=None)
+        self.connection.execute('BEGIN')
+        self.connection.execute(u'DROP TABLE IF EXISTS %s' % quote_identifier(table))
+        self.connection.execute(u'CREATE TABLE %s (%s)' % (quote_identifier(table), u', '.join(u'%s %s' % (quote_identifier(key), u'INTEGER' if integer else u'TEXT') for key, integer in zip(keys, self.integer))))
+        self.insert = u'INSERT INTO %s VALUES (%s)' % (quote_identifier(table), u', '.join([u'?'] * len(keys)))
+
+    def write(self, record):
+        self.batch.append(tuple(typed_value(record.get(key), integer) for key, integer in zip(self.keys, self.integer)))
+        if len(self.batch) >= SQLITE_BATCH_SIZE:
+            self.flush()
+
+        return None
+
+    def flush(self):
+        if self.batch:
+            self.connection.executemany(self.insert, self.batch)
+            self.batch = []
+
+        return None
+
+    def close(self):
+        self.flush()
+
+        for key in SQLITE_INDEX_KEYS:
+            if key in self.keys:
+                self.connection.execute(u'CREATE INDEX %s ON %s (%s)' % (quote_identifier(u'%s_%s' % (self.table, key)), quote_identifier(self.table), quote_identifier(key)))
+
+        self.connection.execute('COMMIT')
+        self.connection.close()
+
+        return None
+
+    def abort(self):
+        self.connection.execute('ROLLBACK')
+        self.connection.close()
+
+        return None
+
+
+class ArrowWriter(object):
+    """
+        Write the entries into a Parquet file or an Arrow IPC file, by record batches of string columns
+    """
+
+    def __init__(self, output_file, keys, table, integer_keys, parquet=True):
+        self.keys = keys
+        self.integer = [key in integer_keys for key in keys]
+        self.schema = pyarrow.schema([(key, pyarrow.int64() if integer else pyarrow.string()) for key, integer in zip(keys, self.integer)])
+        self.columns = [[] for key in keys]
+        self.size = 0
+
+        self.sink = None
+        if parquet:
+            self.writer = pyarrow.parquet.ParquetWriter(output_file, self.schema)
+        else:
+            self.sink = pyarrow.OSFile(output_file, 'wb')
+            self.writer = pyarrow.ipc.new_file(self.sink, self.schema)
+
+    def write(self, record):
+        for column, key, integer in zip(self.columns, self.keys, self.integer):
+            column.append(typed_value(record.get(key), integer))
+
+        self.size += 1
+        if self.size >= ARROW_BATCH_SIZE:
+            self.flush()
+
+        return None
+
+    def flush(self):
+        if self.size:
+            self.writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(column, type=field.type) for column, field in zip(self.columns, self.schema)], schema=self.schema))
+            self.columns = [[] for key in self.keys]
+            self.size = 0
+
+        return None
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+
+        return None
+
+    def abort(self):
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+
+        return None
+
+
+def open_writer(output_file, keys, options, table, integer_keys=()):
+    """
+        Open the writer of the options format, other than csv
+
+        @param keys:  columns of the output
+        @param table:  name of the SQLite table. Ex: "policies"
+        @param integer_keys:  columns holding integers. Ex: ['id']
+    """
+    name = output_format(options)
+
+    if name == JSONL:
+        return JsonLinesWriter(output_file, keys, table, integer_keys)
+
+    if name == SQLITE:
+        return SQLiteWriter(output_file, keys, table, integer_keys)
+
+    if name in (PARQUET, ARROW):
+        return ArrowWriter(output_file, keys, table, integer_keys, parquet=(name == PARQUET))
+
+    raise ValueError('Unknown output format "%s"' % name)
+
+
+def write_records(records, keys, options, table, integer_keys=()):
+    """
+        Write entries to options.output_file in the options format, other than csv
+
+        @param records:  iterable of entries ( {'id' : '1', 'srcintf' : 'internal', ...} ), possibly a generator
+        @rtype: return the number of written entries
+    """
+    writer = open_writer(options.output_file, keys, options, table, integer_keys)
+
+    count = 0
+    try:
+        for record in records:
+            writer.write(record)
+            count += 1
+    except Exception:
+        writer.abort()
+        raise
+
+    writer.close()
+
+    return count
@@ -24,12 +24,23 @@ from __future__ import division
 from __future__ import print_function
 
 from os import path 
-import io
 import sys
 import re
 import csv
 import os
 
+from fgtokenizer import tokenize_lines
+import fgtree
+import fgstore
+import fgcommon
+import fgcache
+import fgstats
+import fgoutput
+import fgselect
+import fgresolve
+import fgexplode
+import fghits
+
 # OptionParser imports
 from optparse import OptionParser
 from optparse import OptionGroup
@@ -38,14 +49,23 @@ from optparse import OptionGroup
 parser = OptionParser(usage="%prog [options]")
 
 main_grp = OptionGroup(parser, 'Main parameters')
-main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file. Ex: fgfw.cfg')
-main_grp.add_option('-o', '--output-file', help='Output csv file (default ./policies-out.csv)', default=path.abspath(path.join(os.getcwd(), './policies-out.csv')))
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file, possibly gzip, xz or bzip2 compressed, "-" reading the standard input. Ex: fgfw.cfg')
+main_grp.add_option('-o', '--output-file', help='Output csv file, compressed when ending with .gz, .xz or .bz2 (default ./policies-out.csv)', default=path.abspath(path.join(os.getcwd(), './policies-out.csv')))
 main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
 main_grp.add_option('-n', '--newline', help='Insert a newline between each policy for better readability', action='store_true', default=False)
 main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
 main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
 main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+main_grp.add_option('--expand', help='Add the addresses and subnets behind srcaddr and dstaddr, recursively flattening the address groups', action='store_true', default=False)
+main_grp.add_option('-j', '--jobs', help='Number of worker processes parsing the policy blocks in parallel (default 1)', type='int', default=1)
 parser.option_groups.extend([main_grp])
+fgcommon.add_stream_options(parser)
+fgoutput.add_output_options(parser)
+fgselect.add_select_options(parser)
+fgexplode.add_explode_options(parser)
+fghits.add_hits_options(parser)
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
 
 # Python 2 and 3 compatibility
 if (sys.version_info < (3, 0)):
@@ -56,119 +76,115 @@ else:
     fd_write_options = 'w'
 
 # Handful patterns
-# -- Entering policy definition block
-p_entering_policy_block = re.compile(r'^\s*config firewall policy$', re.IGNORECASE)
-p_entering_subpolicy_block = re.compile(r'^\s*config .*$', re.IGNORECASE)
+# -- Entering policy definition block, matched against the name of a "config" line
+p_entering_policy_block = re.compile(r'^firewall policy$', re.IGNORECASE)
+p_entering_block = p_entering_policy_block
 
-# -- Exiting policy definition block
-p_exiting_policy_block = re.compile(r'^end$', re.IGNORECASE)
+# Key identifying an entry, from its "edit" line
+ID_KEY = u'id'
 
-# -- Commiting the current policy definition and going to the next one
-p_policy_next = re.compile(r'^next$', re.IGNORECASE)
+# Columns holding integers, typed by the other output formats than csv
+INTEGER_KEYS = [ID_KEY, fghits.HITS_KEY]
 
-# -- Policy number
-p_policy_number = re.compile(r'^\s*edit\s+(?P<policy_number>\d+)', re.IGNORECASE)
+# Functions
+def iter_entry_records(entries, order_keys, selection=None):
+    """
+        View the entries of the configuration tree as policy records
+        
+        @param entries:  iterable of (vdom, section name, fgtree.Entry) tuples, see fgtree.iter_entries()
+        @param order_keys:  list of seen keys, extended in place with the new keys found ['id', 'srcintf', 'dstintf', ...]
+        @param selection:  optional fgselect.Selection, yielding the entries it accepts
+        @rtype: yield every policy ( {'id' : '1', 'srcintf' : 'internal', ...} )
+    """
+    # only the numeric entry names are policy ids
+    return fgcommon.iter_entry_records(entries, order_keys, ID_KEY, selection, numeric_id=True)
 
-# -- Policy setting
-p_policy_set = re.compile(r'^\s*set\s+(?P<policy_key>\S+)\s+(?P<policy_value>.*)$', re.IGNORECASE)
 
-# Functions
-def parse(options):
+def iter_records(tokens, order_keys, selection=None):
     """
-        Parse the data according to several regexes
+        Parse the data according to the tokenized lines
         
-        @param options:  options
-        @rtype: return a list of policies ( [ {'id' : '1', 'srcintf' : 'internal', ...}, {'id' : '2', 'srcintf' : 'external', ...}, ... ] )  
-                and the list of unique seen keys ['id', 'srcintf', 'dstintf', ...]
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @param order_keys:  list of seen keys, extended in place with the new keys found ['id', 'srcintf', 'dstintf', ...]
+        @param selection:  optional fgselect.Selection, only storing its columns and yielding the entries it accepts
+        @rtype: yield every policy as soon as it is complete ( {'id' : '1', 'srcintf' : 'internal', ...} )
     """
-    global p_entering_policy_block, p_exiting_policy_block, p_policy_next, p_policy_number, p_policy_set
+    global p_entering_policy_block
     
-    in_policy_block = False
-    skip_ssl_vpn_policy_block = False
-    inspect_next_ssl_vpn_command = False
+    stored = selection.stored if selection is not None else None
+    entries = fgtree.iter_entries(tokens, [p_entering_policy_block], stored)
     
-    policy_list = []
-    policy_elem = {}
+    return iter_entry_records(entries, order_keys, selection)
+
+
+def parse_tokens(tokens, selection=None):
+    """
+        Parse the data according to the tokenized lines
+        
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @param selection:  optional fgselect.Selection, see iter_records()
+        @rtype: return a fgstore.RecordStore of policies ( [ {'id' : '1', 'srcintf' : 'internal', ...}, {'id' : '2', 'srcintf' : 'external', ...}, ... ] )  
+                and the list of unique seen keys ['id', 'srcintf', 'dstintf', ...]
+    """
+    # the selected columns come first, in their given order
+    order_keys = list(selection.columns) if (selection is not None and selection.columns is not None) else []
+    policy_list = fgstore.RecordStore(fgstats.counted(iter_records(tokens, order_keys, selection)))
     
-    order_keys = []
+    return (policy_list, order_keys)
+
+
+def parse_lines(lines, selection=None):
+    """
+        Parse an iterable of configuration lines (file object, list, ...)
+        
+        @param lines:  iterable of configuration lines
+        @param selection:  optional fgselect.Selection, see iter_records()
+        @rtype: see parse_tokens()
+    """
+    return parse_tokens(tokenize_lines(lines), selection)
+
+
+def parse(options):
+    """
+        Parse the input file
+        
+        @param options:  options
+        @rtype: see parse_lines()
+    """
+    return parse_lines(fgcommon.iter_input_lines(options, [p_entering_block]), fgselect.selection(options))
+
+
+def format_row(policy, keys):
+    """
+        Return the csv row of a policy, following the order of keys
+    """
+    output_line = []
     
-    with io.open(options.input_file, mode=fd_read_options, encoding=options.input_encoding) as fd_input:
-        for line in fd_input:
-            line = line.strip()
-            
-            # We match a policy block
-            if p_entering_policy_block.search(line):
-                in_policy_block = True
-            
-            # We are entering a subconfig inside a ssl-vpn action and we want to skip it
-            if inspect_next_ssl_vpn_command and not(p_entering_subpolicy_block.search(line)):
-                skip_ssl_vpn_policy_block = False
-                inspect_next_ssl_vpn_command = False
-            
-            elif inspect_next_ssl_vpn_command and p_entering_subpolicy_block.search(line):
-                inspect_next_ssl_vpn_command = False
-                skip_ssl_vpn_policy_block = True
-            
-            # We are in a policy block
-            if in_policy_block:
-                if p_policy_number.search(line) and not(skip_ssl_vpn_policy_block):
-                    policy_number = p_policy_number.search(line).group('policy_number')
-                    policy_elem[u'id'] = policy_number
-                    if not('id' in order_keys):
-                        order_keys.append(u'id')
-                
-                # We match a setting
-                if p_policy_set.search(line) and not(skip_ssl_vpn_policy_block):
-                    policy_key = p_policy_set.search(line).group('policy_key')
-                    if not(policy_key in order_keys):
-                        order_keys.append(policy_key)
-                    
-                    policy_value = p_policy_set.search(line).group('policy_value').strip()
-                    policy_value = re.sub('["]', '', policy_value)
-                    
-                    
-                    policy_elem[policy_key] = policy_value
-                    if policy_key == 'action' and policy_value == 'ssl-vpn':
-                        inspect_next_ssl_vpn_command = True
-                        skip_ssl_vpn_policy_block = True
-                
-                # We are done with the current policy id
-                if p_policy_next.search(line) and not(skip_ssl_vpn_policy_block):
-                    policy_list.append(policy_elem)
-                    policy_elem = {}
-                    
-            
-            # We are exiting the policy block
-            if p_exiting_policy_block.search(line):
-                if skip_ssl_vpn_policy_block == True:
-                    skip_ssl_vpn_policy_block = False
-                else:
-                    in_policy_block = False
+    for key in keys:
+        if key in policy:
+            output_line.append(policy[key])
+        else:
+            output_line.append('')
     
-    return (policy_list, order_keys)
+    return output_line
 
 
 def generate_csv(results, keys, options):
     """
-        Generate a plain csv file
+        Generate a plain csv file, or a file of the --format output format
     """
-    if results and keys:
-        with io.open(options.output_file, mode=fd_write_options, encoding=options.output_encoding) as fd_output:
+    if results and keys and fgoutput.output_format(options) != fgoutput.CSV:
+        fgoutput.write_records(results, keys, options, u'policies', INTEGER_KEYS)
+    
+    elif results and keys:
+        with fgcommon.open_output(options.output_file, options) as fd_output:
             spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
             
             if not(options.skip_header):
                 spamwriter.writerow(keys)
             
-            for policy in results:
-                output_line = []
-                
-                for key in keys:
-                    if key in policy.keys():
-                        output_line.append(policy[key])
-                    else:
-                        output_line.append('')
-            
-                spamwriter.writerow(output_line)
+            for row in fgstore.iter_rows(results, keys, format_row):
+                spamwriter.writerow(row)
                 if options.newline:
                     spamwriter.writerow('')
         
@@ -190,8 +206,62 @@ def main():
     if (sys.version_info < (3, 0)):
         options.output_encoding = None
     
-    results, keys = parse(options)
-    generate_csv(results, keys, options)
+    try:
+        fgoutput.check_options(options, parser.defaults['output_file'])
+        fgselect.check_options(options)
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    resolver = None
+    if options.expand:
+        resolver = fgresolve.load_resolver(options)
+    
+    hits = None
+    if options.logs:
+        hits = fghits.load_hits(options)
+    
+    # the columns added to every policy before writing it
+    transforms = []
+    if resolver:
+        transforms.append((resolver.expand_record, fgresolve.expand_keys))
+    if hits is not None:
+        transforms.append((hits.add_hits, fghits.hit_keys))
+    transform, transform_keys = fgcommon.chain_transforms(transforms)
+    
+    exploder = None
+    if options.explode:
+        exploder = fgexplode.load_exploder(options)
+    
+    if options.split_vdoms:
+        with fgstats.phase('stream'):
+            fgcommon.write_vdoms(sys.modules[__name__], options, transform, transform_keys, exploder)
+    elif options.stream:
+        with fgstats.phase('stream'):
+            fgcommon.stream_csv(sys.modules[__name__], options, transform, transform_keys, exploder)
+    else:
+        results, keys = fgcommon.parse_input(sys.modules[__name__], options)
+        if transform:
+            with fgstats.phase('expand'):
+                results = fgstore.RecordStore(transform(policy) for policy in results)
+                keys = transform_keys(keys)
+        if exploder:
+            with fgstats.phase('count'):
+                exploder.report(results)
+            # the rows are generated while writing them
+            if results:
+                results = exploder.explode_all(results)
+        with fgstats.phase('write'):
+            generate_csv(results, keys, options)
+    
+    if resolver:
+        fgresolve.print_cycles(resolver)
+    
+    if hits is not None:
+        fghits.print_summary(hits)
+    
+    fgcache.print_stats(options)
+    fgstats.finish(options)
     
     return None
 
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import io
+import sys
+import csv
+import os
+import copy
+import time
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+from fgtokenizer import VDOM_KEY
+import fgpoliciestocsv
+import fgservicestocsv
+import fgresolve
+import fgports
+import fgcommon
+import fgcache
+import fgstats
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file, possibly gzip, xz or bzip2 compressed, "-" reading the standard input. Ex: fgfw.cfg')
+main_grp.add_option('-q', '--query', help='Port to look up: "[<protocol>/]<port>[:<source port>]", the protocol among "%s" being tcp by default. Ex: udp/53. Can be repeated' % ','.join(fgports.PORT_PROTOCOLS), action='append', default=[])
+main_grp.add_option('-l', '--query-file', help='File of ports to look up, one per line')
+main_grp.add_option('-o', '--output-file', help='Output csv file, compressed when ending with .gz, .xz or .bz2 (default ./portlookup-out.csv)', default=path.abspath(path.join(os.getcwd(), './portlookup-out.csv')))
+main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
+main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+parser.option_groups.extend([main_grp])
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
+
+# Columns of the output
+OUTPUT_KEYS = ['port', 'services', 'groups', 'policies']
+
+# Built-in service allowing everything, even when the configuration does not list it
+ALL_SERVICE = {'name': 'ALL', 'protocol': 'IP'}
+
+# Functions
+class PortLookup(object):
+    """
+        Port to services, service groups and policies
+    """
+
+    def __init__(self, services, policies):
+        """
+            @param services:  list of the services and service groups of a VDOM, see fgservicestocsv.parse()
+            @param policies:  list of the policies of the same VDOM, see fgpoliciestocsv.parse()
+        """
+        self.services = dict((service.get('name'), service) for service in services if not('member' in service))
+        if not('ALL' in self.services):
+            self.services['ALL'] = ALL_SERVICE
+
+        service_groups = [service for service in services if 'member' in service]
+        self.resolver = fgresolve.Resolver(self.services.values(), service_groups)
+
+        self.index = fgports.PortIndex(self.services.items())
+        self.memo = {}
+        self.groups = self.resolver.containing_groups()
+
+        # service or group name -> positions in the rulebase of the policies referencing it
+        self.policy_ids = [policy.get(fgpoliciestocsv.ID_KEY, '') for policy in policies]
+        self.policies = {}
+        for position, policy in enumerate(policies):
+            for name in self.resolver.members(policy.get('service', '')):
+                self.policies.setdefault(name, []).append(position)
+
+    def match(self, services):
+        """
+            Return the groups and policies columns of a tuple of allowing services, the policies in rulebase order
+        """
+        groups = set()
+        for service in services:
+            groups.update(self.groups.get(service, ()))
+        groups = sorted(groups)
+
+        positions = set()
+        for name in list(services) + groups:
+            positions.update(self.policies.get(name, ()))
+
+        return {'services': ' '.join(services), 'groups': ' '.join(groups), 'policies': ' '.join(self.policy_ids[position] for position in sorted(positions))}
+
+    def query(self, query):
+        """
+            Look up a port, see fgports.parse_query()
+
+            @rtype: return a dict with the OUTPUT_KEYS, or None for an invalid query
+        """
+        parsed = fgports.parse_query(query)
+        if parsed is None:
+            return None
+
+        services = self.index.lookup(*parsed)
+
+        # the services of a segment are shared by every port falling in it
+        if not(services in self.memo):
+            self.memo[services] = self.match(services)
+
+        result = dict(self.memo[services])
+        result['port'] = query.strip()
+
+        return result
+
+
+def load_lookups(options):
+    """
+        Parse the services and policies of options.input_file and return their lookup index
+
+        @rtype: return an OrderedDict of VDOM (None outside of a VDOM) -> PortLookup of its services and policies
+    """
+    object_options = copy.copy(options)
+    object_options.jobs = 1
+    services, service_keys = fgcommon.parse_input(fgservicestocsv, object_options)
+    policies, policy_keys = fgcommon.parse_input(fgpoliciestocsv, options)
+
+    # the policies of a VDOM only reference the services of that VDOM
+    vdom_services = fgresolve.group_by_vdom(services)
+    vdom_policies = fgresolve.group_by_vdom(policies)
+    vdoms = list(vdom_services) + [vdom for vdom in vdom_policies if not(vdom in vdom_services)]
+
+    lookups = OrderedDict()
+    with fgstats.phase('build'):
+        for vdom in vdoms:
+            lookups[vdom] = PortLookup(vdom_services.get(vdom, []), vdom_policies.get(vdom, []))
+
+    return lookups
+
+
+def iter_queries(options):
+    """
+        Yield the ports to look up, from the options then from the query file
+    """
+    for query in options.query:
+        yield query
+
+    if options.query_file:
+        with io.open(options.query_file, mode='r', encoding='utf-8') as fd_queries:
+            for line in fd_queries:
+                line = line.strip()
+                if line and not(line.startswith('#')):
+                    yield line
+
+
+def generate_csv(lookups, queries, options):
+    """
+        Generate a plain csv file, one line per looked up port, and per VDOM in a multi-VDOM configuration
+
+        @param lookups:  OrderedDict of VDOM -> PortLookup, see load_lookups()
+        @rtype: return the number of looked up ports
+    """
+    count = 0
+
+    keys = OUTPUT_KEYS
+    if any(vdom is not None for vdom in lookups):
+        keys = [VDOM_KEY] + OUTPUT_KEYS
+
+    with fgcommon.open_output(options.output_file, options) as fd_output:
+        spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+        if not(options.skip_header):
+            spamwriter.writerow(keys)
+
+        for query in queries:
+            if fgports.parse_query(query) is None:
+                print('[!] Invalid port "%s"' % query, file=sys.stderr)
+                continue
+
+            for vdom, lookup in lookups.items():
+                result = lookup.query(query)
+                result[VDOM_KEY] = vdom or ''
+                spamwriter.writerow([result[key] for key in keys])
+            count += 1
+
+    return count
+
+
+def print_cycles(lookups):
+    """
+        Report the service group cycles on stderr
+    """
+    for vdom, lookup in lookups.items():
+        for cycle in lookup.resolver.cycles:
+            print('[!] Service group cycle%s: %s' % (' in VDOM %s' % vdom if vdom is not None else '', ' -> '.join(cycle)), file=sys.stderr)
+
+    return None
+
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    if (options.input_file == None):
+        parser.error('Please specify a valid input file')
+
+    if not(options.query) and not(options.query_file):
+        parser.error('Please specify at least a port to look up')
+
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    try:
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    lookups = load_lookups(options)
+
+    start = time.time()
+    with fgstats.phase('write'):
+        count = generate_csv(lookups, iter_queries(options), options)
+    elapsed = max(time.time() - start, 1e-6)
+
+    print('[+] %d port(s) looked up in %.2fs against %d service port range(s)' % (count, elapsed, sum(len(lookup.index) for lookup in lookups.values())), file=sys.stderr)
+
+    print_cycles(lookups)
+    fgcache.print_stats(options)
+    fgstats.finish(options)
+
+    return None
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Port ranges of the service objects
+
+    The "tcp-portrange", "udp-portrange" and "sctp-portrange" settings of a service are lists of
+    "<destination>[:<source>]" items, each one being a port or a "first-last" range. They are parsed
+    into integer destination and source port intervals per protocol, and the services are indexed by
+    destination port: a port query is a binary search, see fginterval.IntervalIndex.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import fginterval
+
+# Port protocols, each one getting its own PORT_SPAN slice of the service integer line
+PORT_PROTOCOLS = ['tcp', 'udp', 'sctp']
+PORT_SPAN = 65536
+FULL_PORT_RANGES = [(0, 65535), (1, 65535)]
+FULL_PORT_RANGE = (0, 65535)
+
+# IP protocol numbers of the port protocols, for the "protocol IP" services
+PROTOCOL_NUMBERS = {'6': 'tcp', '17': 'udp', '132': 'sctp'}
+
+# Functions
+def port_interval(value):
+    """
+        Return the (first, last) interval of a "80" or "1000-2000" port range, or None
+    """
+    bounds = value.split('-')
+    if len(bounds) > 2 or not(all(bound.isdigit() for bound in bounds)):
+        return None
+
+    first, last = int(bounds[0]), int(bounds[-1])
+    return (min(first, last), max(first, last))
+
+
+def parse_port_items(value):
+    """
+        Parse a "<dst>[:<src>] ..." port range setting
+
+        @rtype: return a list of (item, destination interval, source interval) tuples, a missing source meaning
+                any source port and an invalid item having None intervals
+    """
+    items = []
+    for item in value.split():
+        destination, separator, source = item.partition(':')
+        destination_interval = port_interval(destination)
+        source_interval = port_interval(source) if source else FULL_PORT_RANGE
+        if destination_interval is None or source_interval is None:
+            items.append((item, None, None))
+        else:
+            items.append((item, destination_interval, source_interval))
+
+    return items
+
+
+def parse_portrange(protocol, value):
+    """
+        Parse a "<dst>[:<src>] ..." port range setting of a port protocol
+
+        A range restricted to some source ports is kept opaque: it only covers the very same range.
+
+        @rtype: return (list of intervals on the service integer line, set of opaque items)
+    """
+    offset = PORT_PROTOCOLS.index(protocol) * PORT_SPAN
+
+    intervals = []
+    opaque = set()
+    for item, destination, source in parse_port_items(value):
+        if destination is None or not(source in FULL_PORT_RANGES):
+            opaque.add((protocol, item))
+            continue
+
+        intervals.append((offset + destination[0], offset + destination[1]))
+
+    return (intervals, opaque)
+
+
+def service_ports(service):
+    """
+        Return the port intervals allowed by a service object
+
+        @param service:  service entry, see fgservicestocsv.parse()
+        @rtype: return a list of (protocol, destination interval, source interval) tuples, empty for the
+                services without ports (ICMP, other IP protocols, groups, ...)
+    """
+    protocol = service.get('protocol', 'TCP/UDP/SCTP').upper()
+
+    if protocol == 'IP':
+        number = service.get('protocol-number', '0')
+        if number == '0':
+            return [(port_protocol, FULL_PORT_RANGE, FULL_PORT_RANGE) for port_protocol in PORT_PROTOCOLS]
+        if number in PROTOCOL_NUMBERS:
+            return [(PROTOCOL_NUMBERS[number], FULL_PORT_RANGE, FULL_PORT_RANGE)]
+        return []
+
+    ports = []
+    if protocol.startswith('TCP/UDP'):
+        for port_protocol in PORT_PROTOCOLS:
+            for item, destination, source in parse_port_items(service.get(port_protocol + '-portrange', '')):
+                if destination is not None:
+                    ports.append((port_protocol, destination, source))
+
+    return ports
+
+
+def parse_query(query):
+    """
+        Parse a "[<protocol>/]<port>[:<source port>]" query, the protocol being tcp by default. Ex: "udp/53", "443", "tcp/80:1024"
+
+        @rtype: return (protocol, destination port, source port or None), or None for an invalid query
+    """
+    protocol, separator, ports = query.strip().lower().rpartition('/')
+    protocol = protocol or 'tcp'
+    destination, separator, source = ports.partition(':')
+
+    if not(protocol in PORT_PROTOCOLS) or not(destination.isdigit()) or (source and not(source.isdigit())):
+        return None
+
+    destination = int(destination)
+    source = int(source) if source else None
+    if destination > 65535 or (source is not None and source > 65535):
+        return None
+
+    return (protocol, destination, source)
+
+
+class PortIndex(object):
+    """
+        Destination port to services, per protocol
+
+        Every port interval of every service is a row of a list, the stabbing index of a protocol
+        giving the rows covering a destination port; the source port intervals of the rows filter them.
+    """
+
+    def __init__(self, services):
+        """
+            @param services:  iterable of (name, service entry)
+        """
+        # row -> (name, source interval)
+        self.rows = []
+
+        intervals = dict((protocol, []) for protocol in PORT_PROTOCOLS)
+        for name, service in services:
+            for protocol, destination, source in service_ports(service):
+                intervals[protocol].append((destination[0], destination[1], len(self.rows)))
+                self.rows.append((name, source))
+
+        self.indexes = dict((protocol, fginterval.IntervalIndex(protocol_intervals)) for protocol, protocol_intervals in intervals.items())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def rows_of(self, protocol, port):
+        """
+            Return the tuple of the rows covering a destination port, shared by every port of the same segment
+        """
+        return self.indexes[protocol].lookup(port)
+
+    def lookup(self, protocol, port, source=None):
+        """
+            Return the sorted tuple of the names of the services allowing a destination port, from a source port when given
+        """
+        names = set()
+        for row in self.rows_of(protocol, port):
+            name, source_interval = self.rows[row]
+            if source is None or source_interval[0] <= source <= source_interval[1]:
+                names.add(name)
+
+        return tuple(sorted(names))
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Resolution of the address objects referenced by the policies
+
+    Nested address groups are recursively flattened into their addresses by a memoized
+    resolver: a group shared by thousands of policies is only resolved once, and cycles
+    between groups are detected and reported instead of looping forever.
+    Each VDOM has its own resolver, its policies only referencing its own objects.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import sys
+import copy
+
+from fgtokenizer import VDOM_KEY
+import fgaddressestocsv
+import fggroupstocsv
+import fgcommon
+
+# Policy keys referencing address objects
+ADDRESS_KEYS = ['srcaddr', 'dstaddr']
+
+# Columns added by the expand mode for every key of ADDRESS_KEYS
+EXPAND_SUFFIXES = ['_members', '_subnets']
+
+# Functions
+def split_names(value, known_names):
+    """
+        Split a multi-valued setting into object names
+
+        The tokenizer drops the quotes, so "set srcaddr "LAN net" "DMZ"" comes as "LAN net DMZ":
+        consecutive words are joined back when they form a known object name, the longest match first.
+
+        @param value:  setting value
+        @param known_names:  set of the existing object names
+        @rtype: return the list of names
+    """
+    words = value.split()
+    if not(words):
+        return []
+
+    if value in known_names:
+        return [value]
+
+    names = []
+    position = 0
+    while position < len(words):
+        for end in range(len(words), position, -1):
+            candidate = ' '.join(words[position:end])
+            if end == position + 1 or candidate in known_names:
+                names.append(candidate)
+                position = end
+                break
+
+    return names
+
+
+def mask_to_prefix(mask):
+    """
+        Return the prefix length of a contiguous dotted netmask, or None
+    """
+    try:
+        value = 0
+        for part in mask.split('.'):
+            value = (value << 8) | int(part)
+    except ValueError:
+        return None
+
+    binary = bin(value)[2:].zfill(32)
+    if len(binary) != 32 or '01' in binary:
+        return None
+
+    return binary.count('1')
+
+
+def ip_to_int(ip):
+    """
+        Return the integer value of a dotted IPv4 address, or None
+    """
+    parts = ip.split('.')
+    if len(parts) != 4:
+        return None
+
+    value = 0
+    try:
+        for part in parts:
+            part = int(part)
+            if part < 0 or part > 255:
+                return None
+            value = (value << 8) | part
+    except ValueError:
+        return None
+
+    return value
+
+
+def int_to_ip(value):
+    """
+        Return the dotted IPv4 address of an integer
+    """
+    return '.'.join(str((value >> shift) & 0xff) for shift in (24, 16, 8, 0))
+
+
+def address_interval(address):
+    """
+        Return the (first, last) integer addresses covered by an ipmask or iprange address object, or None
+    """
+    address_type = address.get('type', 'ipmask')
+
+    if address_type in ('ipmask', 'interface-subnet'):
+        subnet = address.get('subnet', '0.0.0.0 0.0.0.0').replace('/', ' ').split()
+        if len(subnet) != 2:
+            return None
+
+        network = ip_to_int(subnet[0])
+        if subnet[1].isdigit():
+            mask = (0xffffffff << (32 - int(subnet[1]))) & 0xffffffff if int(subnet[1]) <= 32 else None
+        else:
+            mask = ip_to_int(subnet[1])
+
+        if network is None or mask is None:
+            return None
+
+        network &= mask
+        return (network, network | (~mask & 0xffffffff))
+
+    if address_type == 'iprange':
+        first = ip_to_int(address.get('start-ip', ''))
+        last = ip_to_int(address.get('end-ip', ''))
+        if first is None or last is None:
+            return None
+        return (min(first, last), max(first, last))
+
+    return None
+
+
+def describe_address(address):
+    """
+        Return a short description of the addresses covered by an address object: "10.0.0.0/24", "10.0.1.10-10.0.1.20", "www.example.com", ...
+    """
+    if address.get(fgaddressestocsv.FAMILY_KEY) == fgaddressestocsv.IPV6:
+        address_type = address.get('type', 'ipprefix')
+        if address_type == 'ipprefix':
+            return address.get('ip6', '::/0')
+    else:
+        address_type = address.get('type', 'ipmask')
+
+    if address_type == 'ipmask':
+        subnet = address.get('subnet', '0.0.0.0 0.0.0.0').split()
+        if len(subnet) == 2:
+            prefix = mask_to_prefix(subnet[1])
+            if prefix is not None:
+                return '%s/%d' % (subnet[0], prefix)
+            return '%s/%s' % (subnet[0], subnet[1])
+        return ' '.join(subnet)
+
+    if address_type == 'iprange':
+        return '%s-%s' % (address.get('start-ip', ''), address.get('end-ip', ''))
+
+    if address_type == 'fqdn':
+        return address.get('fqdn', '')
+
+    if address_type == 'wildcard':
+        return '/'.join(address.get('wildcard', '').split())
+
+    if address_type == 'wildcard-fqdn':
+        return address.get('wildcard-fqdn', '')
+
+    if address_type == 'geography':
+        return 'geo:%s' % address.get('country', '')
+
+    return address_type
+
+
+class Resolver(object):
+    """
+        Memoized flattening of the address groups into addresses
+    """
+
+    def __init__(self, addresses, groups):
+        """
+            @param addresses:  list of addresses, see fgaddressestocsv.parse()
+            @param groups:  list of groups, see fggroupstocsv.parse()
+        """
+        # the policies srcaddr and dstaddr reference the IPv4 addresses
+        self.addresses = dict((address.get('name'), address) for address in addresses if address.get(fgaddressestocsv.FAMILY_KEY) != fgaddressestocsv.IPV6)
+        self.group_members = dict((group.get('name'), group.get('member', '')) for group in groups)
+        self.known_names = set(self.addresses) | set(self.group_members)
+
+        # name -> tuple of the flattened address names
+        self.memo = {}
+
+        # name -> description, see describe_address()
+        self.descriptions = {}
+
+        # setting value -> (flattened members, subnets) columns, policies sharing the same values
+        self.expanded = {}
+
+        # detected cycles, as lists of group names
+        self.cycles = []
+
+    def members(self, value):
+        """
+            Return the names referenced by a setting value
+        """
+        return split_names(value, self.known_names)
+
+    def resolve(self, name):
+        """
+            Flatten an object name into the tuple of the address names it covers, in order and without duplicates
+        """
+        if name in self.memo:
+            return self.memo[name]
+
+        return self.resolve_group(name, [])[0]
+
+    def resolve_group(self, name, resolving):
+        """
+            Depth-first flattening of name, resolving being the stack of the groups being flattened
+
+            @rtype: return (tuple of the address names, lowest position in resolving closing a cycle)
+        """
+        if name in self.memo:
+            return (self.memo[name], len(resolving))
+
+        if not(name in self.group_members):
+            return ((name,), len(resolving))
+
+        position = len(resolving)
+        resolving.append(name)
+
+        flattened = []
+        seen = set()
+        lowest = position
+        for member in self.members(self.group_members[name]):
+            if member in resolving:
+                cycle_start = resolving.index(member)
+                self.cycles.append(resolving[cycle_start:] + [member])
+                lowest = min(lowest, cycle_start)
+                continue
+
+            addresses, member_lowest = self.resolve_group(member, resolving)
+            lowest = min(lowest, member_lowest)
+            for address in addresses:
+                if not(address in seen):
+                    seen.add(address)
+                    flattened.append(address)
+
+        resolving.pop()
+
+        result = tuple(flattened)
+
+        # a group part of a cycle closing above it misses the members of the upper groups: only memoize complete results
+        if lowest >= position:
+            self.memo[name] = result
+
+        return (result, lowest)
+
+    def resolve_value(self, value):
+        """
+            Flatten a multi-valued setting into the tuple of the address names it covers
+        """
+        flattened = []
+        seen = set()
+        for name in self.members(value):
+            for address in self.resolve(name):
+                if not(address in seen):
+                    seen.add(address)
+                    flattened.append(address)
+
+        return tuple(flattened)
+
+    def describe(self, name):
+        """
+            Return the description of an address name, or the name itself for an unknown object
+        """
+        if not(name in self.descriptions):
+            if name in self.addresses:
+                self.descriptions[name] = describe_address(self.addresses[name])
+            else:
+                self.descriptions[name] = name
+
+        return self.descriptions[name]
+
+    def containing_groups(self):
+        """
+            Return a dict of address name -> set of the groups covering it, directly or through nested groups
+        """
+        groups = {}
+        for group in self.group_members:
+            for address in self.resolve(group):
+                groups.setdefault(address, set()).add(group)
+
+        return groups
+
+    def expand_record(self, record):
+        """
+            Add the flattened members and their subnets of the address keys of a policy
+        """
+        for key in ADDRESS_KEYS:
+            if key in record:
+                value = record[key]
+                if not(value in self.expanded):
+                    addresses = self.resolve_value(value)
+                    self.expanded[value] = (' '.join(addresses), ' '.join(self.describe(address) for address in addresses))
+
+                record[key + '_members'], record[key + '_subnets'] = self.expanded[value]
+
+        return record
+
+
+def group_by_vdom(records):
+    """
+        Split entries by VDOM
+
+        @rtype: return an OrderedDict of VDOM (None outside of a VDOM) -> list of its entries, in the entries order
+    """
+    vdoms = OrderedDict()
+    for record in records:
+        vdoms.setdefault(record.get(VDOM_KEY), []).append(record)
+
+    return vdoms
+
+
+class VdomResolvers(object):
+    """
+        A Resolver per VDOM
+    """
+
+    def __init__(self, addresses, groups):
+        """
+            @param addresses:  list of addresses of every VDOM, see fgaddressestocsv.parse()
+            @param groups:  list of groups of every VDOM, see fggroupstocsv.parse()
+        """
+        vdom_addresses = group_by_vdom(addresses)
+        vdom_groups = group_by_vdom(groups)
+
+        self.resolvers = OrderedDict()
+        for vdom in list(vdom_addresses) + list(vdom_groups):
+            if not(vdom in self.resolvers):
+                self.resolvers[vdom] = Resolver(vdom_addresses.get(vdom, []), vdom_groups.get(vdom, []))
+
+    def resolver(self, vdom):
+        """
+            Return the Resolver of a VDOM, an empty one for a VDOM without objects
+        """
+        if not(vdom in self.resolvers):
+            self.resolvers[vdom] = Resolver([], [])
+
+        return self.resolvers[vdom]
+
+    def expand_record(self, record):
+        """
+            Add the expand columns of a policy, with the objects of its VDOM, see Resolver.expand_record()
+        """
+        return self.resolver(record.get(VDOM_KEY)).expand_record(record)
+
+
+def expand_keys(order_keys):
+    """
+        Return order_keys followed by the columns added by the expand mode
+    """
+    return order_keys + [key + suffix for key in ADDRESS_KEYS for suffix in EXPAND_SUFFIXES if key in order_keys and not(key + suffix in order_keys)]
+
+
+def load_resolver(options):
+    """
+        Parse the addresses and groups of options.input_file and return their resolvers
+
+        @rtype: return a VdomResolvers
+    """
+    object_options = copy.copy(options)
+    object_options.jobs = 1
+    # --columns and --where select the policies, not their objects
+    object_options.selection = None
+
+    addresses, address_keys = fgcommon.parse_input(fgaddressestocsv, object_options)
+    groups, group_keys = fgcommon.parse_input(fggroupstocsv, object_options)
+
+    return VdomResolvers(addresses, groups)
+
+
+def print_cycles(resolvers):
+    """
+        Report the group cycles of a VdomResolvers on stderr
+    """
+    for vdom, resolver in resolvers.resolvers.items():
+        for cycle in resolver.cycles:
+            print('[!] Address group cycle%s: %s' % (' in VDOM %s' % vdom if vdom is not None else '', ' -> '.join(cycle)), file=sys.stderr)
+
+    return None
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Column projection and row filtering pushed down into the parsers (--columns, --where)
+
+    The iter_records() generator of an extractor only stores the settings of the selected
+    columns and of the filter conditions, and drops the rejected entries at their "next".
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+
+from fgtokenizer import VDOM_KEY
+
+# OptionParser imports
+from optparse import OptionGroup
+
+# Operators of a filter condition
+EQUAL = '='
+NOT_EQUAL = '!='
+MATCH = '~'
+NOT_MATCH = '!~'
+
+# Handful patterns
+# -- Filter condition, "key=value", "key!=value", "key~regex" or "key!~regex"
+p_condition = re.compile(r'^\s*([^\s=!~]+)\s*(!=|!~|=|~)\s*(.*?)\s*$')
+
+# Functions
+def add_select_options(parser):
+    """
+        Add the projection and filter options to an OptionParser
+    """
+    select_grp = OptionGroup(parser, 'Selection parameters')
+    select_grp.add_option('--columns', help='Comma separated list of the columns to extract, the other settings not being stored at all. Ex: id,srcaddr,dstaddr,service,action')
+    select_grp.add_option('--where', help='Only extract the entries matching this condition: "key=value" (the value or one of the values of a multi-valued setting), "key!=value", "key~regex" or "key!~regex", a missing setting being empty. Ex: action=accept. Can be repeated, all the conditions must match', action='append', default=[])
+    parser.option_groups.extend([select_grp])
+
+    return select_grp
+
+
+class Selection(object):
+    """
+        Columns and filter conditions applied while parsing
+    """
+
+    def __init__(self, columns, conditions):
+        """
+            @param columns:  list of the columns to keep, or None for all of them
+            @param conditions:  list of (key, operator, value) conditions
+        """
+        self.columns = columns
+        self.conditions = conditions
+
+        # settings to store: the columns and the filtered keys, None for all of them
+        self.stored = None
+        # settings stored for the conditions only, never listed in the columns
+        self.hidden = frozenset()
+        if columns is not None:
+            # the VDOM is always kept, to write the entries of each VDOM apart
+            condition_keys = set(key for key, operator, value in conditions) | set([VDOM_KEY])
+            self.stored = frozenset(columns) | condition_keys
+            self.hidden = frozenset(condition_keys - set(columns))
+
+        self.patterns = [re.compile(value) if operator in (MATCH, NOT_MATCH) else None for key, operator, value in conditions]
+
+    def accepts(self, record):
+        """
+            Check if an entry matches every condition
+        """
+        for (key, operator, value), pattern in zip(self.conditions, self.patterns):
+            current = record.get(key, u'')
+
+            if pattern is not None:
+                found = pattern.search(current) is not None
+            else:
+                found = (current == value) or (value in current.split(u' '))
+
+            if found != (operator in (EQUAL, MATCH)):
+                return False
+
+        return True
+
+    def cache_extra(self):
+        """
+            Return the selection as part of a parse cache key
+        """
+        return (tuple(self.columns) if self.columns is not None else None, tuple(self.conditions))
+
+
+def parse_condition(text):
+    """
+        Parse a --where condition into a (key, operator, value) tuple, raising a ValueError when invalid
+    """
+    match = p_condition.match(text)
+    if not(match):
+        raise ValueError('Invalid condition "%s", expected "key=value", "key!=value", "key~regex" or "key!~regex"' % text)
+
+    key, operator, value = match.groups()
+    if len(value) > 1 and value[0] == '"' and value[-1] == '"':
+        value = value[1:-1]
+
+    if operator in (MATCH, NOT_MATCH):
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise ValueError('Invalid regex "%s" in condition "%s": %s' % (value, text, e))
+
+    return (key, operator, value)
+
+
+def check_options(options):
+    """
+        Build the selection of the options as options.selection, None when there is none, raising a ValueError when invalid
+    """
+    columns = [column.strip() for column in options.columns.split(',') if column.strip()] if options.columns else None
+    conditions = [parse_condition(text) for text in options.where]
+
+    options.selection = Selection(columns, conditions) if (columns is not None or conditions) else None
+
+    return options.selection
+
+
+def selection(options):
+    """
+        Return the selection of the options, None when there is none
+    """
+    return getattr(options, 'selection', None)
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Shadowed and redundant policies: the policies an earlier policy of the same VDOM fully covers
+
+    The policies are normalized into rules of interface sets and of address and service spaces,
+    merged integer intervals plus opaque items such as FQDNs. A rule is covered by an earlier one
+    when every packet it matches is matched by it: shadowed with another action, redundant with the
+    same one. Instead of comparing every pair of rules, each rule is only compared with the earlier
+    rules its most selective indexes return, by interface, by address interval or by service port.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import sys
+import csv
+import os
+import copy
+import time
+import bisect
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+import fgpoliciestocsv
+from fgtokenizer import VDOM_KEY
+import fgservicestocsv
+import fgresolve
+import fgaddrtable
+import fgports
+import fginterval
+import fgcommon
+import fgcache
+import fgstats
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file, possibly gzip, xz or bzip2 compressed, "-" reading the standard input. Ex: fgfw.cfg')
+main_grp.add_option('-o', '--output-file', help='Output csv file, compressed when ending with .gz, .xz or .bz2 (default ./shadow-out.csv)', default=path.abspath(path.join(os.getcwd(), './shadow-out.csv')))
+main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
+main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+parser.option_groups.extend([main_grp])
+fgcache.add_cache_options(parser)
+fgstats.add_stats_options(parser)
+
+# Kinds of finding
+SHADOWED = 'shadowed'
+REDUNDANT = 'redundant'
+
+# Columns of the output
+OUTPUT_KEYS = ['id', 'kind', 'covering_id', 'action', 'covering_action']
+
+# Policies matching traffic in a way not modelled here: they neither shadow nor get shadowed
+UNSUPPORTED_SETTINGS = {
+    'srcaddr-negate': 'enable',
+    'dstaddr-negate': 'enable',
+    'service-negate': 'enable',
+    'internet-service': 'enable',
+    'internet-service-src': 'enable',
+}
+
+# Identity settings: a policy restricted to users only covers policies restricted to the same users
+IDENTITY_KEYS = ['groups', 'users', 'fsso-groups']
+
+MAX_ADDRESS = 0xffffffff
+
+# An index narrows the candidates down when it holds less than SELECTIVITY_RATIO times their number
+SELECTIVITY_RATIO = 8
+
+# Functions
+class Space(object):
+    """
+        Set of addresses or services: integer intervals, plus opaque items (FQDN, ICMP types, ...)
+        only covering themselves
+    """
+    __slots__ = ('full', 'intervals', 'opaque')
+
+    def __init__(self, full=False, intervals=(), opaque=()):
+        self.full = full
+        self.intervals = fginterval.merge_intervals(intervals)
+        self.opaque = frozenset(opaque)
+
+    def covers(self, other):
+        """
+            Check if self includes other
+        """
+        if self.full:
+            return True
+
+        if other.full:
+            return False
+
+        return other.opaque <= self.opaque and fginterval.covers(self.intervals, other.intervals)
+
+
+class Rule(object):
+    """
+        Policy normalized into interface, address, service and action sets
+    """
+    __slots__ = ('position', 'record', 'srcintf', 'dstintf', 'srcaddr', 'dstaddr', 'service', 'schedule', 'identity', 'action')
+
+    def covers(self, other):
+        """
+            Check if every packet matched by other is matched by self
+        """
+        return ((self.srcintf is None or (other.srcintf is not None and other.srcintf <= self.srcintf))
+                and (self.dstintf is None or (other.dstintf is not None and other.dstintf <= self.dstintf))
+                and (self.schedule == 'always' or self.schedule == other.schedule)
+                and (not(self.identity) or self.identity == other.identity)
+                and self.srcaddr.covers(other.srcaddr)
+                and self.dstaddr.covers(other.dstaddr)
+                and self.service.covers(other.service))
+
+
+class Normalizer(object):
+    """
+        Turn policies into rules, the spaces of the values shared by several policies being computed once
+    """
+
+    def __init__(self, address_resolver, services):
+        """
+            @param address_resolver:  fgresolve.Resolver of the addresses of a VDOM
+            @param services:  list of the services and service groups of the same VDOM, see fgservicestocsv.parse()
+        """
+        self.address_resolver = address_resolver
+        self.address_table = fgaddrtable.AddressTable(address_resolver.addresses.values())
+
+        self.services = dict((service.get('name'), service) for service in services if not('member' in service))
+        service_groups = [service for service in services if 'member' in service]
+        self.service_resolver = fgresolve.Resolver(self.services.values(), service_groups)
+
+        self.address_spaces = {}
+        self.service_spaces = {}
+
+    def address_space(self, value):
+        """
+            Return the Space of a srcaddr or dstaddr value
+        """
+        if not(value in self.address_spaces):
+            intervals = []
+            opaque = set()
+            full = False
+            for name in self.address_resolver.resolve_value(value):
+                if name in self.address_resolver.addresses:
+                    ranges = self.address_table.ranges(name)
+                    if ranges:
+                        intervals.extend(ranges)
+                    else:
+                        opaque.add(name)
+                elif name == 'all':
+                    full = True
+                else:
+                    opaque.add(name)
+
+            space = Space(full, intervals, opaque)
+            if space.intervals == [(0, MAX_ADDRESS)]:
+                space.full = True
+
+            self.address_spaces[value] = space
+
+        return self.address_spaces[value]
+
+    def service_space(self, value):
+        """
+            Return the Space of a service value
+        """
+        if not(value in self.service_spaces):
+            intervals = []
+            opaque = set()
+            full = False
+            for name in self.service_resolver.resolve_value(value):
+                service = self.services.get(name)
+                if service is None:
+                    if name.upper() == 'ALL':
+                        full = True
+                    else:
+                        opaque.add(name)
+                    continue
+
+                protocol = service.get('protocol', 'TCP/UDP/SCTP').upper()
+                if protocol == 'IP' and service.get('protocol-number', '0') == '0':
+                    full = True
+
+                elif protocol.startswith('TCP/UDP'):
+                    found = False
+                    for port_protocol in fgports.PORT_PROTOCOLS:
+                        if port_protocol + '-portrange' in service:
+                            found = True
+                            service_intervals, service_opaque = fgports.parse_portrange(port_protocol, service[port_protocol + '-portrange'])
+                            intervals.extend(service_intervals)
+                            opaque.update(service_opaque)
+                    if not(found):
+                        opaque.add(name)
+
+                else:
+                    opaque.add((protocol, service.get('protocol-number', ''), service.get('icmptype', ''), service.get('icmpcode', '')))
+
+            self.service_spaces[value] = Space(full, intervals, opaque)
+
+        return self.service_spaces[value]
+
+    def normalize(self, record, position):
+        """
+            Return the Rule of a policy, or None for a policy out of the analysis
+        """
+        if record.get('status') == 'disable':
+            return None
+
+        for key, value in UNSUPPORTED_SETTINGS.items():
+            if record.get(key) == value:
+                return None
+
+        rule = Rule()
+        rule.position = position
+        rule.record = record
+        rule.srcintf = interfaces(record.get('srcintf', ''))
+        rule.dstintf = interfaces(record.get('dstintf', ''))
+        rule.srcaddr = self.address_space(record.get('srcaddr', ''))
+        rule.dstaddr = self.address_space(record.get('dstaddr', ''))
+        rule.service = self.service_space(record.get('service', ''))
+        rule.schedule = record.get('schedule', 'always')
+        rule.identity = tuple(record.get(key, '') for key in IDENTITY_KEYS if record.get(key))
+        rule.action = record.get('action', 'deny')
+
+        return rule
+
+
+def interfaces(value):
+    """
+        Return the frozenset of the interfaces of a srcintf or dstintf value, None for "any" or no interface at all,
+        which does not restrict the traffic, as fgflows.py reads it
+    """
+    names = frozenset(value.split())
+    if not(names) or 'any' in names:
+        return None
+
+    return names
+
+
+class InterfaceIndex(object):
+    """
+        Rules by interface
+    """
+
+    def __init__(self, rules, attribute):
+        self.attribute = attribute
+        self.any = []
+        self.by_name = {}
+        for rule in rules:
+            names = getattr(rule, attribute)
+            if names is None:
+                self.any.append(rule.position)
+            else:
+                for name in names:
+                    self.by_name.setdefault(name, []).append(rule.position)
+
+    def candidates(self, rule):
+        """
+            Return lists of positions holding every rule able to cover the interfaces of rule
+        """
+        names = getattr(rule, self.attribute)
+        if names is None:
+            return [self.any]
+
+        # every interface of rule has to be covered: the least used one is the most selective
+        return [self.any, min((self.by_name.get(name, []) for name in names), key=len)]
+
+
+class SpaceIndex(object):
+    """
+        Rules by address or service Space: a segment tree of their intervals, plus their opaque items
+    """
+
+    def __init__(self, rules, attribute):
+        self.attribute = attribute
+        self.all = [rule.position for rule in rules]
+        self.full = []
+        self.opaque = {}
+
+        intervals = []
+        for rule in rules:
+            space = getattr(rule, attribute)
+            if space.full:
+                self.full.append(rule.position)
+                continue
+
+            intervals.extend((first, last, rule.position) for first, last in space.intervals)
+            for item in space.opaque:
+                self.opaque.setdefault(item, []).append(rule.position)
+
+        self.tree = fginterval.SegmentTree(intervals)
+
+    def candidates(self, rule):
+        """
+            Return lists of positions holding every rule able to cover the space of rule
+        """
+        space = getattr(rule, self.attribute)
+        if space.full:
+            return [self.full]
+
+        # a covering rule includes any point of the space: its first one is as good as another
+        if space.intervals:
+            return [self.full] + self.tree.stab(space.intervals[0][0])
+
+        if space.opaque:
+            return [self.full] + [self.opaque.get(item, []) for item in space.opaque][:1]
+
+        # an empty space, every rule covers it
+        return [self.all]
+
+
+def analyze(rules):
+    """
+        Find the rules covered by an earlier one
+
+        Each rule is only compared with the earlier rules found by its most selective indexes, i.e. the rules
+        sharing its interfaces, an address and a service port.
+
+        @param rules:  list of Rule of a same VDOM, in rulebase order
+        @rtype: return (list of (kind, rule, covering rule), number of candidate checks)
+    """
+    indexes = [InterfaceIndex(rules, 'srcintf'), InterfaceIndex(rules, 'dstintf'),
+               SpaceIndex(rules, 'srcaddr'), SpaceIndex(rules, 'dstaddr'), SpaceIndex(rules, 'service')]
+
+    by_position = dict((rule.position, rule) for rule in rules)
+
+    findings = []
+    checks = 0
+    for rule in rules:
+        candidates = sorted(((sum(len(positions) for positions in lists), lists) for lists in (index.candidates(rule) for index in indexes)), key=lambda candidate: candidate[0])
+
+        # the positions lists are in rulebase order: the earlier rules are a prefix
+        earlier = set()
+        for positions in candidates[0][1]:
+            earlier.update(positions[:bisect.bisect_left(positions, rule.position)])
+
+        # the next indexes narrow the candidates down as long as it is cheaper than checking them
+        for size, lists in candidates[1:]:
+            if not(earlier) or size > SELECTIVITY_RATIO * len(earlier):
+                break
+
+            narrowed = set()
+            for positions in lists:
+                narrowed.update(earlier.intersection(positions))
+            earlier = narrowed
+
+        for position in sorted(earlier):
+            checks += 1
+            candidate = by_position[position]
+            if candidate.covers(rule):
+                findings.append((REDUNDANT if candidate.action == rule.action else SHADOWED, rule, candidate))
+                break
+
+    return (findings, checks)
+
+
+def load_rules(options):
+    """
+        Parse the policies, addresses, groups and services of options.input_file and normalize the policies
+
+        @rtype: return (number of policies, OrderedDict of VDOM -> list of rules, fgresolve.VdomResolvers of the addresses)
+    """
+    address_resolvers = fgresolve.load_resolver(options)
+
+    object_options = copy.copy(options)
+    object_options.jobs = 1
+    services, service_keys = fgcommon.parse_input(fgservicestocsv, object_options)
+
+    policies, policy_keys = fgcommon.parse_input(fgpoliciestocsv, options)
+
+    # the policies of a VDOM only reference the objects of that VDOM
+    vdom_services = fgresolve.group_by_vdom(services)
+    normalizers = {}
+
+    rules = OrderedDict()
+    with fgstats.phase('normalize'):
+        for position, record in enumerate(policies):
+            vdom = record.get(VDOM_KEY)
+            if not(vdom in normalizers):
+                normalizers[vdom] = Normalizer(address_resolvers.resolver(vdom), vdom_services.get(vdom, []))
+
+            rule = normalizers[vdom].normalize(record, position)
+            if rule is not None:
+                rules.setdefault(vdom, []).append(rule)
+
+    return (len(policies), rules, address_resolvers)
+
+
+def generate_csv(findings, options, vdoms=False):
+    """
+        Generate a plain csv file of the findings
+
+        @param vdoms:  add a leading vdom column, for a multi-VDOM configuration
+    """
+    with fgcommon.open_output(options.output_file, options) as fd_output:
+        spamwriter = csv.writer(fd_output, delimiter=options.delimiter, quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+        if not(options.skip_header):
+            spamwriter.writerow(([VDOM_KEY] if vdoms else []) + OUTPUT_KEYS)
+
+        for kind, rule, covering in findings:
+            row = [rule.record.get(fgpoliciestocsv.ID_KEY, ''), kind, covering.record.get(fgpoliciestocsv.ID_KEY, ''), rule.action, covering.action]
+            if vdoms:
+                row.insert(0, rule.record.get(VDOM_KEY, ''))
+            spamwriter.writerow(row)
+
+    return None
+
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    if (options.input_file == None):
+        parser.error('Please specify a valid input file')
+
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    try:
+        fgstats.start(options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    count, rules, address_resolvers = load_rules(options)
+
+    start = time.time()
+    findings = []
+    checks = 0
+    with fgstats.phase('analyze'):
+        for vdom_rules in rules.values():
+            vdom_findings, vdom_checks = analyze(vdom_rules)
+            findings.extend(vdom_findings)
+            checks += vdom_checks
+    elapsed = time.time() - start
+
+    with fgstats.phase('write'):
+        generate_csv(findings, options, any(vdom is not None for vdom in rules))
+
+    kinds = [finding[0] for finding in findings]
+    print('[+] %d policies, %d analyzed in %.2fs with %d candidate check(s): %d shadowed, %d redundant' % (count, sum(len(vdom_rules) for vdom_rules in rules.values()), elapsed, checks, kinds.count(SHADOWED), kinds.count(REDUNDANT)), file=sys.stderr)
+    fgresolve.print_cycles(address_resolvers)
+    fgcache.print_stats(options)
+    fgstats.finish(options)
+
+    return None
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Phase timing and memory statistics of a run (--stats)
+
+    The scripts wrap their phases in phase(): the time of a phase excludes the time of the phases
+    nested in it, so that the read/decode time of the lines pulled by the parser is not counted twice.
+    Nothing is measured unless start() was called with the statistics options.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import contextlib
+import io
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import cProfile
+
+# OptionParser imports
+from optparse import OptionGroup
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# Phases run under the profiler
+PROFILED_PHASES = ['parse', 'write', 'stream']
+
+PROFILERS = ['cprofile', 'tracemalloc']
+
+# Number of allocation sites written by the tracemalloc profiler
+TRACEMALLOC_TOP = 50
+
+# Statistics of the current run, None when they are not collected
+collector = None
+
+# Functions
+def add_stats_options(parser):
+    """
+        Add the statistics options to an OptionParser
+    """
+    stats_grp = OptionGroup(parser, 'Statistics parameters')
+    stats_grp.add_option('--stats', help='Print the time spent in every phase (index, read/decode, parse, write), the lines and records counts, a per-block breakdown and the peak memory on stderr', action='store_true', default=False)
+    stats_grp.add_option('--stats-file', help='Write these statistics to a JSON file')
+    stats_grp.add_option('--profile', help='Profile the parse and write phases into this file')
+    stats_grp.add_option('--profiler', help='Profiler among "%s" (default "cprofile"): cprofile writes a pstats file, tracemalloc the top allocation sites' % ','.join(PROFILERS), choices=PROFILERS, default='cprofile')
+    parser.option_groups.extend([stats_grp])
+
+    return stats_grp
+
+
+def peak_rss():
+    """
+        Return the peak resident memory of the current process in MB, or None when it cannot be measured
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        return peak / (1024.0 * 1024.0)
+
+    return peak / 1024.0
+
+
+class Collector(object):
+    """
+        Phases times, counters and blocks of a run
+    """
+
+    def __init__(self, profiler=None):
+        """
+            @param profiler:  None, "cprofile" or "tracemalloc"
+        """
+        self.started = timer()
+        self.phases = OrderedDict()
+        self.counters = OrderedDict([('lines', 0), ('records', 0)])
+        self.blocks = []
+
+        # [name, start time, time of the nested phases] of the running phases
+        self.stack = []
+
+        self.profiler = profiler
+        self.profile = cProfile.Profile() if profiler == 'cprofile' else None
+        self.total = None
+
+        # tracemalloc snapshot taken at the end of the profiled phase holding the most memory, and its size
+        self.snapshot = None
+        self.snapshot_size = -1
+
+    def add(self, name, elapsed):
+        """
+            Count elapsed seconds in a phase, nested in the running one
+        """
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+        return None
+
+    def enter(self, name):
+        """
+            Start a phase, starting the profiler with the first profiled one
+        """
+        if name in PROFILED_PHASES and not(any(running[0] in PROFILED_PHASES for running in self.stack)):
+            if self.profile:
+                self.profile.enable()
+            elif self.profiler == 'tracemalloc' and not(tracemalloc.is_tracing()):
+                tracemalloc.start()
+
+        self.stack.append([name, timer(), 0.0])
+
+        return None
+
+    def leave(self):
+        """
+            End the running phase
+        """
+        name, started, nested = self.stack.pop()
+        elapsed = timer() - started
+
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed - nested
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+        if name in PROFILED_PHASES and not(any(running[0] in PROFILED_PHASES for running in self.stack)):
+            if self.profile:
+                self.profile.disable()
+            elif self.profiler == 'tracemalloc' and tracemalloc.is_tracing():
+                current = tracemalloc.get_traced_memory()[0]
+                if current > self.snapshot_size:
+                    self.snapshot = tracemalloc.take_snapshot()
+                    self.snapshot_size = current
+
+        return None
+
+    def as_dict(self):
+        """
+            Return the statistics as a JSON serializable dict
+        """
+        total = self.total if self.total is not None else timer() - self.started
+
+        stats = OrderedDict()
+        stats['total_s'] = total
+        stats['phases'] = OrderedDict((name, elapsed) for name, elapsed in self.phases.items())
+        stats['phases']['other'] = max(0.0, total - sum(self.phases.values()))
+        stats.update(self.counters)
+        stats['peak_rss_mb'] = peak_rss()
+        if self.profiler == 'tracemalloc' and tracemalloc.is_tracing():
+            stats['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+        stats['blocks'] = self.blocks
+
+        return stats
+
+    def merge(self, stats, source):
+        """
+            Add the statistics of another process, e.g. a worker of fgbatch.py
+
+            @param stats:  see as_dict()
+            @param source:  name prefixed to its blocks
+        """
+        for name, elapsed in stats['phases'].items():
+            if name != 'other':
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+        for name in self.counters:
+            self.counters[name] += stats.get(name, 0)
+
+        for block in stats['blocks']:
+            block = OrderedDict(block)
+            block['source'] = source
+            self.blocks.append(block)
+
+        return None
+
+
+def start(options):
+    """
+        Start collecting the statistics of the run when requested by the options
+    """
+    global collector
+
+    if getattr(options, 'stats', False) or getattr(options, 'stats_file', None) or getattr(options, 'profile', None):
+        profiler = options.profiler if getattr(options, 'profile', None) else None
+        if profiler == 'tracemalloc' and tracemalloc is None:
+            raise ValueError('tracemalloc is not available with this Python version')
+        collector = Collector(profiler)
+
+    return collector
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+        Time the enclosed code as the phase name
+    """
+    if collector is None:
+        yield
+        return
+
+    collector.enter(name)
+    try:
+        yield
+    finally:
+        collector.leave()
+
+
+def count(name, value=1):
+    """
+        Increment a counter
+    """
+    if collector is not None:
+        collector.counters[name] = collector.counters.get(name, 0) + value
+
+    return None
+
+
+def timed_lines(lines):
+    """
+        Return lines, timing their reading and decoding as the "read" phase when collecting
+    """
+    if collector is None:
+        return lines
+
+    return iter_timed_lines(lines)
+
+
+def iter_timed_lines(lines):
+    """
+        Yield lines, counting them and the time spent getting them
+    """
+    iterator = iter(lines)
+    lines_count = 0
+    elapsed = 0.0
+    try:
+        while True:
+            started = timer()
+            try:
+                line = next(iterator)
+            except StopIteration:
+                break
+            elapsed += timer() - started
+            lines_count += 1
+            yield line
+    finally:
+        collector.add('read', elapsed)
+        collector.counters['lines'] += lines_count
+
+
+def counted(records):
+    """
+        Return records, counting them when collecting
+    """
+    if collector is None:
+        return records
+
+    return iter_counted(records)
+
+
+def iter_counted(records):
+    """
+        Yield records, counting them
+    """
+    for record in records:
+        collector.counters['records'] += 1
+        yield record
+
+
+@contextlib.contextmanager
+def block(vdom, name, size):
+    """
+        Account the lines, records and time of the enclosed reading of a configuration block
+
+        The time includes the parsing of the block, its lines being pulled by the parser.
+    """
+    if collector is None:
+        yield
+        return
+
+    started = timer()
+    lines = collector.counters['lines']
+    records = collector.counters['records']
+    try:
+        yield
+    finally:
+        collector.blocks.append(OrderedDict([
+            ('vdom', vdom),
+            ('name', name),
+            ('bytes', size),
+            ('lines', collector.counters['lines'] - lines),
+            ('records', collector.counters['records'] - records),
+            ('seconds', timer() - started),
+        ]))
+
+
+def print_report(stats):
+    """
+        Print the statistics on stderr
+    """
+    print('[+] Stats: %.2fs, %d lines, %d records, peak RSS %s MB' % (stats['total_s'], stats['lines'], stats['records'], '%.1f' % stats['peak_rss_mb'] if stats['peak_rss_mb'] is not None else '?'), file=sys.stderr)
+    for name, elapsed in stats['phases'].items():
+        print('[+]   %-10s %8.3fs %5.1f%%' % (name, elapsed, 100.0 * elapsed / max(stats['total_s'], 1e-9)), file=sys.stderr)
+
+    if stats['blocks']:
+        print('[+] Blocks:', file=sys.stderr)
+        for block in stats['blocks']:
+            source = '%-20s ' % block['source'] if 'source' in block else ''
+            print('[+]   %s%-16s %-28s %8.1f KB %9d lines %8d records %8.3fs' % (source, block['vdom'] or '-', block['name'], block['bytes'] / 1024.0, block['lines'], block['records'], block['seconds']), file=sys.stderr)
+
+    if 'tracemalloc_peak_mb' in stats:
+        print('[+] Traced memory peak: %.1f MB' % stats['tracemalloc_peak_mb'], file=sys.stderr)
+
+    return None
+
+
+def write_profile(profile_file):
+    """
+        Write the profile of the run
+    """
+    if collector.profile:
+        collector.profile.dump_stats(profile_file)
+
+    elif collector.snapshot is not None:
+        with io.open(profile_file, mode='w', encoding='utf-8') as fd_profile:
+            fd_profile.write(u'# traced memory: %.1f MB at the end of the largest profiled phase, peak %.1f MB\n' % (collector.snapshot_size / (1024.0 * 1024.0), tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)))
+            for statistic in collector.snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+                fd_profile.write(u'%s\n' % statistic)
+
+    return None
+
+
+def finish(options):
+    """
+        Report the statistics of the run, as requested by the options
+    """
+    global collector
+
+    if collector is None:
+        return None
+
+    collector.total = timer() - collector.started
+    stats = collector.as_dict()
+
+    if getattr(options, 'profile', None):
+        write_profile(options.profile)
+        print('[+] Profile written to %s' % options.profile, file=sys.stderr)
+
+    if options.stats:
+        print_report(stats)
+
+    if options.stats_file:
+        with io.open(options.stats_file, mode='w', encoding='utf-8') as fd_stats:
+            fd_stats.write(u'%s\n' % json.dumps(stats, indent=2))
+
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    collector = None
+
+    return None
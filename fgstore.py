@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Compact store of the parsed entries
+
+    A list of dicts holds its own keys and values in every entry, while the same values ("all",
+    "accept", "always", interface names, ...) are repeated over hundreds of thousands of policies.
+    A RecordStore maps every key to a column number through a shared key table and dictionary-encodes
+    the values through a shared value table, each distinct value being kept once: an entry is a row
+    of 4-byte value codes, one per column, in a single flat array.
+
+    The codes are looked up and allocated with map() over a defaultdict, so that neither storing
+    nor reading an entry runs a Python loop over its settings.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from array import array
+from collections import defaultdict
+import functools
+import itertools
+import operator
+import sys
+
+# Code of a missing setting
+MISSING = 0
+
+# Classes
+class RecordStore(object):
+    """
+        Read-only sequence of entries, rebuilding the entry dicts on access
+
+        The csv writers read the rows straight from the codes with iter_rows().
+    """
+
+    def __init__(self, records=()):
+        """
+            @param records:  iterable of entries ( {'id' : '1', 'srcintf' : 'internal', ...} ), possibly a generator
+        """
+        # column -> key
+        self.keys = []
+        self.key_set = set()
+
+        # value -> value code, the codes being allocated in insertion order, and the value code -> value table
+        self.value_codes = None
+        self.values = [None]
+
+        # value codes of every entry, the entry i being the codes offsets[i] to offsets[i + 1]:
+        # the columns known when it was stored, the later ones being missing
+        self.codes = array('I')
+        self.offsets = array('L', [0])
+
+        self.extend(records)
+
+    def __getstate__(self):
+        # the value codes are rebuilt from the value table, keeping the pickled store (parse cache, worker processes) small
+        state = dict(self.__dict__)
+        state['values'] = self.value_list()
+        state['value_codes'] = None
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self.record(position)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.record(position) for position in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not(0 <= index < len(self)):
+            raise IndexError('RecordStore index out of range')
+
+        return self.record(index)
+
+    def value_table(self):
+        """
+            Return the defaultdict of value -> value code, a new value getting the next code
+        """
+        if self.value_codes is None:
+            values = self.value_list()
+            self.value_codes = defaultdict(functools.partial(next, itertools.count(len(values))), zip(values, itertools.count()))
+
+        return self.value_codes
+
+    def value_list(self):
+        """
+            Return the list of value code -> value
+        """
+        if self.value_codes is not None and len(self.values) != len(self.value_codes):
+            if (sys.version_info < (3, 7)):
+                self.values = sorted(self.value_codes, key=self.value_codes.get)
+            else:
+                # the dicts keep the insertion order, which is the order of the codes
+                self.values = list(self.value_codes)
+
+        return self.values
+
+    def record(self, position):
+        """
+            Rebuild the dict of an entry
+        """
+        codes = self.codes[self.offsets[position]:self.offsets[position + 1]]
+
+        # the MISSING code being 0, the codes are their own selectors
+        return dict(zip(itertools.compress(self.keys, codes), map(self.value_list().__getitem__, itertools.compress(codes, codes))))
+
+    def append(self, record):
+        """
+            Add an entry
+        """
+        return self.extend((record,))
+
+    def extend(self, records):
+        """
+            Add entries, or the entries of another RecordStore
+        """
+        if isinstance(records, RecordStore):
+            return self.extend_store(records)
+
+        keys = self.keys
+        key_set = self.key_set
+        code_of = self.value_table().__getitem__
+        codes = self.codes
+        offsets = self.offsets
+
+        for record in records:
+            if not(key_set.issuperset(record)):
+                for key in record:
+                    if not(key in key_set):
+                        key_set.add(key)
+                        keys.append(key)
+
+            # a missing setting is None, whose code is MISSING
+            codes.extend(map(code_of, map(record.get, keys)))
+            offsets.append(len(codes))
+
+        return None
+
+    def extend_store(self, other):
+        """
+            Add the entries of another RecordStore, translating its value codes
+        """
+        # the columns of the other store must be the first columns of this one
+        if self.keys[:len(other.keys)] != other.keys[:len(self.keys)]:
+            return self.extend(iter(other))
+
+        for key in other.keys[len(self.keys):]:
+            self.key_set.add(key)
+            self.keys.append(key)
+
+        translated = list(map(self.value_table().__getitem__, other.value_list()))
+
+        base = self.offsets[-1]
+        self.codes.extend(map(translated.__getitem__, other.codes))
+        self.offsets.extend(map(functools.partial(operator.add, base), other.offsets[1:]))
+
+        return None
+
+    def iter_rows(self, keys, missing='', formatters=None):
+        """
+            Yield the rows of the entries following the order of keys, without rebuilding the entry dicts
+
+            @param keys:  columns of the rows ['id', 'srcintf', 'dstintf', ...]
+            @param missing:  value of a missing setting
+            @param formatters:  optional dict of key -> function returning the csv value of a setting, called once per distinct value
+            @rtype: yield a list of values per entry
+        """
+        values = list(self.value_list())
+        values[MISSING] = missing
+
+        # the keys not stored read the padding column, always MISSING
+        width = len(self.keys)
+        columns = [self.keys.index(key) if key in self.key_set else width for key in keys]
+        tables = [FormattedValues(values, formatters[key]) if (formatters and key in formatters) else values for key in keys]
+        padding = array('I', [MISSING]) * (width + 1)
+
+        codes = self.codes
+        start = 0
+        for end in self.offsets[1:]:
+            row = codes[start:end] + padding[end - start:]
+            yield list(map(operator.getitem, tables, map(row.__getitem__, columns)))
+            start = end
+
+
+class FormattedValues(dict):
+    """
+        Value code -> formatted value, each distinct value being formatted once
+    """
+    __slots__ = ('values', 'formatter')
+
+    def __init__(self, values, formatter):
+        dict.__init__(self)
+        self.values = values
+        self.formatter = formatter
+
+    def __missing__(self, code):
+        value = self.values[code]
+        formatted = self[code] = self.formatter(value) if code != MISSING else value
+
+        return formatted
+
+
+# Functions
+def iter_rows(records, keys, format_row, formatters=None):
+    """
+        Yield the csv rows of entries, straight from the codes of a RecordStore
+
+        @param records:  RecordStore, or any iterable of entries
+        @param keys:  columns of the rows ['id', 'srcintf', 'dstintf', ...]
+        @param format_row:  format_row(record, keys) of the extractor, for the other iterables
+        @param formatters:  dict of key -> function returning the csv value of a setting, as format_row() does
+    """
+    if isinstance(records, RecordStore):
+        return records.iter_rows(keys, formatters=formatters)
+
+    return (format_row(record, keys) for record in records)
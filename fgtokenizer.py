@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Shared tokenizer for FortiGate configuration lines
+
+    Every line is classified once by its first word and parsed in the same step
+    into a (kind, name, value) token:
+        - config firewall policy  -> (CONFIG, 'firewall policy', None)
+        - edit "lan-net"          -> (EDIT, 'lan-net', None)
+        - set srcaddr "a" "b"     -> (SET, 'srcaddr', 'a b')
+        - next                    -> (NEXT, None, None)
+        - end                     -> (END, None, None)
+    Any other line gives (None, None, None).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# Token kinds
+CONFIG = 'config'
+EDIT = 'edit'
+SET = 'set'
+NEXT = 'next'
+END = 'end'
+
+# First word -> token kind, the lowercase version is tried first as it is the common case
+KINDS = {
+    'config': CONFIG,
+    'edit': EDIT,
+    'set': SET,
+    'next': NEXT,
+    'end': END,
+}
+
+# Column of the VDOM of an entry, only set in a multi-VDOM configuration
+VDOM_KEY = u'vdom'
+
+NO_TOKEN = (None, None, None)
+NEXT_TOKEN = (NEXT, None, None)
+END_TOKEN = (END, None, None)
+
+# Functions
+def tokenize(line):
+    """
+        Classify and parse a configuration line
+
+        @param line:  a raw configuration line
+        @rtype: return a (kind, name, value) tuple
+    """
+    parts = line.split(None, 1)
+    if not(parts):
+        return NO_TOKEN
+
+    head = parts[0]
+    kind = KINDS.get(head) or KINDS.get(head.lower())
+
+    if kind is None:
+        return NO_TOKEN
+
+    if len(parts) == 1:
+        # "next" and "end" stand alone on their line
+        if kind is NEXT:
+            return NEXT_TOKEN
+        if kind is END:
+            return END_TOKEN
+        return NO_TOKEN
+
+    rest = parts[1].rstrip()
+
+    if kind is SET:
+        key_value = rest.split(None, 1)
+        if len(key_value) == 1:
+            return NO_TOKEN
+
+        key, value = key_value
+        if '"' in value:
+            value = value.replace('"', '')
+
+        return (SET, key, value)
+
+    if kind is EDIT:
+        if len(rest) > 1 and rest[0] == '"' and rest[-1] == '"':
+            rest = rest[1:-1]
+
+        return (EDIT, rest, None)
+
+    if kind is CONFIG:
+        return (CONFIG, rest, None)
+
+    # "next" or "end" followed by something else
+    return NO_TOKEN
+
+
+def tokenize_lines(lines):
+    """
+        Tokenize an iterable of configuration lines, same as calling tokenize() on each of them
+        but with the hot path inlined
+
+        @param lines:  iterable of configuration lines (file object, list, ...)
+        @rtype: yield (kind, name, value) tuples
+    """
+    kinds_get = KINDS.get
+
+    for line in lines:
+        parts = line.split(None, 1)
+        if not(parts):
+            yield NO_TOKEN
+            continue
+
+        head = parts[0]
+        kind = kinds_get(head) or kinds_get(head.lower())
+
+        if kind is SET and len(parts) == 2:
+            key_value = parts[1].split(None, 1)
+            if len(key_value) == 2:
+                value = key_value[1].rstrip()
+                if '"' in value:
+                    value = value.replace('"', '')
+                yield (SET, key_value[0], value)
+                continue
+
+        if kind is None:
+            yield NO_TOKEN
+        else:
+            yield tokenize(line)
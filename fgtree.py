@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Configuration tree parser
+
+    A FortiGate configuration is a tree of sections ("config <name>" ... "end") holding settings
+    ("set <key> <value>"), entries ("edit <name>" ... "next") and nested sections, an entry holding
+    settings and nested sections too. Every "end" closes the innermost open section, whatever
+    the depth, so that a nested sub-configuration (e.g. the ssl-vpn authentication rules of a
+    policy) is kept apart from the settings of its entry.
+
+    The tree is built lazily from a token stream, see fgtokenizer:
+        - iter_entries():  yield the entries of the matching sections one at a time, as soon as
+                           their "next" is seen, without keeping them
+        - iter_sections():  yield the matching sections one at a time, fully built
+        - build_tree():  build the whole tree
+    The sections not matching are skipped without building anything.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import sys
+
+from fgtokenizer import CONFIG, EDIT, SET, NEXT, END
+
+# Settings of a node, keeping the order of the "set" lines
+if (sys.version_info < (3, 7)):
+    Settings = OrderedDict
+else:
+    Settings = dict
+
+# Sections holding other sections rather than settings: the VDOM list and the global settings
+VDOM_SECTION = 'vdom'
+GLOBAL_SECTION = 'global'
+
+# Classes
+class Section(object):
+    """
+        A "config <name>" ... "end" section
+    """
+    __slots__ = ('name', 'settings', 'entries', 'sections')
+
+    def __init__(self, name):
+        self.name = name
+        self.settings = Settings()
+        self.entries = []
+        self.sections = None
+
+    def add_section(self, section):
+        """
+            Add a nested section
+        """
+        if self.sections is None:
+            self.sections = []
+        self.sections.append(section)
+
+        return None
+
+
+class Entry(object):
+    """
+        An "edit <name>" ... "next" entry of a section
+    """
+    __slots__ = ('name', 'settings', 'sections')
+
+    def __init__(self, name):
+        self.name = name
+        self.settings = Settings()
+        self.sections = None
+
+    def add_section(self, section):
+        """
+            Add a nested section
+        """
+        if self.sections is None:
+            self.sections = []
+        self.sections.append(section)
+
+        return None
+
+
+# Functions
+def skip_section(tokens):
+    """
+        Consume the tokens of a section up to its "end", the "config" token being already consumed
+    """
+    depth = 1
+    for kind, name, value in tokens:
+        if kind == CONFIG:
+            depth += 1
+        elif kind == END:
+            depth -= 1
+            if depth == 0:
+                return None
+
+    return None
+
+
+def iter_section_entries(tokens, section, stored=None):
+    """
+        Parse the tokens of a section up to its "end", the "config" token being already consumed,
+        and yield its entries as soon as they are complete, without adding them to section.entries
+
+        @param tokens:  iterator over the (kind, name, value) tokens
+        @param section:  the Section, getting the settings and the nested sections found outside of an entry
+        @param stored:  optional set of the setting names stored in the entries, the other ones being dropped
+        @rtype: yield every Entry
+    """
+    entry = None
+    settings = section.settings
+    keep = None
+
+    for kind, name, value in tokens:
+        if kind == SET:
+            if keep is None or name in keep:
+                settings[name] = value
+
+        elif kind == EDIT:
+            # an "edit" without the "next" of the previous entry
+            if entry is not None:
+                yield entry
+            entry = Entry(name)
+            settings = entry.settings
+            keep = stored
+
+        elif kind == NEXT:
+            if entry is not None:
+                yield entry
+                entry = None
+                settings = section.settings
+                keep = None
+
+        elif kind == CONFIG:
+            nested = build_section(tokens, name)
+            if entry is not None:
+                entry.add_section(nested)
+            else:
+                section.add_section(nested)
+
+        elif kind == END:
+            # an "end" without the "next" of the last entry
+            if entry is not None:
+                yield entry
+            return
+
+
+def build_section(tokens, name):
+    """
+        Build a whole section from its tokens up to its "end", the "config" token being already consumed
+    """
+    section = Section(name)
+    for entry in iter_section_entries(tokens, section):
+        section.entries.append(entry)
+
+    return section
+
+
+def iter_matching_sections(tokens, patterns):
+    """
+        Walk the tokens down to the sections whose name matches one of the patterns, skipping the other ones
+
+        The sections are searched at the top level, in the "config global" section and in the entries
+        of the "config vdom" sections.
+
+        @param tokens:  iterator over the (kind, name, value) tokens
+        @param patterns:  list of patterns matched against the section names, see p_entering_block of the extractors
+        @rtype: yield (VDOM or None, section name) right after the "config" token of every matching section,
+                its tokens must be consumed up to its "end" before going to the next one
+    """
+    # opened container sections and VDOM entries: VDOM_SECTION, GLOBAL_SECTION or EDIT
+    stack = []
+    vdom = None
+
+    for kind, name, value in tokens:
+        if kind == CONFIG:
+            if any(pattern.search(name) for pattern in patterns):
+                yield (vdom, name)
+
+            elif not(stack) and name.lower() in (VDOM_SECTION, GLOBAL_SECTION):
+                stack.append(name.lower())
+
+            else:
+                skip_section(tokens)
+
+        elif kind == EDIT:
+            if stack and stack[-1] == VDOM_SECTION:
+                stack.append(EDIT)
+                vdom = name
+            # an "edit" of the next VDOM without the "next" of the previous one
+            elif stack and stack[-1] == EDIT:
+                vdom = name
+
+        elif kind == NEXT:
+            if stack and stack[-1] == EDIT:
+                stack.pop()
+                vdom = None
+
+        elif kind == END:
+            if stack:
+                # an "end" closing both the last VDOM entry and the "config vdom" section
+                if stack.pop() == EDIT and stack:
+                    stack.pop()
+                vdom = None
+
+
+def iter_entries(tokens, patterns, stored=None):
+    """
+        Yield the entries of the sections whose name matches one of the patterns, one at a time
+
+        Only one entry is held in memory at once.
+
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @param patterns:  see iter_matching_sections()
+        @param stored:  see iter_section_entries()
+        @rtype: yield (VDOM or None, section name, Entry) tuples, in file order
+    """
+    tokens = iter(tokens)
+
+    for vdom, name in iter_matching_sections(tokens, patterns):
+        for entry in iter_section_entries(tokens, Section(name), stored):
+            yield (vdom, name, entry)
+
+
+def iter_sections(tokens, patterns):
+    """
+        Yield the sections whose name matches one of the patterns, one at a time, fully built
+
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @param patterns:  see iter_matching_sections()
+        @rtype: yield (VDOM or None, Section) tuples, in file order
+    """
+    tokens = iter(tokens)
+
+    for vdom, name in iter_matching_sections(tokens, patterns):
+        yield (vdom, build_section(tokens, name))
+
+
+def build_tree(tokens):
+    """
+        Build the whole tree of a configuration
+
+        @param tokens:  iterable of (kind, name, value) tokens, see fgtokenizer
+        @rtype: return a root Section without name, holding the top-level sections
+    """
+    tokens = iter(tokens)
+
+    root = Section(None)
+    for kind, name, value in tokens:
+        if kind == CONFIG:
+            root.add_section(build_section(tokens, name))
+
+    return root
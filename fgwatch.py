@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This file is part of fgpoliciestocsv.
+#
+# Copyright (C) 2014, 2022, Thomas Debize <tdebize at mail.com>
+# All rights reserved.
+#
+# fgpoliciestocsv is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# fgpoliciestocsv is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with fgpoliciestocsv.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Watch mode: keep the outputs of a configuration file up to date while it is rewritten
+
+    The parsed entries stay in memory between two versions of the file. Every "config firewall <x>"
+    block is hashed, and so is every "edit" entry of a block whose hash changed: only the entries
+    whose hash is new are parsed again, the other ones being reused as they are, and only the
+    outputs of the extractors owning a changed block are rewritten.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+from collections import OrderedDict
+import sys
+import os
+import copy
+import time
+import codecs
+import hashlib
+
+# OptionParser imports
+from optparse import OptionParser
+from optparse import OptionGroup
+
+from fgtokenizer import tokenize_lines
+import fgtree
+import fgindex
+import fgcommon
+import fgcompress
+import fgoutput
+import fgalltocsv
+
+# Options definition
+parser = OptionParser(usage="%prog [options]")
+
+main_grp = OptionGroup(parser, 'Main parameters')
+main_grp.add_option('-i', '--input-file', help='Partial or full Fortigate configuration file to watch, possibly gzip, xz or bzip2 compressed. Ex: fgfw.cfg')
+main_grp.add_option('-o', '--output-dir', help='Output directory for the <extractor>-out.csv files (default ./)', default=os.getcwd())
+main_grp.add_option('-x', '--extract', help='Comma separated list of extractors to run among "%s" (default all)' % ','.join(fgalltocsv.EXTRACTORS.keys()), default=','.join(fgalltocsv.EXTRACTORS.keys()))
+main_grp.add_option('-s', '--skip-header', help='Do not print the csv header', action='store_true', default=False)
+main_grp.add_option('-n', '--newline', help='Insert a newline between each entry for better readability', action='store_true', default=False)
+main_grp.add_option('-d', '--delimiter', help='CSV delimiter (default ";")', default=';')
+main_grp.add_option('-e', '--input-encoding', help='Input file encoding (default "utf-8")', default='utf-8')
+main_grp.add_option('-f', '--output-encoding', help='Output file encoding (default "utf-8-sig" to make it easily viewable with MS Excel)', default='utf-8-sig')
+main_grp.add_option('-t', '--interval', help='Seconds between two checks of the input file (default 1). A change is processed once the file stayed the same for one interval', type='float', default=1.0)
+parser.option_groups.extend([main_grp])
+fgoutput.add_output_options(parser)
+
+# Functions
+def content_hash(data):
+    """
+        Return the digest of a bytes content
+    """
+    return hashlib.sha1(data).digest()
+
+
+class BlockState(object):
+    """
+        Parsed entries of a "config firewall <x>" block
+    """
+
+    def __init__(self, digest, extractor_name, entries):
+        """
+            @param digest:  hash of the block content
+            @param extractor_name:  name of the extractor handling the block, see fgalltocsv.EXTRACTORS
+            @param entries:  list of (entry content, list of (record, keys)) of the entries of the block, in file order
+        """
+        self.digest = digest
+        self.extractor_name = extractor_name
+        self.entries = entries
+
+        # entry content -> list of (record, keys), for the next version of the block
+        self.parsed = dict(entries)
+
+        self.records = [record for content, records in entries for record, keys in records]
+        self.keys = merge_keys(keys for content, records in entries for record, keys in records)
+
+
+def merge_keys(key_lists):
+    """
+        Merge lists of keys, each key coming at its first appearance
+    """
+    order_keys = []
+    seen_keys = set()
+    for keys in key_lists:
+        # most entries bring no new key
+        if seen_keys.issuperset(keys):
+            continue
+        for key in keys:
+            if not(key in seen_keys):
+                seen_keys.add(key)
+                order_keys.append(key)
+
+    return order_keys
+
+
+def parse_entries(extractor, vdom, section, texts):
+    """
+        Parse entries of a block apart from the rest of the file
+
+        @param extractor:  extractor module handling the block
+        @param vdom:  VDOM of the block, None outside of a VDOM
+        @param section:  section name of the block. Ex: 'firewall policy'
+        @param texts:  list of the decoded texts of the entries, from their "edit" line to their "next" line
+        @rtype: return a list of (record, keys) per text, keys being the columns of the record in their order of appearance
+    """
+    lines = fgcommon.vdom_header(vdom) + [u'config %s\n' % section]
+    for text in texts:
+        lines.extend(fgindex.split_lines(text))
+    lines.append(u'end\n')
+    lines.extend(fgcommon.vdom_footer(vdom))
+
+    entries = list(fgtree.iter_entries(tokenize_lines(lines), [extractor.p_entering_block]))
+
+    # an entry whose text does not parse as a single one is parsed alone
+    if len(entries) != len(texts):
+        if len(texts) == 1:
+            return [parse_records(extractor, entries)]
+        return [parse_entries(extractor, vdom, section, [text])[0] for text in texts]
+
+    return [parse_records(extractor, [entry]) for entry in entries]
+
+
+def parse_records(extractor, entries):
+    """
+        Return the list of (record, keys) of configuration tree entries, see parse_entries()
+    """
+    records = []
+    for entry in entries:
+        keys = []
+        for record in extractor.iter_entry_records([entry], keys):
+            records.append((record, keys))
+
+    return records
+
+
+class WatchedConfig(object):
+    """
+        Parsed state of a configuration file, updated block by block and entry by entry
+    """
+
+    def __init__(self, input_file, encoding, extractors):
+        """
+            @param input_file:  configuration file
+            @param encoding:  input file encoding, ASCII compatible
+            @param extractors:  dict of extractor name -> extractor module, see fgalltocsv.select_extractors()
+        """
+        self.input_file = input_file
+        self.encoding = encoding
+        self.extractors = extractors
+
+        # (VDOM, section name, occurrence) -> BlockState, in file order
+        self.blocks = OrderedDict()
+        self.digest = None
+
+        # stat of the processed version of the file, and of the one seen at the previous check
+        self.processed = None
+        self.seen = None
+
+        # counters of the last update
+        self.parsed_blocks = 0
+        self.parsed_entries = 0
+        self.total_entries = 0
+
+    def stat(self):
+        """
+            Return the (size, modification time, inode) of the input file, None while it is missing
+        """
+        try:
+            stat = os.stat(self.input_file)
+        except OSError:
+            return None
+
+        return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+    def poll(self):
+        """
+            Check if the input file changed since the last update and stayed the same since the previous check
+        """
+        stat = self.stat()
+        seen = self.seen
+        self.seen = stat
+
+        if stat is None or stat == self.processed:
+            return False
+
+        # the first version is processed right away, the next ones once their writer is done
+        if self.processed is not None and stat != seen:
+            return False
+
+        self.processed = stat
+
+        return True
+
+    def route(self, section):
+        """
+            Return the name of the extractor handling a section, or None
+        """
+        for name, extractor in self.extractors.items():
+            if extractor.p_entering_block.search(section):
+                return name
+
+        return None
+
+    def update(self):
+        """
+            Read the input file again and parse the entries of its changed blocks
+
+            @rtype: return the list of the names of the extractors whose output changed
+        """
+        with fgcompress.open_binary(self.input_file) as fd_input:
+            buf = fd_input.read()
+
+        self.parsed_blocks = 0
+        self.parsed_entries = 0
+
+        file_digest = content_hash(buf)
+        if file_digest == self.digest:
+            return []
+
+        changed = set()
+        blocks = OrderedDict()
+        occurrences = {}
+        for block in fgindex.build_index(buf):
+            name = self.route(block.name)
+            if name is None:
+                continue
+
+            key = (block.vdom, block.name, occurrences.get((block.vdom, block.name), 0))
+            occurrences[(block.vdom, block.name)] = key[2] + 1
+
+            previous = self.blocks.get(key)
+            digest = content_hash(buf[block.start:block.end])
+            if previous is not None and previous.digest == digest:
+                blocks[key] = previous
+                continue
+
+            blocks[key] = self.parse_block(buf, block, name, digest, previous)
+            changed.add(name)
+
+        # removed and moved blocks change their outputs too
+        previous_keys = [key for key in self.blocks]
+        for name in self.extractors:
+            if [key for key in blocks if blocks[key].extractor_name == name] != [key for key in previous_keys if self.blocks[key].extractor_name == name]:
+                changed.add(name)
+
+        self.blocks = blocks
+        self.digest = file_digest
+        self.total_entries = sum(len(state.entries) for state in blocks.values())
+
+        return [name for name in self.extractors if name in changed]
+
+    def parse_block(self, buf, block, extractor_name, digest, previous):
+        """
+            Parse the entries of a block whose hash is not the one of its previous version, reusing its unchanged entries
+
+            @rtype: return a BlockState
+        """
+        parsed = previous.parsed if previous is not None else {}
+
+        # the raw bytes of an entry are its dict key, hashed by the dict itself without any collision
+        contents = [buf[start:end] for start, end in fgindex.entry_ranges(buf, block)]
+
+        missing = OrderedDict()
+        for content in contents:
+            if not(content in parsed) and not(content in missing):
+                missing[content] = content.decode(self.encoding)
+
+        if missing:
+            parsed = dict(parsed)
+            parsed.update(zip(missing.keys(), parse_entries(self.extractors[extractor_name], block.vdom, block.name, list(missing.values()))))
+
+        self.parsed_blocks += 1
+        self.parsed_entries += len(missing)
+
+        return BlockState(digest, extractor_name, [(content, parsed[content]) for content in contents])
+
+    def output(self, name):
+        """
+            Return the (records, keys) of an extractor, in file order
+        """
+        states = [state for state in self.blocks.values() if state.extractor_name == name]
+
+        records = [record for state in states for record in state.records]
+        keys = merge_keys(state.keys for state in states)
+
+        return (records, keys)
+
+
+def write_output(watched, name, options):
+    """
+        Rewrite the output file of an extractor, replacing the previous one at once, a now empty output being removed
+    """
+    output_file = fgalltocsv.output_file(options, name)
+    records, keys = watched.output(name)
+
+    # the temporary file keeps the extension, and its compression
+    temporary_file = path.join(path.dirname(output_file), u'.%s.tmp%d' % (path.basename(output_file), os.getpid()))
+    if path.exists(temporary_file):
+        os.remove(temporary_file)
+
+    extractor_options = copy.copy(options)
+    extractor_options.output_file = temporary_file
+    watched.extractors[name].generate_csv(records, keys, extractor_options)
+
+    if path.exists(temporary_file):
+        if hasattr(os, 'replace'):
+            os.replace(temporary_file, output_file)
+        else:
+            if path.exists(output_file) and sys.platform.startswith('win'):
+                os.remove(output_file)
+            os.rename(temporary_file, output_file)
+
+    elif path.exists(output_file):
+        os.remove(output_file)
+
+    return output_file
+
+
+def process(watched, options):
+    """
+        Update the parsed state of the input file and rewrite the changed outputs, reporting it on stderr
+    """
+    started = time.time()
+    names = watched.update()
+
+    written = []
+    for name in names:
+        written.append(path.basename(write_output(watched, name, options)))
+
+    print('[+] %s %s: %d block(s) and %d/%d entry(ies) parsed, %s in %.1fms' % (time.strftime('%H:%M:%S'), options.input_file, watched.parsed_blocks, watched.parsed_entries, watched.total_entries, 'wrote %s' % ', '.join(written) if written else 'no output changed', (time.time() - started) * 1000), file=sys.stderr)
+
+    return written
+
+
+def main():
+    """
+        Dat main
+    """
+    global parser
+
+    options, arguments = parser.parse_args()
+
+    if (options.input_file == None) or options.input_file == fgcompress.STDIN:
+        parser.error('Please specify a valid input file, the standard input cannot be watched')
+
+    try:
+        extractors = fgalltocsv.select_extractors(options.extract)
+        if codecs.lookup(options.input_encoding).encode(u'config end')[0] != b'config end':
+            raise ValueError('The input encoding must be ASCII compatible')
+    except (ValueError, LookupError) as e:
+        parser.error(str(e))
+
+    if (sys.version_info < (3, 0)):
+        options.output_encoding = None
+
+    try:
+        fgoutput.check_options(options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not(path.isdir(options.output_dir)):
+        os.makedirs(options.output_dir)
+
+    watched = WatchedConfig(options.input_file, options.input_encoding, extractors)
+    print('[+] Watching %s every %gs, Ctrl-C to stop' % (options.input_file, options.interval), file=sys.stderr)
+
+    try:
+        while True:
+            if watched.poll():
+                try:
+                    process(watched, options)
+                except (IOError, OSError, UnicodeDecodeError) as e:
+                    # the state stays the one of the last processed version, until the next one
+                    print('[!] %s: %s' % (options.input_file, e), file=sys.stderr)
+            time.sleep(options.interval)
+    except KeyboardInterrupt:
+        pass
+
+    return None
+
+if __name__ == "__main__" :
+    main()
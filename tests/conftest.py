@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Shared fixtures of the tests: the scripts are flat top-level modules, imported from the repository root
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+import io
+import sys
+
+import pytest
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+if not(ROOT in sys.path):
+    sys.path.insert(0, ROOT)
+
+DATA_DIR = path.join(path.dirname(path.abspath(__file__)), 'data')
+
+
+@pytest.fixture
+def write_config(tmp_path):
+    """
+        Return a function writing a configuration text to a file of tmp_path and returning its path
+    """
+    def write(text, name='fw.cfg'):
+        config_file = str(tmp_path / name)
+        with io.open(config_file, 'w', encoding='utf-8', newline='\n') as fd_config:
+            fd_config.write(text)
+        return config_file
+
+    return write
+
+
+def read_text(file_name, encoding='utf-8-sig'):
+    """
+        Return the content of a text file
+    """
+    with io.open(file_name, 'r', encoding=encoding, newline='') as fd_input:
+        return fd_input.read()
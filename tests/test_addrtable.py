@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import fgaddrtable
+import fgresolve
+from fgaddressestocsv import FAMILY_KEY, IPV6
+
+ADDRESSES = [
+    {u'name': u'all'},
+    {u'name': u'lan', u'subnet': u'10.0.0.0 255.255.255.0'},
+    {u'name': u'lan-host', u'subnet': u'10.0.0.5/32'},
+    {u'name': u'range', u'type': u'iprange', u'start-ip': u'10.0.0.200', u'end-ip': u'10.0.1.10'},
+    {u'name': u'even', u'type': u'wildcard', u'wildcard': u'10.0.0.0 255.255.255.1'},
+    {u'name': u'web', u'type': u'fqdn', u'fqdn': u'www.example.com'},
+    {u'name': u'v6', FAMILY_KEY: IPV6, u'ip6': u'2001:db8::/32'},
+]
+
+
+def ip(value):
+    return fgresolve.ip_to_int(value)
+
+
+def test_ip6_to_int():
+    assert fgaddrtable.ip6_to_int(u'::') == 0
+    assert fgaddrtable.ip6_to_int(u'::1') == 1
+    assert fgaddrtable.ip6_to_int(u'2001:db8::') == 0x20010db8 << 96
+    assert fgaddrtable.ip6_to_int(u'::ffff:10.0.0.1') == (0xffff << 32) | ip(u'10.0.0.1')
+    assert fgaddrtable.ip6_to_int(u'1::2::3') is None
+    assert fgaddrtable.ip6_to_int(u'1:2:3') is None
+
+
+def test_wildcard_ranges():
+    # the free bits below the lowest mask bit make one range, every other one doubles them
+    assert fgaddrtable.wildcard_ranges(ip(u'10.0.0.0'), ip(u'255.255.255.0')) == [(ip(u'10.0.0.0'), ip(u'10.0.0.255'))]
+    assert fgaddrtable.wildcard_ranges(ip(u'10.0.0.1'), ip(u'255.255.254.255')) == [(ip(u'10.0.0.1'), ip(u'10.0.0.1')), (ip(u'10.0.1.1'), ip(u'10.0.1.1'))]
+    assert fgaddrtable.wildcard_ranges(0, 0x55555555) is None
+
+
+def test_address_table():
+    table = fgaddrtable.AddressTable(ADDRESSES)
+
+    assert len(table) == 5
+    assert not(u'v6' in table)
+    assert table.opaque == set([u'web'])
+    assert table.ranges(u'range') == [(ip(u'10.0.0.200'), ip(u'10.0.1.10'))]
+
+    assert table.contains(u'all', u'lan')
+    assert table.contains(u'lan', u'lan-host')
+    assert not(table.contains(u'lan', u'range'))
+    assert not(table.contains(u'all', u'web'))
+    assert table.contains(u'web', u'web')
+
+    assert table.overlaps(u'lan', u'range')
+    assert not(table.overlaps(u'lan-host', u'range'))
+    assert not(table.overlaps(u'lan-host', u'even'))
+
+
+def test_covering():
+    table = fgaddrtable.AddressTable(ADDRESSES)
+
+    assert table.covering(ip(u'10.0.0.5')) == (u'all', u'lan', u'lan-host')
+    assert table.covering(ip(u'10.0.0.200')) == (u'all', u'even', u'lan', u'range')
+    assert table.covering(ip(u'10.0.1.11')) == (u'all',)
+
+    # the index is rebuilt after an addition
+    table.add({u'name': u'other', u'subnet': u'10.0.1.0 255.255.255.0'})
+    assert table.covering(ip(u'10.0.1.11')) == (u'all', u'other')
+
+
+def test_build_tables():
+    tables = fgaddrtable.build_tables(ADDRESSES)
+    table6 = tables[IPV6]
+
+    assert table6.words == 4
+    assert table6.ranges(u'v6') == [(0x20010db8 << 96, (0x20010db8 << 96) | ((1 << 96) - 1))]
+    assert table6.covering(fgaddrtable.ip6_to_int(u'2001:db8::1')) == (u'v6',)
+    assert table6.covering(fgaddrtable.ip6_to_int(u'2001:db9::1')) == ()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+    The four original extractors still write the csv files of the original scripts, byte for byte,
+    on a single-VDOM configuration with nested sub-blocks
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+import sys
+import gzip
+
+import pytest
+
+import fgpoliciestocsv
+import fgaddressestocsv
+import fggroupstocsv
+import fgservicestocsv
+
+from conftest import DATA_DIR, read_text
+
+CONFIG = path.join(DATA_DIR, 'fgfw.cfg')
+
+EXTRACTORS = [
+    ('policies', fgpoliciestocsv),
+    ('addresses', fgaddressestocsv),
+    ('groups', fggroupstocsv),
+    ('services', fgservicestocsv),
+]
+
+
+def export(monkeypatch, extractor, output_file, arguments=(), config_file=CONFIG):
+    """
+        Run the command line of an extractor and return its output
+    """
+    monkeypatch.setattr(sys, 'argv', [extractor.__name__ + '.py', '-i', config_file, '-o', output_file] + list(arguments))
+    extractor.main()
+
+    return read_text(output_file, 'utf-8')
+
+
+@pytest.mark.parametrize('arguments', [['--no-cache'], ['--no-cache', '--stream']])
+@pytest.mark.parametrize('name,extractor', EXTRACTORS)
+def test_baseline_output(monkeypatch, tmp_path, name, extractor, arguments):
+    output = export(monkeypatch, extractor, str(tmp_path / ('%s-out.csv' % name)), arguments)
+
+    assert output == read_text(path.join(DATA_DIR, 'fgfw-%s-out.csv' % name), 'utf-8')
+
+
+@pytest.mark.parametrize('name,extractor', EXTRACTORS)
+def test_baseline_output_compressed(monkeypatch, tmp_path, name, extractor):
+    # a compressed file is not indexed: its lines are all read
+    config_file = str(tmp_path / 'fgfw.cfg.gz')
+    with open(CONFIG, 'rb') as fd_config, gzip.open(config_file, 'wb') as fd_compressed:
+        fd_compressed.write(fd_config.read())
+
+    output = export(monkeypatch, extractor, str(tmp_path / ('%s-out.csv' % name)), ['--no-cache'], config_file)
+
+    assert output == read_text(path.join(DATA_DIR, 'fgfw-%s-out.csv' % name), 'utf-8')
+
+
+def test_baseline_output_cached(monkeypatch, tmp_path):
+    arguments = ['--cache-dir', str(tmp_path / 'cache')]
+    for run in range(2):
+        output = export(monkeypatch, fgpoliciestocsv, str(tmp_path / 'policies-out.csv'), arguments)
+
+        assert output == read_text(path.join(DATA_DIR, 'fgfw-policies-out.csv'), 'utf-8')
+
+
+def test_baseline_output_options(monkeypatch, tmp_path):
+    output = export(monkeypatch, fgpoliciestocsv, str(tmp_path / 'policies-out.csv'), ['--no-cache', '-s', '-n', '-d', ','])
+
+    assert output == read_text(path.join(DATA_DIR, 'fgfw-policies-out-snd.csv'), 'utf-8')
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+import os
+import subprocess
+import sys
+
+import fgdiff
+import fgpoliciestocsv
+
+from conftest import ROOT, DATA_DIR, read_text
+
+KEYS = [u'id', u'action', u'comments']
+
+OLD = [
+    {u'id': u'1', u'action': u'accept'},
+    {u'id': u'2', u'action': u'accept', u'comments': u'old'},
+    {u'id': u'3', u'action': u'deny'},
+    {u'vdom': u'dmz', u'id': u'1', u'action': u'accept'},
+]
+
+NEW = [
+    {u'id': u'1', u'action': u'accept'},
+    {u'id': u'2', u'action': u'deny', u'comments': u'new'},
+    {u'id': u'4', u'action': u'accept'},
+    {u'vdom': u'dmz', u'id': u'1', u'action': u'accept'},
+]
+
+
+def summary(changes):
+    return [(change, keys_changed, (old_record or new_record)[u'id']) for change, keys_changed, old_record, new_record in changes]
+
+
+def test_diff():
+    changes, unchanged = fgdiff.diff(OLD, NEW, KEYS, u'id')
+
+    assert summary(changes) == [(fgdiff.MODIFIED, [u'action', u'comments'], u'2'), (fgdiff.ADDED, [], u'4'), (fgdiff.REMOVED, [], u'3')]
+    assert unchanged == 2
+
+
+def test_diff_ignore_keys():
+    changes, unchanged = fgdiff.diff(OLD, NEW, KEYS, u'id', frozenset([u'comments']))
+
+    assert summary(changes)[0] == (fgdiff.MODIFIED, [u'action'], u'2')
+
+
+def test_diff_duplicate_ids():
+    old = [{u'id': u'1', u'action': u'accept'}, {u'id': u'1', u'action': u'deny'}]
+    new = [{u'id': u'1', u'action': u'accept'}]
+
+    changes, unchanged = fgdiff.diff(old, new, KEYS, u'id')
+
+    assert summary(changes) == [(fgdiff.REMOVED, [], u'1')]
+    assert unchanged == 1
+
+
+def test_generate_csv(tmp_path):
+    output_file = str(tmp_path / 'policies-diff.csv')
+    options, arguments = fgdiff.parser.parse_args(['-o', output_file])
+
+    changes, unchanged = fgdiff.diff(OLD, NEW, KEYS, u'id')
+    fgdiff.generate_csv(changes, KEYS, fgpoliciestocsv, options)
+
+    lines = read_text(output_file).splitlines()
+    assert lines[0] == u'"change";"changed_keys";"id";"action";"comments"'
+    assert lines[1] == u'"modified";"action comments";"2";"accept -> deny";"old -> new"'
+    assert len(lines) == 4
+
+    # without any change, the output of the previous run is replaced by the header only
+    changes, unchanged = fgdiff.diff(NEW, NEW, KEYS, u'id')
+    fgdiff.generate_csv(changes, KEYS, fgpoliciestocsv, options)
+
+    assert read_text(output_file).splitlines() == lines[:1]
+
+
+def test_main(tmp_path):
+    output_file = str(tmp_path / 'policies-diff.csv')
+    config_file = path.join(DATA_DIR, 'fgfw.cfg')
+
+    # the default run goes through the parse cache, kept out of the user cache directory
+    environment = dict(os.environ, XDG_CACHE_HOME=str(tmp_path / 'cache'))
+    for arguments in ([], ['--stats']):
+        process = subprocess.Popen([sys.executable, path.join(ROOT, 'fgdiff.py'), '-a', config_file, '-b', config_file, '-o', output_file] + arguments,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=environment)
+        stdout, stderr = process.communicate()
+
+        assert process.returncode == 0, stderr
+        assert b'0 added, 0 removed, 0 modified, 3 unchanged' in stderr
+
+    assert b'Parse cache: 2 hit(s), 0 miss(es)' in stderr
+    assert len(read_text(output_file).splitlines()) == 1
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import csv
+import io
+
+import pytest
+
+import fgflows
+
+# Policies without interfaces, and a policy without any address
+CONFIG = u'''config firewall address
+    edit "all"
+        set subnet 0.0.0.0 0.0.0.0
+    next
+    edit "net10"
+        set subnet 10.0.0.0 255.0.0.0
+    next
+end
+config firewall service custom
+    edit "HTTP"
+        set tcp-portrange 80
+    next
+    edit "DNS"
+        set udp-portrange 53
+    next
+    edit "PING"
+        set protocol ICMP
+        set icmptype 8
+    next
+end
+config firewall policy
+    edit 1
+        set srcaddr "all"
+        set dstaddr "all"
+        set action accept
+        set service "DNS"
+    next
+    edit 2
+        set srcintf "port1"
+        set dstintf "port2"
+        set action accept
+        set service "HTTP"
+    next
+    edit 3
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "net10"
+        set dstaddr "all"
+        set action deny
+        set service "HTTP"
+    next
+    edit 4
+        set srcaddr "all"
+        set dstaddr "all"
+        set action accept
+        set service "PING"
+    next
+end
+'''
+
+FLOWS = u'''srcip,dstip,proto,dstport,srcintf,dstintf
+10.1.1.1,8.8.8.8,17,53,port1,port2
+192.168.1.1,8.8.8.8,17,53,,
+10.1.1.1,8.8.8.8,6,80,port1,port2
+10.1.1.1,8.8.8.8,6,80,port3,port2
+10.1.1.1,8.8.8.8,6,443,port1,port2
+not-an-ip,8.8.8.8,6,80,port1,port2
+10.1.1.1,8.8.8.8,icmp,,port1,port2
+'''
+
+EXPECTED = [('1', 'accept'), ('1', 'accept'), ('3', 'deny'), ('0', 'deny'), ('0', 'deny'), ('', ''), ('4', 'accept')]
+
+
+def evaluate(write_config, tmp_path, use_numpy):
+    flow_file = write_config(FLOWS, 'flows.csv')
+    output_file = str(tmp_path / 'flows-out.csv')
+    options, arguments = fgflows.parser.parse_args(['-i', write_config(CONFIG), '-l', flow_file, '-o', output_file, '--no-cache'])
+
+    rules, interface_codes, address_resolvers = fgflows.load_rules(options)
+    count, invalid = fgflows.generate_csv(rules, interface_codes, options, use_numpy)
+
+    with io.open(output_file, 'r', encoding='utf-8-sig', newline='') as fd_output:
+        rows = list(csv.reader(fd_output, delimiter=';'))
+
+    assert (count, invalid) == (7, 1)
+    assert rows[0][-2:] == fgflows.RESULT_KEYS
+
+    return [tuple(row[-2:]) for row in rows[1:]]
+
+
+def test_evaluate_python(write_config, tmp_path):
+    assert evaluate(write_config, tmp_path, False) == EXPECTED
+
+
+def test_evaluate_numpy(write_config, tmp_path):
+    pytest.importorskip('numpy')
+    assert evaluate(write_config, tmp_path, True) == EXPECTED
+
+
+def test_interface_table_without_codes():
+    pytest.importorskip('numpy')
+    table = fgflows.interface_table(frozenset())
+    assert table[fgflows.ANY_INTERFACE - fgflows.UNKNOWN_INTERFACE]
+    assert not(table[fgflows.UNKNOWN_INTERFACE - fgflows.UNKNOWN_INTERFACE])
+
+
+def test_flow_columns_missing():
+    with pytest.raises(ValueError):
+        fgflows.flow_columns(['srcip', 'dstport'])
+
+
+def test_check_flow_file(write_config, tmp_path):
+    options, arguments = fgflows.parser.parse_args(['-i', write_config(CONFIG), '-l', write_config(u'srcip,dstport\n10.1.1.1,80\n', 'flows.csv'), '-o', str(tmp_path / 'flows-out.csv')])
+
+    with pytest.raises(ValueError):
+        fgflows.check_flow_file(options)
+
+    assert not((tmp_path / 'flows-out.csv').exists())
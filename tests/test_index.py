@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+
+import fgindex
+import fgpoliciestocsv
+
+# Two VDOMs, the second policy holding a nested sub-block
+CONFIG = u'''config vdom
+edit root
+config firewall policy
+    edit 1
+        set srcintf "port1"
+        set action accept
+    next
+    edit 2
+        set srcintf "port2"
+        config sub
+            edit 1
+            next
+        end
+    next
+end
+next
+edit dmz
+config firewall policy
+    edit 3
+        set action deny
+    next
+end
+next
+end
+'''
+
+
+def mixed_case(text):
+    """
+        Write the keywords of a configuration the way some exports do
+    """
+    return text.replace(u'config ', u'CONFIG ').replace(u'end\n', u'End\n').replace(u'edit ', u'EDIT ')
+
+
+def parse_config(config_file):
+    options, arguments = fgpoliciestocsv.parser.parse_args(['-i', config_file, '--no-cache'])
+    return fgpoliciestocsv.parse(options)
+
+
+def test_build_index_lowercase():
+    buf = CONFIG.encode('utf-8')
+    blocks = fgindex.build_index(buf)
+
+    assert [(block.vdom, block.name) for block in blocks] == [(u'root', u'firewall policy'), (u'dmz', u'firewall policy')]
+    assert len(fgindex.entry_ranges(buf, blocks[0])) == 2
+
+
+def test_build_index_mixed_case():
+    lowercase_buf = CONFIG.encode('utf-8')
+    lowercase_blocks = fgindex.build_index(lowercase_buf)
+    buf = mixed_case(CONFIG).encode('utf-8')
+    blocks = fgindex.build_index(buf)
+
+    assert blocks == lowercase_blocks
+    assert fgindex.entry_ranges(buf, blocks[0]) == fgindex.entry_ranges(lowercase_buf, lowercase_blocks[0])
+    assert fgindex.split_block(buf, blocks[0], 4) == fgindex.split_block(lowercase_buf, lowercase_blocks[0], 4)
+
+
+def test_parse_mixed_case(write_config):
+    lowercase = parse_config(write_config(CONFIG, 'lower.cfg'))
+    uppercase = parse_config(write_config(mixed_case(CONFIG), 'upper.cfg'))
+
+    assert len(lowercase[0]) == 3
+    assert [list(record.items()) for record in uppercase[0]] == [list(record.items()) for record in lowercase[0]]
+    assert uppercase[1] == lowercase[1]
+
+
+def test_split_lines():
+    assert fgindex.split_lines(u'a\r\nb\rc\x0cd\u2028e\x85f\n') == [u'a\n', u'b\n', u'c\x0cd\u2028e\x85f\n']
+    assert fgindex.split_lines(u'') == []
+
+
+def test_iter_block_lines_separators(write_config, monkeypatch):
+    config_file = write_config(CONFIG.replace(u'set action accept', u'set comments "a\x0cb\u2028c\x1cd"\n        set action accept'))
+    blocks = fgindex.load_index(config_file)
+
+    # slices cutting the lines anywhere
+    monkeypatch.setattr(fgindex, 'CHUNK_SIZE', 7)
+    lines = list(fgindex.iter_block_lines(config_file, blocks, 'utf-8'))
+
+    assert u'        set comments "a\x0cb\u2028c\x1cd"\n' in lines
+    assert all(line.endswith(u'\n') for line in lines)
+    assert u''.join(lines).count(u'\n') == len(lines)
+
+
+def test_parse_separators(write_config):
+    config = CONFIG.replace(u'set action accept', u'set comments "a\x0cb\u2028c"\n        set action accept')
+    config_file = write_config(config)
+    results, keys = parse_config(config_file)
+
+    assert results[0][u'comments'] == u'a\x0cb\u2028c'
+    assert results[0][u'action'] == u'accept'
+
+    # the same file read line by line, as a compressed file or the standard input are
+    compressed_file = config_file + '.gz'
+    with open(config_file, 'rb') as fd_config, gzip.open(compressed_file, 'wb') as fd_compressed:
+        fd_compressed.write(fd_config.read())
+
+    compressed_results, compressed_keys = parse_config(compressed_file)
+    assert [dict(record.items()) for record in compressed_results] == [dict(record.items()) for record in results]
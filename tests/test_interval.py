@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+
+import fginterval
+
+# Overlapping, nested, adjacent and single point intervals
+INTERVALS = [(0, 9, 'a'), (5, 14, 'b'), (10, 12, 'c'), (15, 15, 'd'), (20, 29, 'a'), (6, 7, 'e')]
+
+
+def brute_force(intervals, point):
+    return set(value for first, last, value in intervals if first <= point <= last)
+
+
+def test_merge_intervals():
+    assert fginterval.merge_intervals([(10, 12), (0, 3), (4, 5), (2, 8), (14, 14)]) == [(0, 8), (10, 12), (14, 14)]
+    assert fginterval.merge_intervals([]) == []
+
+
+def test_covers():
+    outer = [(0, 8), (10, 12)]
+
+    assert fginterval.covers(outer, [(1, 2), (10, 12)])
+    assert not(fginterval.covers(outer, [(8, 10)]))
+    assert not(fginterval.covers(outer, [(13, 13)]))
+    assert fginterval.covers(outer, [])
+    assert not(fginterval.covers([], [(0, 0)]))
+
+
+def test_interval_index():
+    index = fginterval.IntervalIndex(INTERVALS)
+
+    for point in range(-1, 32):
+        assert set(index.lookup(point)) == brute_force(INTERVALS, point)
+
+    # the values come sorted, the same tuple being shared by the segments of identical content
+    assert index.lookup(6) == ('a', 'b', 'e')
+    assert index.lookup(0) is index.lookup(20)
+
+
+def test_segment_tree():
+    tree = fginterval.SegmentTree(INTERVALS)
+
+    for point in range(-1, 32):
+        found = set()
+        for values in tree.stab(point):
+            found.update(values)
+        assert found == brute_force(INTERVALS, point)
+
+    assert fginterval.SegmentTree([]).stab(0) == []
+
+
+def test_random_intervals():
+    generator = random.Random(4)
+    intervals = []
+    for value in range(200):
+        first = generator.randint(0, 1000)
+        intervals.append((first, first + generator.randint(0, 50), value))
+
+    index = fginterval.IntervalIndex(intervals)
+    tree = fginterval.SegmentTree(intervals)
+    for point in range(0, 1060, 7):
+        expected = brute_force(intervals, point)
+        assert set(index.lookup(point)) == expected
+        assert set(value for values in tree.stab(point) for value in values) == expected
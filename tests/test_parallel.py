@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import fgcommon
+import fgpoliciestocsv
+
+# Policies whose comments hold a form feed and a Unicode line separator, which are not line breaks
+CONFIG = u'config firewall policy\n' + u''.join(u'''    edit %d
+        set comments "a\\x0cb\\u2028c"
+        set action accept
+    next
+''' % position for position in range(1, 41)) + u'end\n'
+
+
+def parse_config(config_file, jobs):
+    options, arguments = fgpoliciestocsv.parser.parse_args(['-i', config_file, '--no-cache', '-j', str(jobs)])
+    results, keys = fgcommon.parse_parallel(fgpoliciestocsv, options)
+
+    return ([dict(record.items()) for record in results], keys)
+
+
+def test_parse_parallel(write_config, monkeypatch):
+    config_file = write_config(CONFIG.encode('ascii').decode('unicode_escape'))
+
+    # chunks of a few entries each
+    monkeypatch.setattr(fgcommon, 'MIN_CHUNK_SIZE', 256)
+
+    sequential = parse_config(config_file, 1)
+    assert len(sequential[0]) == 40
+    assert sequential[0][0][u'comments'] == u'a\x0cb\u2028c'
+
+    assert parse_config(config_file, 2) == sequential
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import fgports
+
+SERVICES = [
+    (u'HTTP', {u'tcp-portrange': u'80'}),
+    (u'WEB', {u'tcp-portrange': u'80 443 8000-8080'}),
+    (u'DNS', {u'tcp-portrange': u'53', u'udp-portrange': u'53'}),
+    (u'HIGH', {u'tcp-portrange': u'8080:1024-65535'}),
+    (u'ALL', {u'protocol': u'IP'}),
+    (u'UDP-ANY', {u'protocol': u'IP', u'protocol-number': u'17'}),
+    (u'PING', {u'protocol': u'ICMP', u'icmptype': u'8'}),
+    (u'BAD', {u'tcp-portrange': u'abc'}),
+]
+
+
+def test_port_interval():
+    assert fgports.port_interval(u'80') == (80, 80)
+    assert fgports.port_interval(u'2000-1000') == (1000, 2000)
+    assert fgports.port_interval(u'1-2-3') is None
+    assert fgports.port_interval(u'http') is None
+
+
+def test_parse_query():
+    assert fgports.parse_query(u'443') == ('tcp', 443, None)
+    assert fgports.parse_query(u'UDP/53') == ('udp', 53, None)
+    assert fgports.parse_query(u'tcp/80:1024') == ('tcp', 80, 1024)
+    assert fgports.parse_query(u'icmp/8') is None
+    assert fgports.parse_query(u'tcp/65536') is None
+
+
+def test_parse_portrange():
+    intervals, opaque = fgports.parse_portrange('udp', u'53 1000-2000:53 x')
+
+    assert intervals == [(fgports.PORT_SPAN + 53, fgports.PORT_SPAN + 53)]
+    assert opaque == set([('udp', u'1000-2000:53'), ('udp', u'x')])
+
+
+def test_port_index():
+    index = fgports.PortIndex(SERVICES)
+
+    assert index.lookup('tcp', 80) == (u'ALL', u'HTTP', u'WEB')
+    assert index.lookup('tcp', 8080) == (u'ALL', u'HIGH', u'WEB')
+    assert index.lookup('tcp', 8081) == (u'ALL',)
+    assert index.lookup('udp', 53) == (u'ALL', u'DNS', u'UDP-ANY')
+    assert index.lookup('sctp', 53) == (u'ALL',)
+
+
+def test_port_index_source():
+    index = fgports.PortIndex(SERVICES)
+
+    # HIGH only allows the source ports 1024 to 65535
+    assert index.lookup('tcp', 8080, 1024) == (u'ALL', u'HIGH', u'WEB')
+    assert index.lookup('tcp', 8080, 1023) == (u'ALL', u'WEB')
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import fgshadow
+
+# Policies without interfaces, and a policy without source address, in two VDOMs
+CONFIG = u'''config vdom
+edit root
+config firewall address
+    edit "all"
+        set subnet 0.0.0.0 0.0.0.0
+    next
+    edit "net10"
+        set subnet 10.0.0.0 255.0.0.0
+    next
+end
+config firewall service custom
+    edit "HTTP"
+        set tcp-portrange 80
+    next
+end
+config firewall policy
+    edit 1
+        set srcaddr "net10"
+        set dstaddr "all"
+        set action accept
+        set service "HTTP"
+    next
+    edit 2
+        set srcaddr "net10"
+        set dstaddr "all"
+        set action deny
+        set service "HTTP"
+    next
+    edit 3
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "net10"
+        set dstaddr "all"
+        set action accept
+        set service "HTTP"
+    next
+    edit 4
+        set srcintf "port1"
+        set dstintf "port2"
+        set dstaddr "all"
+        set action accept
+        set service "HTTP"
+    next
+end
+next
+edit dmz
+config firewall policy
+    edit 1
+        set action accept
+    next
+    edit 2
+        set action accept
+    next
+end
+next
+end
+'''
+
+
+def analyze_config(config_file):
+    options, arguments = fgshadow.parser.parse_args(['-i', config_file, '--no-cache'])
+    count, rules, address_resolvers = fgshadow.load_rules(options)
+
+    findings = {}
+    for vdom, vdom_rules in rules.items():
+        for kind, rule, covering in fgshadow.analyze(vdom_rules)[0]:
+            findings[(vdom, rule.record['id'])] = (kind, covering.record['id'])
+
+    return findings
+
+
+def test_interfaces_empty_and_any():
+    assert fgshadow.interfaces('') is None
+    assert fgshadow.interfaces('port1 port2') == frozenset(['port1', 'port2'])
+    assert fgshadow.interfaces('any') is None
+
+
+def test_analyze_without_interfaces_nor_addresses(write_config):
+    findings = analyze_config(write_config(CONFIG))
+
+    assert findings == {
+        ('root', '2'): (fgshadow.SHADOWED, '1'),
+        # a policy without interfaces matches any of them, as in fgflows.py
+        ('root', '3'): (fgshadow.REDUNDANT, '1'),
+        ('root', '4'): (fgshadow.REDUNDANT, '1'),
+        ('dmz', '2'): (fgshadow.REDUNDANT, '1'),
+    }
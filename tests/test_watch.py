@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from os import path
+import io
+
+import fgwatch
+import fgalltocsv
+
+from conftest import DATA_DIR, read_text
+
+with io.open(path.join(DATA_DIR, 'fgfw.cfg'), 'r', encoding='utf-8') as fd_config:
+    CONFIG = fd_config.read()
+
+
+def full_parse(config_file):
+    """
+        Return the (records, keys) of every extractor parsed from scratch
+    """
+    options, arguments = fgalltocsv.parser.parse_args(['-i', config_file, '--no-cache'])
+    outputs = fgalltocsv.parse(options, fgalltocsv.EXTRACTORS)
+
+    return dict((name, ([dict(record.items()) for record in results], keys)) for name, (results, keys) in outputs.items())
+
+
+def watched_output(watched, name):
+    records, keys = watched.output(name)
+
+    return ([dict(record.items()) for record in records], keys)
+
+
+def check_outputs(watched, config_file):
+    expected = full_parse(config_file)
+    for name in fgalltocsv.EXTRACTORS:
+        assert watched_output(watched, name) == expected[name]
+
+
+def test_update(write_config):
+    config_file = write_config(CONFIG)
+    watched = fgwatch.WatchedConfig(config_file, 'utf-8', fgalltocsv.EXTRACTORS)
+
+    assert watched.update() == list(fgalltocsv.EXTRACTORS)
+    assert watched.parsed_entries == watched.total_entries
+    check_outputs(watched, config_file)
+
+    # the same content again
+    assert watched.update() == []
+    assert watched.parsed_blocks == 0
+
+
+def test_update_changed_entry(write_config):
+    config_file = write_config(CONFIG)
+    watched = fgwatch.WatchedConfig(config_file, 'utf-8', fgalltocsv.EXTRACTORS)
+    watched.update()
+
+    write_config(CONFIG.replace(u'set name "out"', u'set name "outbound"'))
+
+    assert watched.update() == ['policies']
+    assert (watched.parsed_blocks, watched.parsed_entries) == (1, 1)
+    check_outputs(watched, config_file)
+
+
+def test_update_added_and_removed_blocks(write_config):
+    config_file = write_config(CONFIG)
+    watched = fgwatch.WatchedConfig(config_file, 'utf-8', fgalltocsv.EXTRACTORS)
+    watched.update()
+
+    start = CONFIG.index(u'config firewall service group')
+    end = CONFIG.index(u'end\n', start) + len(u'end\n')
+    write_config(CONFIG[:start] + CONFIG[end:] + u'config firewall addrgrp\n    edit "extra"\n        set member "all"\n    next\nend\n')
+
+    assert watched.update() == ['groups', 'services']
+    assert watched.parsed_entries == 1
+    check_outputs(watched, config_file)
+
+
+def test_process(write_config, tmp_path):
+    config_file = write_config(CONFIG)
+    options, arguments = fgwatch.parser.parse_args(['-i', config_file, '-o', str(tmp_path), '-x', 'policies,groups'])
+    watched = fgwatch.WatchedConfig(config_file, 'utf-8', fgalltocsv.select_extractors(options.extract))
+
+    assert fgwatch.process(watched, options) == ['policies-out.csv', 'groups-out.csv']
+    assert read_text(str(tmp_path / 'policies-out.csv'), 'utf-8') == read_text(path.join(DATA_DIR, 'fgfw-policies-out.csv'), 'utf-8')
+
+    # every group gone, its output is removed
+    start = CONFIG.index(u'config firewall addrgrp')
+    end = CONFIG.index(u'end\n', start) + len(u'end\n')
+    write_config(CONFIG[:start] + CONFIG[end:])
+
+    assert fgwatch.process(watched, options) == ['groups-out.csv']
+    assert not(path.exists(str(tmp_path / 'groups-out.csv')))
+
+
+def test_update_line_separators(write_config):
+    # a form feed and a Unicode line separator are not line breaks
+    config = CONFIG.replace(u'set name "out"', u'set name "out"\n        set comments "a\x0cb\u2028c"')
+    config_file = write_config(config)
+    watched = fgwatch.WatchedConfig(config_file, 'utf-8', fgalltocsv.EXTRACTORS)
+    watched.update()
+
+    check_outputs(watched, config_file)
+    assert watched_output(watched, 'policies')[0][0][u'comments'] == u'a\x0cb\u2028c'
+
+    write_config(config.replace(u'set name "out"', u'set name "outbound"'))
+
+    assert watched.update() == ['policies']
+    check_outputs(watched, config_file)